@@ -0,0 +1,586 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: AppConfig.py
+#
+# Description:
+# Typed, cached configuration for all programs. gate_check.ini and
+# online_check.ini are each parsed once into validated objects; hot paths read
+# the cached object and never touch the file.
+#
+# Design Philosophy:
+# - One ConfigWatcher per file (see `gate_check_config()` / `online_check_config()`).
+#   `current` is the last successfully parsed configuration.
+# - Hot reload: `watch()` checks the file mtime periodically. A changed file is
+#   parsed into a complete new object which then replaces the old one in a single
+#   assignment, so readers never see a half-applied configuration. A file that
+#   fails validation is logged and the previous configuration stays in effect;
+#   it is parsed again on every check until it is valid (a save may have been
+#   caught half-written).
+# - Listeners registered with `add_listener()` are called after every reload so
+#   running monitors can pick up new timeouts and battery limits.
+#
+# Public API:
+# - class ConfigError(Exception)
+# - classes TelegramConfig, HAConfig, MqttConfig, MetricsConfig, GateDefinition,
+#   DeviceSpec, GateCheckConfig, OnlineCheckConfig
+#   - GateDefinition.text(kind, **values): alert, "Wait" button and battery
+#     texts of a gate (DEFAULT_GATE_MESSAGES); the legacy big/small gates keep
+#     the wording of the original GateCheck.py / GateCheckSmall.py
+# - class ConfigWatcher(path, parse)
+#   - current, reload_if_changed(force=False) -> bool, add_listener(callback), async watch(interval)
+# - def gate_check_config(path='gate_check.ini') -> ConfigWatcher
+# - def online_check_config(path='online_check.ini') -> ConfigWatcher
+# - def load_gate_definitions(path='gate_check.ini', gate_names=None) -> list[GateDefinition]
+#   (in the legacy format a gate's [Time-outs] keys are only required when
+#   that gate is requested)
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import configparser
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GATE_CHECK_INI = 'gate_check.ini'
+ONLINE_CHECK_INI = 'online_check.ini'
+CONFIG_WATCH_INTERVAL = 5  # Период проверки mtime конфигурационных файлов (сек)
+
+
+class ConfigError(Exception):
+    pass
+
+
+def _clean(value):
+    return value.strip().strip('"') if value is not None else None
+
+
+# --- ТИПИЗИРОВАННЫЕ СЕКЦИИ ---
+
+class TelegramConfig:
+    """Секция [Telegram ID]"""
+
+    def __init__(self, token, chat_id, api_url=None, webhook_url=None, webhook_listen='0.0.0.0',
+                 webhook_port=8443, webhook_secret=None, webhook_cert=None, webhook_key=None):
+        self.token = token
+        self.chat_id = chat_id
+        # Адрес Bot API (локальный Bot API сервер или имитация из FakeServices.py)
+        self.api_url = api_url
+        # Режим веб-хука: Telegram присылает нажатия кнопок на webhook_url вместо getUpdates
+        self.webhook_url = webhook_url
+        self.webhook_listen = webhook_listen
+        self.webhook_port = webhook_port
+        self.webhook_secret = webhook_secret
+        # Сертификат и ключ для HTTPS без обратного прокси (самоподписанный сертификат загружается в Telegram)
+        self.webhook_cert = webhook_cert
+        self.webhook_key = webhook_key
+
+
+class HAConfig:
+    """Секция [HA]"""
+
+    def __init__(self, ip, token, websocket=False, big_gate_entity=None, small_gate_entity=None):
+        self.ip = ip
+        self.token = token
+        self.websocket = websocket
+        self.big_gate_entity = big_gate_entity
+        self.small_gate_entity = small_gate_entity
+
+    def __repr__(self):
+        return (f"HAConfig(ip={self.ip!r}, token={'***' if self.token else None}, websocket={self.websocket}, "
+                f"big_gate_entity={self.big_gate_entity!r}, small_gate_entity={self.small_gate_entity!r})")
+
+
+class MqttConfig:
+    """Секция [MQTT]"""
+
+    def __init__(self, host, port=1883, username=None, password=None, big_gate_topic=None, small_gate_topic=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.big_gate_topic = big_gate_topic
+        self.small_gate_topic = small_gate_topic
+
+
+class MetricsConfig:
+    """Секция [Metrics]: экспорт метрик программ мониторинга ворот"""
+
+    def __init__(self, host='0.0.0.0', port=None, textfile=None, textfile_interval=15):
+        self.host = host
+        self.port = port
+        self.textfile = textfile
+        self.textfile_interval = textfile_interval
+
+
+# Тексты сообщений ворот (str.format: title, Title - с заглавной, time_to_close, battery, limit, delay).
+# Ворота старого формата сохраняют формулировки GateCheck.py / GateCheckSmall.py
+DEFAULT_GATE_MESSAGES = {
+    'alert': "The {title} has been open for {time_to_close} seconds!\nThe battery level is {battery}%.",
+    'wait_button': "Wait {delay} minutes",
+    'battery_low': "Attention! {Title} sensor battery is less than {limit}%",
+    'battery_critical': "Attention! Critical battery state of the {title} door sensor: {battery}%",
+}
+
+
+class GateDefinition:
+    """Параметры одних ворот"""
+
+    def __init__(self, name, title, entity, relay_ip=None, time_polling=180, time_to_close=120,
+                 delays=(), battery_limit_1=15, battery_limit_2=5, prompt_timeout=120,
+                 default_action='close', mqtt_topic=None, messages=None):
+        self.name = name
+        self.title = title
+        self.entity = entity
+        self.relay_ip = relay_ip
+        self.time_polling = time_polling
+        self.time_to_close = time_to_close
+        self.delays = list(delays)
+        self.battery_limit_1 = battery_limit_1
+        self.battery_limit_2 = battery_limit_2
+        self.prompt_timeout = prompt_timeout
+        self.default_action = default_action
+        self.mqtt_topic = mqtt_topic
+        self.messages = dict(DEFAULT_GATE_MESSAGES, **(messages or {}))
+
+    def text(self, kind: str, **values) -> str:
+        """Текст сообщения kind (см. DEFAULT_GATE_MESSAGES) для этих ворот"""
+        return self.messages[kind].format(title=self.title, Title=self.title.capitalize(),
+                                          time_to_close=self.time_to_close, **values)
+
+    def __repr__(self):
+        return (f"GateDefinition(name={self.name!r}, entity={self.entity!r}, relay_ip={self.relay_ip!r}, "
+                f"time_polling={self.time_polling}, time_to_close={self.time_to_close}, delays={self.delays}, "
+                f"battery_limits=({self.battery_limit_1}, {self.battery_limit_2}), "
+                f"prompt_timeout={self.prompt_timeout}, default_action={self.default_action!r}, "
+                f"mqtt_topic={self.mqtt_topic!r})")
+
+    def key(self) -> Tuple:
+        # Все поля: перезагрузка конфигурации сравнивает определения по этому ключу
+        return (self.name, self.title, self.entity, self.relay_ip, self.time_polling, self.time_to_close,
+                tuple(self.delays), self.battery_limit_1, self.battery_limit_2, self.prompt_timeout,
+                self.default_action, self.mqtt_topic, tuple(sorted(self.messages.items())))
+
+    def __eq__(self, other):
+        return isinstance(other, GateDefinition) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+
+class DeviceSpec:
+    """Описание устройства из [Computers] / [Sensors] online_check.ini"""
+
+    def __init__(self, name, address, device_type, online_interval, offline_interval,
+                 sec_after_open=None, sec_after_close=None, attempts_after_close=None):
+        self.name = name
+        self.address = address
+        self.device_type = device_type
+        self.online_interval = online_interval
+        self.offline_interval = offline_interval
+        self.sec_after_open = sec_after_open
+        self.sec_after_close = sec_after_close
+        self.attempts_after_close = attempts_after_close
+
+    def key(self) -> Tuple:
+        return (self.name, self.address, self.device_type.upper(), self.online_interval, self.offline_interval,
+                self.sec_after_open, self.sec_after_close, self.attempts_after_close)
+
+    def __eq__(self, other):
+        return isinstance(other, DeviceSpec) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"DeviceSpec{self.key()}"
+
+
+class GateCheckConfig:
+    """Разобранный gate_check.ini"""
+
+    def __init__(self, telegram, ha, mqtt, gates, battery_limit_1, battery_limit_2, metrics=None,
+                 gate_errors=None):
+        self.telegram: Optional[TelegramConfig] = telegram
+        self.ha: Optional[HAConfig] = ha
+        self.mqtt: Optional[MqttConfig] = mqtt
+        self.gates: List[GateDefinition] = gates
+        self.battery_limit_1 = battery_limit_1
+        self.battery_limit_2 = battery_limit_2
+        self.metrics: Optional[MetricsConfig] = metrics
+        # Ворота старого формата, которые нельзя построить: имя -> ошибка
+        self.gate_errors: Dict[str, str] = gate_errors or {}
+
+
+class OnlineCheckConfig:
+    """Разобранный online_check.ini"""
+
+    def __init__(self, telegram, ha, mqtt, devices, gate_ip):
+        self.telegram: Optional[TelegramConfig] = telegram
+        self.ha: HAConfig = ha
+        self.mqtt: Optional[MqttConfig] = mqtt
+        self.devices: List[DeviceSpec] = devices
+        self.gate_ip: Optional[str] = gate_ip
+
+
+# --- РАЗБОР СЕКЦИЙ ---
+
+def _read(path, preserve_case=False) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    if preserve_case:
+        config.optionxform = str
+    try:
+        if not config.read(path):
+            raise ConfigError(f"Config file {path} not found")
+    except configparser.Error as e:
+        raise ConfigError(f"Cannot parse {path}: {e}")
+    return config
+
+
+def _section(config, name) -> Dict[str, str]:
+    """Опции секции с ключами в нижнем регистре (независимо от optionxform)"""
+    if not config.has_section(name):
+        return {}
+    return {key.lower(): value for key, value in config.items(name)}
+
+
+def _parse_telegram(config) -> Optional[TelegramConfig]:
+    section = _section(config, 'Telegram ID')
+    if not section:
+        return None
+    if 'token' not in section or 'chat_id' not in section:
+        raise ConfigError("[Telegram ID] requires TOKEN and chat_id")
+    webhook_cert = _clean(section.get('webhook_cert')) or None
+    webhook_key = _clean(section.get('webhook_key')) or None
+    if bool(webhook_cert) != bool(webhook_key):
+        raise ConfigError("[Telegram ID] webhook_cert and webhook_key must be set together")
+    try:
+        webhook_port = int(_clean(section.get('webhook_port')) or 8443)
+    except ValueError as e:
+        raise ConfigError(f"[Telegram ID] invalid webhook_port: {e}")
+    return TelegramConfig(_clean(section['token']), _clean(section['chat_id']),
+                          api_url=_clean(section.get('api_url')) or None,
+                          webhook_url=_clean(section.get('webhook_url')) or None,
+                          webhook_listen=_clean(section.get('webhook_listen')) or '0.0.0.0',
+                          webhook_port=webhook_port,
+                          webhook_secret=_clean(section.get('webhook_secret')) or None,
+                          webhook_cert=webhook_cert, webhook_key=webhook_key)
+
+
+def _parse_ha(config) -> Optional[HAConfig]:
+    section = _section(config, 'HA')
+    if not section:
+        return None
+    websocket = section.get('ha_websocket', 'false').strip().lower()
+    if websocket not in configparser.ConfigParser.BOOLEAN_STATES:
+        raise ConfigError(f"[HA] ha_websocket must be a boolean, got {websocket!r}")
+    return HAConfig(
+        ip=_clean(section.get('ha_ip')) or None,
+        token=_clean(section.get('ha_token')) or None,
+        websocket=configparser.ConfigParser.BOOLEAN_STATES[websocket],
+        big_gate_entity=_clean(section.get('big_gate_opening_entity')) or None,
+        small_gate_entity=_clean(section.get('small_gate_opening_entity')) or None,
+    )
+
+
+def _parse_mqtt(config) -> Optional[MqttConfig]:
+    section = _section(config, 'MQTT')
+    host = _clean(section.get('host'))
+    if not host:
+        return None
+    try:
+        port = int(section.get('port', 1883))
+    except ValueError:
+        raise ConfigError(f"[MQTT] port must be an integer, got {section.get('port')!r}")
+    return MqttConfig(
+        host=host, port=port,
+        username=_clean(section.get('username')) or None,
+        password=_clean(section.get('password')) or None,
+        big_gate_topic=_clean(section.get('big_gate_topic')) or None,
+        small_gate_topic=_clean(section.get('small_gate_topic')) or None,
+    )
+
+
+def _parse_metrics(config) -> Optional[MetricsConfig]:
+    section = _section(config, 'Metrics')
+    port = _clean(section.get('port'))
+    textfile = _clean(section.get('textfile'))
+    if not port and not textfile:
+        return None
+    try:
+        return MetricsConfig(
+            host=_clean(section.get('host')) or '0.0.0.0',
+            port=int(port) if port else None,
+            textfile=textfile or None,
+            textfile_interval=float(section.get('textfile_interval', 15)),
+        )
+    except ValueError as e:
+        raise ConfigError(f"[Metrics] invalid value: {e}")
+
+
+def _legacy_gate_definitions(config, ha, mqtt, battery_limit_1, battery_limit_2, gate_errors: Dict[str, str]
+                             ) -> List[GateDefinition]:
+    """
+    Ворота из старого формата gate_check.ini (GateCheck.py / GateCheckSmall.py).
+    Ключи [Time-outs] каждых ворот нужны, только если эти ворота запускаются:
+    ошибка записывается в gate_errors и сообщается при запросе ворот (load_gate_definitions).
+    """
+    gates = []
+    timeouts = config['Time-outs'] if config.has_section('Time-outs') else {}
+
+    def legacy_gate(name, build):
+        try:
+            gates.append(build())
+        except KeyError as e:
+            gate_errors[name] = f"Missing required configuration key for the {name} gate: {e}"
+        except ValueError as e:
+            gate_errors[name] = f"Invalid configuration value for the {name} gate: {e}"
+
+    if ha is not None and ha.big_gate_entity:
+        legacy_gate('big', lambda: GateDefinition(
+            name='big', title='big gate',
+            entity=ha.big_gate_entity,
+            relay_ip=_clean(config.get('Device ID', 'ip_gate', fallback=None)),
+            time_polling=int(timeouts['time_polling']),
+            time_to_close=int(timeouts['time_to_close']),
+            delays=[int(timeouts[f'delay_{i}']) for i in range(1, 4)],
+            battery_limit_1=battery_limit_1, battery_limit_2=battery_limit_2,
+            prompt_timeout=120, default_action='close',
+            mqtt_topic=mqtt.big_gate_topic if mqtt else None,
+            messages={'alert': "The {title} has been open for {time_to_close} seconds!"},
+        ))
+    if ha is not None and ha.small_gate_entity:
+        legacy_gate('small', lambda: GateDefinition(
+            name='small', title='small gate',
+            entity=ha.small_gate_entity,
+            time_polling=int(timeouts['time_polling_small']),
+            time_to_close=int(timeouts['time_to_close_small']),
+            delays=[int(timeouts[f'delay_{i}_small']) for i in range(1, 5)],
+            battery_limit_1=battery_limit_1, battery_limit_2=battery_limit_2,
+            prompt_timeout=300, default_action='continue',
+            mqtt_topic=mqtt.small_gate_topic if mqtt else None,
+            messages={
+                'alert': "The {title} has been open for {time_to_close} seconds.\nThe battery level is {battery}%.",
+                'wait_button': "Wait for {delay} minutes",
+                'battery_low': "Small gate sensor battery level is less than {battery}%.",
+                'battery_critical': "Small gate sensor battery level is less than {battery}%.",
+            },
+        ))
+    return gates
+
+
+def _parse_gates(config, ha, mqtt, battery_limit_1, battery_limit_2, gate_errors: Dict[str, str]
+                 ) -> List[GateDefinition]:
+    gates = []
+    for section in config.sections():
+        if not section.startswith('Gate '):
+            continue
+        options = config[section]
+        default_action = options.get('default_action', 'close' if options.get('relay_ip') else 'continue').strip()
+        if default_action not in ('close', 'continue'):
+            raise ConfigError(f"[{section}] default_action must be 'close' or 'continue'")
+        name = section[len('Gate '):].strip()
+        gates.append(GateDefinition(
+            name=name,
+            title=options.get('title', f"{name} gate").strip(),
+            entity=_clean(options['entity']),
+            relay_ip=_clean(options.get('relay_ip')) or None,
+            time_polling=options.getint('time_polling', 180),
+            time_to_close=options.getint('time_to_close', 120),
+            delays=[int(d) for d in options.get('delays', '').replace(',', ' ').split()],
+            battery_limit_1=options.getint('battery_limit_1', battery_limit_1),
+            battery_limit_2=options.getint('battery_limit_2', battery_limit_2),
+            prompt_timeout=options.getint('prompt_timeout', 120),
+            default_action=default_action,
+            mqtt_topic=_clean(options.get('mqtt_topic')) or None,
+        ))
+    if not gates:
+        gates = _legacy_gate_definitions(config, ha, mqtt, battery_limit_1, battery_limit_2, gate_errors)
+    return gates
+
+
+def parse_gate_check(path) -> GateCheckConfig:
+    """Читает и проверяет gate_check.ini"""
+    config = _read(path)
+    try:
+        battery_limit_1 = config.getint('Battery limits', 'battery_limit_1', fallback=15)
+        battery_limit_2 = config.getint('Battery limits', 'battery_limit_2', fallback=5)
+        ha = _parse_ha(config)
+        mqtt = _parse_mqtt(config)
+        gate_errors = {}
+        gates = _parse_gates(config, ha, mqtt, battery_limit_1, battery_limit_2, gate_errors)
+        return GateCheckConfig(_parse_telegram(config), ha, mqtt, gates, battery_limit_1, battery_limit_2,
+                               _parse_metrics(config), gate_errors)
+    except KeyError as e:
+        raise ConfigError(f"Missing required configuration key: {e}")
+    except ValueError as e:
+        raise ConfigError(f"Invalid configuration value: {e}")
+
+
+def _parse_devices(config) -> List[DeviceSpec]:
+    devices = []
+    if config.has_section('Computers'):
+        for name, value in config['Computers'].items():
+            parts = value.split()
+            if len(parts) < 4:
+                raise ConfigError(f"[Computers] {name}: expected '<address> <type> <online_interval> <offline_interval>'")
+            devices.append(DeviceSpec(name, parts[0], parts[1], int(parts[2]), int(parts[3])))
+    if config.has_section('Sensors'):
+        for name, value in config['Sensors'].items():
+            if name.lower() == 'ip_gate':
+                continue
+            parts = value.split()
+            # Для biggate и smallgate entity ID берется из секции [HA], адрес - заглушка
+            if name.lower() in ['biggate', 'smallgate'] and len(parts) >= 4:
+                if len(parts) == 7:
+                    devices.append(DeviceSpec(name, "HA_ENTITY", parts[1], int(parts[2]), int(parts[3]),
+                                              int(parts[4]), int(parts[5]), int(parts[6])))
+                else:
+                    devices.append(DeviceSpec(name, "HA_ENTITY", parts[1], int(parts[2]), int(parts[3])))
+            elif len(parts) == 4:
+                devices.append(DeviceSpec(name, parts[0], parts[1], int(parts[2]), int(parts[3])))
+    return devices
+
+
+def parse_online_check(path) -> OnlineCheckConfig:
+    """Читает и проверяет online_check.ini (имена устройств сохраняют регистр)"""
+    config = _read(path, preserve_case=True)
+    try:
+        ha = _parse_ha(config) or HAConfig(ip=None, token=None)
+        gate_ip = _clean(_section(config, 'Sensors').get('ip_gate')) or None
+        return OnlineCheckConfig(_parse_telegram(config), ha, _parse_mqtt(config), _parse_devices(config), gate_ip)
+    except ValueError as e:
+        raise ConfigError(f"Invalid configuration value in {path}: {e}")
+
+
+# --- КЭШ С ПЕРЕЗАГРУЗКОЙ ---
+
+class ConfigWatcher:
+    """Разобранный ini-файл в памяти с перезагрузкой при изменении mtime"""
+
+    def __init__(self, path: str, parse: Callable[[str], object]):
+        self.path = path
+        self._parse = parse
+        self._listeners: List[Callable[[object], None]] = []
+        self._mtime = self._stat()
+        self._last_error = None
+        # Первая загрузка: ошибка конфигурации пробрасывается вызывающему
+        self._current = parse(path)
+        self.reload_count = 0
+
+    @property
+    def current(self):
+        """Последняя успешно разобранная конфигурация (без обращения к файлу)"""
+        return self._current
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def add_listener(self, callback: Callable[[object], None]):
+        """callback(new_config) вызывается после каждой успешной перезагрузки"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """
+        Перечитывает файл, если изменился mtime (или всегда при force).
+
+        Returns:
+            True, если загружена новая конфигурация
+        """
+        mtime = self._stat()
+        if mtime is None or (mtime == self._mtime and not force):
+            return False
+        try:
+            new_config = self._parse(self.path)
+        except ConfigError as e:
+            # mtime не запоминается: файл мог быть сохранен не до конца, следующая проверка
+            # прочитает его снова. В журнал - только новая ошибка, а не каждая попытка
+            error = (mtime, str(e))
+            if error != self._last_error:
+                logger.error(f"Invalid configuration in {self.path}, keeping the previous one: {e}")
+                self._last_error = error
+            return False
+        self._mtime = mtime
+        self._last_error = None
+
+        # Замена одной ссылкой: читатели видят либо старую, либо новую конфигурацию целиком
+        self._current = new_config
+        self.reload_count += 1
+        logger.info(f"Configuration reloaded from {self.path}")
+        for callback in list(self._listeners):
+            try:
+                callback(new_config)
+            except Exception as e:
+                logger.error(f"Error applying reloaded configuration from {self.path}: {e}", exc_info=True)
+        return True
+
+    async def watch(self, interval: float = CONFIG_WATCH_INTERVAL):
+        """Фоновая проверка mtime; запускается хост-приложением как задача"""
+        while True:
+            await asyncio.sleep(interval)
+            self.reload_if_changed()
+
+
+_watchers: Dict[Tuple[str, str], ConfigWatcher] = {}
+
+
+def _get_watcher(kind: str, path: str, parse) -> ConfigWatcher:
+    key = (kind, os.path.abspath(path))
+    watcher = _watchers.get(key)
+    if watcher is None:
+        watcher = ConfigWatcher(path, parse)
+        _watchers[key] = watcher
+    return watcher
+
+
+def gate_check_config(path: str = GATE_CHECK_INI) -> ConfigWatcher:
+    """Общий на процесс кэш gate_check.ini"""
+    return _get_watcher('gate_check', path, parse_gate_check)
+
+
+def online_check_config(path: str = ONLINE_CHECK_INI) -> ConfigWatcher:
+    """Общий на процесс кэш online_check.ini"""
+    return _get_watcher('online_check', path, parse_online_check)
+
+
+def load_gate_definitions(path: str = GATE_CHECK_INI, gate_names=None) -> List[GateDefinition]:
+    """
+    Описания ворот из gate_check.ini; gate_names ограничивает набор ворот.
+    Ошибка конфигурации ворот, которые не запрашиваются, не мешает запуску остальных.
+    """
+    config = gate_check_config(path).current
+    requested = gate_names or [gate.name for gate in config.gates] + list(config.gate_errors)
+    for name in requested:
+        if name in config.gate_errors:
+            raise ConfigError(config.gate_errors[name])
+    gates = [gate for gate in config.gates if not gate_names or gate.name in gate_names]
+    if not gates:
+        raise ConfigError(f"Gates {gate_names} are not configured" if gate_names else "No gates configured")
+    return gates
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        gate_config = gate_check_config(sys.argv[1] if len(sys.argv) > 1 else GATE_CHECK_INI).current
+        print(f"HA: {gate_config.ha}")
+        for gate in gate_config.gates:
+            print(gate)
+        online_config = online_check_config(sys.argv[2] if len(sys.argv) > 2 else ONLINE_CHECK_INI).current
+        print(f"Gate relay: {online_config.gate_ip}")
+        for device in online_config.devices:
+            print(device)
+    except ConfigError as e:
+        print(f"Configuration error: {e}")
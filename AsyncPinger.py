@@ -0,0 +1,252 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: AsyncPinger.py
+#
+# Description:
+# In-process asynchronous ICMP echo ("ping") engine for Online_check_web.py.
+#
+# Design Philosophy:
+# - All hosts are pinged through ONE unprivileged ICMP datagram socket
+#   (socket.SOCK_DGRAM + IPPROTO_ICMP), so no `ping` process is forked per probe.
+# - Echo requests are multiplexed: every request gets its own sequence number
+#   and the reply is matched back to its waiting future by (source address, sequence).
+#   With datagram ICMP sockets Linux rewrites the identifier to the socket's
+#   local port, so the identifier is not used for matching.
+# - Unprivileged ICMP sockets are not available everywhere (Windows, Linux with a
+#   restrictive net.ipv4.ping_group_range). `get_pinger()` then returns None and
+#   the caller falls back to the `ping` subprocess.
+# - Problems with a single host (name not resolved, send error such as
+#   EHOSTUNREACH) only make that ping report 0 replies; ping() raises only when
+#   the shared socket itself is not open. Resolved addresses are cached for
+#   RESOLVE_TTL seconds and forgotten after a ping without replies, so a host
+#   that changes its IP (DHCP) is found again on the next probe.
+#
+# Public API:
+# - class AsyncPinger
+#   - async ping(address, count=3, timeout=1.0) -> number of replies received
+#     (raises OSError only if the socket is not open)
+#   - close()
+# - async def get_pinger() -> AsyncPinger | None  (shared instance)
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+RESOLVE_TTL = 300  # Сколько хранить адрес, полученный из DNS (сек)
+
+
+def _checksum(data: bytes) -> int:
+    """Контрольная сумма ICMP (RFC 1071)"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident: int, sequence: int, payload: bytes = b'') -> bytes:
+    """Формирует пакет ICMP Echo Request"""
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, sequence)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, sequence) + payload
+
+
+def parse_echo_reply(data: bytes) -> Optional[int]:
+    """
+    Возвращает sequence из ICMP Echo Reply или None для других пакетов.
+    Linux отдает пакет без IP-заголовка, macOS - с заголовком, поэтому он отрезается при наличии.
+    """
+    if len(data) >= 20 and data[0] >> 4 == 4:
+        data = data[(data[0] & 0x0F) * 4:]
+    if len(data) < 8:
+        return None
+    icmp_type, _, _, _, sequence = struct.unpack('!BBHHH', data[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return sequence
+
+
+class _PingProtocol(asyncio.DatagramProtocol):
+    def __init__(self, pinger: 'AsyncPinger'):
+        self.pinger = pinger
+
+    def datagram_received(self, data, addr):
+        self.pinger._on_reply(data, addr[0])
+
+    def error_received(self, exc):
+        logger.debug(f"ICMP socket error: {exc}")
+
+
+class AsyncPinger:
+    """Асинхронный ICMP-пингер, обслуживающий все хосты через один сокет"""
+
+    def __init__(self):
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._ident = os.getpid() & 0xFFFF
+        self._sequence = itertools.count(1)
+        self._pending: Dict[int, Tuple[str, asyncio.Future]] = {}
+        # имя -> (IP, момент устаревания по time.monotonic())
+        self._resolved: Dict[str, Tuple[str, float]] = {}
+
+    async def open(self):
+        """Открывает непривилегированный ICMP-сокет. Бросает OSError, если это запрещено."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            sock.setblocking(False)
+            loop = asyncio.get_running_loop()
+            self._transport, _ = await loop.create_datagram_endpoint(lambda: _PingProtocol(self), sock=sock)
+        except Exception:
+            sock.close()
+            raise
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        for _, future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    async def _resolve(self, address: str) -> str:
+        cached = self._resolved.get(address)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(address, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        if not infos:
+            raise OSError(f"Cannot resolve {address}")
+        ip = infos[0][4][0]
+        self._resolved[address] = (ip, time.monotonic() + RESOLVE_TTL)
+        return ip
+
+    def _next_sequence(self) -> int:
+        # 16-битный номер, пропускаем занятые ожидающими запросами
+        while True:
+            sequence = next(self._sequence) & 0xFFFF
+            if sequence and sequence not in self._pending:
+                return sequence
+
+    def _on_reply(self, data: bytes, source: str):
+        sequence = parse_echo_reply(data)
+        if sequence is None:
+            return
+        pending = self._pending.get(sequence)
+        if pending is None:
+            return
+        expected_source, future = pending
+        if source == expected_source and not future.done():
+            future.set_result(time.perf_counter())
+
+    async def ping(self, address: str, count: int = 3, timeout: float = 1.0) -> int:
+        """
+        Отправляет count эхо-запросов и ждет ответы не дольше timeout секунд.
+
+        Returns:
+            Количество полученных ответов. Ошибки отдельного хоста (имя не
+            разрешается, хост недостижим) дают 0; OSError - только если сокет не открыт.
+        """
+        if self._transport is None:
+            raise OSError("ICMP socket is not open")
+        try:
+            ip = await self._resolve(address)
+        except OSError as e:
+            logger.debug(f"Cannot resolve {address}: {e}")
+            return 0
+        loop = asyncio.get_running_loop()
+
+        futures = []
+        sequences = []
+        try:
+            for _ in range(count):
+                sequence = self._next_sequence()
+                future = loop.create_future()
+                self._pending[sequence] = (ip, future)
+                sequences.append(sequence)
+                futures.append(future)
+                payload = struct.pack('!d', time.perf_counter())
+                try:
+                    self._transport.sendto(build_echo_request(self._ident, sequence, payload), (ip, 0))
+                except OSError as e:
+                    logger.debug(f"ICMP send to {address} failed: {e}")
+                    break
+
+            replies = 0
+            if futures:
+                done, _ = await asyncio.wait(futures, timeout=timeout)
+                replies = sum(1 for future in done if not future.cancelled())
+            if not replies:
+                # Хост мог сменить адрес: при следующей проверке имя разрешается заново
+                self._resolved.pop(address, None)
+            return replies
+        finally:
+            for sequence, future in zip(sequences, futures):
+                self._pending.pop(sequence, None)
+                if not future.done():
+                    future.cancel()
+
+
+# --- ОБЩИЙ ЭКЗЕМПЛЯР ---
+_pinger: Optional[AsyncPinger] = None
+_pinger_unavailable = False
+
+
+async def get_pinger() -> Optional[AsyncPinger]:
+    """
+    Возвращает общий AsyncPinger, открывая сокет при первом вызове.
+    Возвращает None, если непривилегированные ICMP-сокеты недоступны.
+    """
+    global _pinger, _pinger_unavailable
+    if _pinger is not None or _pinger_unavailable:
+        return _pinger
+    pinger = AsyncPinger()
+    try:
+        await pinger.open()
+    except (OSError, NotImplementedError) as e:
+        _pinger_unavailable = True
+        logger.warning(f"ICMP datagram socket unavailable ({e}); falling back to the ping subprocess")
+        return None
+    _pinger = pinger
+    return _pinger
+
+
+def close_pinger():
+    """Закрывает общий сокет. Вызывается хост-приложением при выходе."""
+    global _pinger
+    if _pinger is not None:
+        _pinger.close()
+        _pinger = None
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+async def main_test(hosts):
+    pinger = await get_pinger()
+    if pinger is None:
+        print("ICMP datagram sockets are not permitted on this system")
+        return
+    start = time.perf_counter()
+    results = await asyncio.gather(*(pinger.ping(host) for host in hosts), return_exceptions=True)
+    for host, result in zip(hosts, results):
+        print(f"{host}: {result}")
+    print(f"{len(hosts)} hosts in {(time.perf_counter() - start) * 1000:.0f} ms")
+    close_pinger()
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(main_test(sys.argv[1:] or ['127.0.0.1']))
@@ -0,0 +1,538 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: Benchmark.py
+#
+# Description:
+# End-to-end benchmarks of the real gate programs against the in-process fakes
+# from FakeServices.py (Home Assistant, Shelly relay, Telegram Bot API), so no
+# hardware, HA instance or Telegram account is involved:
+#
+# - gate_alert: GateMonitorEngine (GateCheck.py / GateCheckSmall.py) - time
+#   from the door sensor opening in HA to the Telegram prompt arriving, in
+#   push (HA WebSocket) and poll (REST every time_polling) modes. The
+#   configured time_to_close is reported separately as "overhead".
+# - toggle: Online_check_web - POST /toggle-gate until the `gate_command`
+#   SSE event reports the gate in its new state. The fake relay moves the
+#   fake gate after --motor-seconds.
+# - sse: Online_check_web /status-stream fan-out - N devices x M clients,
+#   device updates published as fast as possible (or at --publish-rate);
+#   reports delivered events per second, publish -> client latency and events
+#   dropped for slow clients.
+# - button: GateMonitorEngine - time from pressing "Close gate" on the prompt
+#   to the relay pulse, with the bot receiving the button press by long
+#   polling (getUpdates) and by webhook ([Telegram ID] webhook_url).
+#   button.channel repeats the polling run with chat_id = @channelusername:
+#   any failure there means button presses from that chat are rejected.
+#
+# Design Philosophy:
+# - The programs run unmodified: they read generated gate_check.ini /
+#   online_check.ini files from a temporary working directory, and Telegram is
+#   redirected with the [Telegram ID] api_url option.
+# - Latency and failures of every fake are configurable (--ha-latency,
+#   --failure-rate, ...), with a fixed --seed for reproducible runs.
+# - Results are printed as a table and can be saved as JSON (--output) and
+#   compared with an earlier run (--baseline), so runs on different commits or
+#   machines can be compared.
+# - Clients, fakes and programs share one process and one event loop: absolute
+#   numbers include the fakes' own cost and are meant for comparing runs.
+#
+# Usage:
+#   python Benchmark.py                                  # all scenarios
+#   python Benchmark.py --scenarios sse --devices 500 --clients 20
+#   python Benchmark.py --output before.json
+#   python Benchmark.py --output after.json --baseline before.json
+#
+# --- END OF DESCRIPTION ---
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from FakeServices import FakeHomeAssistant, FakeServer, FakeShelly, FakeTelegram, FaultInjection, free_port
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BIG_GATE_ENTITY = 'binary_sensor.big_gate_sensor_opening'
+SCENARIOS = ('gate_alert', 'button', 'toggle', 'sse')
+
+logger = logging.getLogger("Benchmark")
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Статистика по выборке в миллисекундах"""
+    if not samples:
+        return {'n': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'n': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(percentile(50), 2),
+        'p95_ms': round(percentile(95), 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def make_workdir() -> str:
+    """
+    Временный рабочий каталог для запуска программ: они читают ini, шаблоны
+    и static относительно текущего каталога и пишут туда device_status.log
+    """
+    workdir = tempfile.mkdtemp(prefix='gatecheck-bench-')
+    for name in ('templates', 'static'):
+        source = os.path.join(REPO_DIR, name)
+        target = os.path.join(workdir, name)
+        if os.path.isdir(source):
+            os.symlink(source, target)
+        else:
+            os.mkdir(target)
+    return workdir
+
+
+class BenchEnvironment:
+    """Имитации сервисов и временный рабочий каталог с конфигурацией"""
+
+    def __init__(self, args):
+        self.args = args
+        self.ha = FakeHomeAssistant(faults=FaultInjection(args.ha_latency, args.failure_rate, args.seed))
+        self.shelly = FakeShelly(faults=FaultInjection(args.shelly_latency, args.failure_rate, args.seed + 1))
+        self.telegram = FakeTelegram(faults=FaultInjection(args.telegram_latency, args.failure_rate, args.seed + 2))
+        self.ha.add_gate(BIG_GATE_ENTITY, closed=True, battery=100)
+        self.servers = [FakeServer(self.ha.app), FakeServer(self.shelly.app), FakeServer(self.telegram.app)]
+        self.workdir: Optional[str] = None
+        self._cwd = os.getcwd()
+
+    @property
+    def ha_address(self):
+        return self.servers[0].address
+
+    @property
+    def shelly_address(self):
+        return self.servers[1].address
+
+    @property
+    def telegram_url(self):
+        return self.telegram.api_url(self.servers[2].address)
+
+    async def __aenter__(self):
+        self.workdir = make_workdir()
+        os.chdir(self.workdir)
+        for server in self.servers:
+            await server.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        for server in self.servers:
+            await server.stop()
+        await self.telegram.aclose()
+        os.chdir(self._cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def write_gate_check_ini(self, push: bool, time_to_close: int, webhook_port: Optional[int] = None,
+                             chat_id='1'):
+        webhook = (f"webhook_url = http://127.0.0.1:{webhook_port}/telegram\n"
+                   f"webhook_listen = 127.0.0.1\nwebhook_port = {webhook_port}\nwebhook_secret = bench-secret\n"
+                   if webhook_port else "")
+        with open('gate_check.ini', 'w') as f:
+            f.write(f"""[Telegram ID]
+TOKEN = 123456:bench
+chat_id = {chat_id}
+api_url = {self.telegram_url}
+{webhook}
+[HA]
+HA_IP = {self.ha_address}
+HA_TOKEN = {self.ha.token}
+ha_websocket = {'true' if push else 'false'}
+
+[Gate bench]
+title = bench gate
+entity = {BIG_GATE_ENTITY}
+relay_ip = {self.shelly_address}
+time_polling = 1
+time_to_close = {time_to_close}
+delays = 1
+prompt_timeout = 30
+default_action = continue
+""")
+        # Новое содержимое должно отличаться по mtime от уже прочитанного файла
+        os.utime('gate_check.ini', (time.time() + 1, time.time() + 1))
+
+    def write_online_check_ini(self, devices: int = 0):
+        computers = "\n".join(f"Host{i:04d} = 127.0.0.1 RPI 3600 3600" for i in range(devices))
+        with open('online_check.ini', 'w') as f:
+            f.write(f"""[Computers]
+{computers}
+
+[Sensors]
+BigGate = HA_ENTITY SENSOR 3600 3600 1 1 30
+ip_gate = {self.shelly_address}
+
+[HA]
+HA_IP = {self.ha_address}
+HA_TOKEN = {self.ha.token}
+big_gate_opening_entity = {BIG_GATE_ENTITY}
+ha_websocket = true
+""")
+        os.utime('online_check.ini', (time.time() + 1, time.time() + 1))
+
+
+# --- GateCheck: открытие ворот -> оповещение ---
+
+async def bench_gate_alert(env: BenchEnvironment, push: bool) -> dict:
+    from AppConfig import gate_check_config
+    from GateMonitorEngine import create_engine
+
+    args = env.args
+    env.write_gate_check_ini(push, args.time_to_close)
+    gate_check_config().reload_if_changed(force=True)
+    engine = create_engine(config_file='gate_check.ini')
+    engine_task = asyncio.create_task(engine.run())
+    samples, failures = [], 0
+    try:
+        # Ждем запуска бота (первый getUpdates) и подписки на события HA
+        while not env.telegram.method_counts.get('getUpdates'):
+            await asyncio.sleep(0.05)
+        if engine.events is not None:
+            await asyncio.wait_for(engine.events.connected.wait(), 10)
+        await asyncio.sleep(1.5)
+
+        for _ in range(args.iterations):
+            start_index = len(env.telegram.messages)
+            opened_at = time.perf_counter()
+            await env.ha.set_state(BIG_GATE_ENTITY, 'on')
+            try:
+                prompt = await env.telegram.wait_for_message(lambda m: 'reply_markup' in m, start=start_index,
+                                                             timeout=args.time_to_close + 30)
+                samples.append(prompt['received_at'] - opened_at)
+                # "Continue polling" - последняя кнопка
+                buttons = prompt['reply_markup']['inline_keyboard']
+                await env.telegram.press_button(prompt['message_id'], buttons[-1][0]['callback_data'])
+            except asyncio.TimeoutError:
+                failures += 1
+            await env.ha.set_state(BIG_GATE_ENTITY, 'off')
+            # Автомат должен увидеть закрытые ворота до следующего открытия
+            await asyncio.sleep(1.5)
+    finally:
+        engine.request_shutdown()
+        await engine_task
+
+    result = summarize(samples)
+    result['failures'] = failures
+    if samples:
+        result['overhead_p50_ms'] = round(result['p50_ms'] - args.time_to_close * 1000, 2)
+        result['overhead_p95_ms'] = round(result['p95_ms'] - args.time_to_close * 1000, 2)
+    return result
+
+
+# --- GateCheck: нажатие кнопки -> импульс реле ---
+
+async def bench_button(env: BenchEnvironment, webhook: bool, chat_id='1') -> dict:
+    from AppConfig import gate_check_config
+    from GateMonitorEngine import create_engine
+
+    args = env.args
+    env.write_gate_check_ini(True, args.time_to_close, webhook_port=free_port() if webhook else None,
+                             chat_id=chat_id)
+    gate_check_config().reload_if_changed(force=True)
+
+    async def close_gate():
+        await asyncio.sleep(args.motor_seconds)
+        await env.ha.set_state(BIG_GATE_ENTITY, 'off')
+
+    env.shelly.on_pulse = close_gate
+    engine = create_engine(config_file='gate_check.ini')
+    engine_task = asyncio.create_task(engine.run())
+    samples, failures = [], 0
+    try:
+        # Бот готов принимать нажатия: первый getUpdates или зарегистрированный веб-хук
+        while not (env.telegram.webhook_url if webhook else env.telegram.method_counts.get('getUpdates')):
+            await asyncio.sleep(0.05)
+        await asyncio.wait_for(engine.events.connected.wait(), 10)
+        await asyncio.sleep(1.5)
+
+        for _ in range(args.iterations):
+            start_index = len(env.telegram.messages)
+            await env.ha.set_state(BIG_GATE_ENTITY, 'on')
+            try:
+                prompt = await env.telegram.wait_for_message(lambda m: 'reply_markup' in m, start=start_index,
+                                                             timeout=args.time_to_close + 30)
+                pulses = len(env.shelly.pulses)
+                pressed_at = time.perf_counter()
+                # "Close gate" - первая кнопка
+                await env.telegram.press_button(prompt['message_id'], '1')
+                deadline = pressed_at + 10
+                while len(env.shelly.pulses) == pulses and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.001)
+                if len(env.shelly.pulses) == pulses:
+                    failures += 1
+                else:
+                    samples.append(env.shelly.pulses[pulses] - pressed_at)
+            except asyncio.TimeoutError:
+                failures += 1
+            # Привод закрывает ворота; автомат должен увидеть это до следующего открытия
+            await asyncio.sleep(args.motor_seconds + 1.5)
+            await env.ha.set_state(BIG_GATE_ENTITY, 'off')
+            await asyncio.sleep(0.5)
+    finally:
+        engine.request_shutdown()
+        await engine_task
+        env.shelly.on_pulse = None
+
+    result = summarize(samples)
+    result['failures'] = failures
+    return result
+
+
+# --- Online_check_web ---
+
+async def sse_events(address: str, events: asyncio.Queue, ready: asyncio.Event, kinds=None):
+    """SSE-клиент /status-stream: кладет в очередь (время приема, событие, данные)"""
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with client.stream('GET', f'http://{address}/status-stream') as response:
+            ready.set()
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith('event:'):
+                    event = line.split(':', 1)[1].strip()
+                elif line.startswith('data:') and (kinds is None or event in kinds):
+                    events.put_nowait((time.perf_counter(), event, line[5:].strip()))
+
+
+async def bench_toggle(env: BenchEnvironment, web, address: str) -> dict:
+    args = env.args
+
+    async def move_gate():
+        # Привод ворот: через motor_seconds после импульса датчик меняет состояние
+        await asyncio.sleep(args.motor_seconds)
+        state = env.ha.states[BIG_GATE_ENTITY]['state']
+        await env.ha.set_state(BIG_GATE_ENTITY, 'off' if state == 'on' else 'on')
+
+    env.shelly.on_pulse = move_gate
+    events, ready = asyncio.Queue(), asyncio.Event()
+    listener = asyncio.create_task(sse_events(address, events, ready, kinds={'gate_command'}))
+    await ready.wait()
+    accepted, confirmed, failures = [], [], 0
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                response = await client.post(f'http://{address}/toggle-gate')
+                accepted.append(time.perf_counter() - start)
+                command_id = response.json().get('command_id')
+                status = None
+                deadline = start + args.motor_seconds + 30
+                while status not in ('succeeded', 'timed_out', 'failed'):
+                    try:
+                        received_at, _, data = await asyncio.wait_for(events.get(), deadline - time.perf_counter())
+                    except asyncio.TimeoutError:
+                        break
+                    command = json.loads(data)
+                    if command['id'] == command_id:
+                        status = command['status']
+                if status == 'succeeded':
+                    confirmed.append(received_at - start)
+                else:
+                    failures += 1
+                await asyncio.sleep(0.2)
+    finally:
+        listener.cancel()
+        env.shelly.on_pulse = None
+
+    result = summarize(confirmed)
+    result['failures'] = failures
+    result['accept_p50_ms'] = summarize(accepted).get('p50_ms')
+    if confirmed:
+        result['overhead_p50_ms'] = round(result['p50_ms'] - args.motor_seconds * 1000, 2)
+    return result
+
+
+async def bench_sse(env: BenchEnvironment, web, address: str) -> dict:
+    args = env.args
+    env.write_online_check_ini(args.devices)
+    web.reload_config()
+    devices = [device for device in web.DEVICES if not device.is_gate]
+    # Первые проверки новых устройств не должны попасть в замер
+    await asyncio.sleep(2)
+
+    publish_times: Dict[int, float] = {}
+    latencies: List[float] = []
+    received = [0] * args.clients
+    last_received = [0.0] * args.clients
+    done = asyncio.Event()
+    final_seq = args.updates - 1
+
+    async def client(index: int, ready: asyncio.Event):
+        queue = asyncio.Queue()
+        reader = asyncio.create_task(sse_events(address, queue, asyncio.Event(), kinds={'device_status'}))
+        try:
+            snapshot = 0
+            while True:
+                received_at, _, data = await queue.get()
+                status = json.loads(data)['status_text']
+                if not status.startswith('bench-'):
+                    snapshot += 1
+                    if snapshot >= len(devices):
+                        ready.set()
+                    continue
+                seq = int(status[len('bench-'):])
+                received[index] += 1
+                last_received[index] = received_at
+                latencies.append(received_at - publish_times[seq])
+                if seq == final_seq and all(last_received):
+                    done.set()
+        finally:
+            reader.cancel()
+
+    readies = [asyncio.Event() for _ in range(args.clients)]
+    clients = [asyncio.create_task(client(i, ready)) for i, ready in enumerate(readies)]
+    try:
+        await asyncio.wait_for(asyncio.gather(*(ready.wait() for ready in readies)), 30)
+        dropped_before = web.HUB.dropped_events
+        start = time.perf_counter()
+        for seq in range(args.updates):
+            device = devices[seq % len(devices)]
+            device.status_text = f"bench-{seq}"
+            publish_times[seq] = time.perf_counter()
+            web.publish_device(device)
+            if args.publish_rate:
+                await asyncio.sleep(max(0.0, start + (seq + 1) / args.publish_rate - time.perf_counter()))
+            elif seq % len(devices) == len(devices) - 1:
+                # Отдаем управление после каждого прохода по устройствам, как планировщик проверок
+                await asyncio.sleep(0)
+        try:
+            await asyncio.wait_for(done.wait(), 30)
+        except asyncio.TimeoutError:
+            pass
+        duration = max(last_received) - start
+    finally:
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+    total = sum(received)
+    result = summarize(latencies)
+    result.update({
+        'devices': len(devices), 'clients': args.clients, 'updates': args.updates,
+        'publish_rate': args.publish_rate,
+        'delivered_ratio': round(total / (args.updates * args.clients), 4),
+        'events_per_sec': round(total / duration) if duration > 0 else None,
+        'dropped': web.HUB.dropped_events - dropped_before,
+    })
+    return result
+
+
+async def run_web(env: BenchEnvironment, scenarios) -> dict:
+    env.write_online_check_ini()
+    import Online_check_web as web
+    results = {}
+    lifespan = web.lifespan(web.app)
+    await lifespan.__aenter__()
+    server = FakeServer(web.app)
+    await server.start()
+    try:
+        await asyncio.sleep(1)
+        if 'toggle' in scenarios:
+            results['toggle'] = await bench_toggle(env, web, server.address)
+        if 'sse' in scenarios:
+            results['sse'] = await bench_sse(env, web, server.address)
+    finally:
+        await server.stop()
+        await lifespan.__aexit__(None, None, None)
+    return results
+
+
+# --- Запуск и сравнение ---
+
+def print_results(results: dict, baseline: Optional[dict]):
+    previous = (baseline or {}).get('results', {})
+    for name, values in results.items():
+        print(f"\n{name}")
+        for key, value in values.items():
+            line = f"  {key:<18} {value}"
+            old = previous.get(name, {}).get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                line += f"   (baseline {old}, {(value - old) / abs(old) * 100:+.1f}%)"
+            print(line)
+
+
+async def run(args) -> dict:
+    scenarios = set(args.scenarios)
+    results = {}
+    async with BenchEnvironment(args) as env:
+        # Общий gate_check.ini: бот Telegram нужен и веб-интерфейсу
+        env.write_gate_check_ini(push=True, time_to_close=args.time_to_close)
+        if 'gate_alert' in scenarios:
+            results['gate_alert.push'] = await bench_gate_alert(env, push=True)
+            results['gate_alert.poll'] = await bench_gate_alert(env, push=False)
+        if 'button' in scenarios:
+            results['button.polling'] = await bench_button(env, webhook=False)
+            results['button.webhook'] = await bench_button(env, webhook=True)
+            results['button.channel'] = await bench_button(env, webhook=False, chat_id='@fake_gate_channel')
+        if scenarios & {'toggle', 'sse'}:
+            env.write_gate_check_ini(push=True, time_to_close=args.time_to_close)
+            results.update(await run_web(env, scenarios))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks against fake HA, Shelly and Telegram")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=5, help="Gate openings / toggles per scenario")
+    parser.add_argument('--time-to-close', type=int, default=1, help="time_to_close of the benchmark gate (s)")
+    parser.add_argument('--motor-seconds', type=float, default=0.5, help="Fake gate travel time after a pulse (s)")
+    parser.add_argument('--devices', type=int, default=100, help="Devices for the sse scenario")
+    parser.add_argument('--clients', type=int, default=10, help="SSE clients for the sse scenario")
+    parser.add_argument('--updates', type=int, default=2000, help="Device updates published in the sse scenario")
+    parser.add_argument('--publish-rate', type=float, default=0,
+                        help="Device updates per second in the sse scenario (0 = as fast as possible)")
+    parser.add_argument('--ha-latency', type=float, default=0.0, help="Added latency of fake HA responses (s)")
+    parser.add_argument('--shelly-latency', type=float, default=0.0, help="Added latency of the fake relay (s)")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="Added latency of the fake Bot API (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of fake requests that fail (0..1)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Save results as JSON")
+    parser.add_argument('--baseline', help="JSON from an earlier run to compare with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = asyncio.run(run(args))
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        },
+        'results': results,
+    }
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, REPO_DIR)
+    main()
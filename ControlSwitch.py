@@ -1,6 +1,13 @@
+import asyncio
 import requests
+import httpx
 import time
 
+from Metrics import SHELLY_ERRORS, SHELLY_SECONDS
+
+# Оптимальное время импульса для приводов Nice: 200ms (0.2 сек)
+PULSE_DURATION = 0.2
+
 class Shelly1Plus:
     def __init__(self, ip_address):
         self.base_url = f"http://{ip_address}"
@@ -32,7 +39,125 @@ class Shelly1Plus:
         response.raise_for_status()  # Вызывает исключение при HTTP ошибках
         return response.json()
 
+class AsyncShelly1Plus:
+    """Асинхронный клиент Shelly 1 Plus (Gen2 RPC) с постоянным keep-alive соединением"""
+
+    def __init__(self, ip_address, timeout=10):
+        self.base_url = f"http://{ip_address}"
+        self.ip_address = ip_address
+        self.timeout = timeout
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=2, max_keepalive_connections=1, keepalive_expiry=60),
+            )
+        return self._client
+
+    async def _rpc(self, method, params):
+        response = await self._get_client().post(f"/rpc/{method}", json=params)
+        response.raise_for_status()  # Вызывает исключение при HTTP ошибках
+        return response.json()
+
+    async def pulse(self, duration=PULSE_DURATION):
+        """
+        Импульс реле одним вызовом: Switch.Set с toggle_after - реле само
+        выключится через duration секунд
+        """
+        return await self._rpc("Switch.Set", {"id": 0, "on": True, "toggle_after": duration})
+
+    async def get_status(self):
+        return await self._rpc("Switch.GetStatus", {"id": 0})
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# Один клиент на IP реле на весь процесс
+_shelly_clients = {}
+
+
+def get_shelly(ip_address):
+    """Возвращает общий AsyncShelly1Plus для указанного IP"""
+    shelly = _shelly_clients.get(ip_address)
+    if shelly is None:
+        shelly = AsyncShelly1Plus(ip_address)
+        _shelly_clients[ip_address] = shelly
+    return shelly
+
+
+async def close_shelly_clients():
+    """Закрывает соединения со всеми реле. Вызывается хост-приложением при выходе."""
+    clients = list(_shelly_clients.values())
+    _shelly_clients.clear()
+    for shelly in clients:
+        await shelly.aclose()
+
+
+async def pulse_shelly_switch(ip_address, confirm=False):
+    """
+    Неблокирующий импульс реле ворот (замена control_shelly_switch для asyncio-программ).
+
+    Args:
+        ip_address: IP адрес Shelly
+        confirm: Дополнительно проверить через Switch.GetStatus, что реле вернулось в выключенное состояние
+
+    Returns:
+        True, если команда принята (и подтверждена при confirm=True)
+    """
+    shelly = get_shelly(ip_address)
+    try:
+        with SHELLY_SECONDS.time(command='pulse'):
+            result = await shelly.pulse()
+        print(f"Switch pulse result: {result}")
+        if result.get('was_on') is not False:
+            SHELLY_ERRORS.inc(command='pulse')
+            print(f"Gate operation may have failed: relay was already on ({result})")
+            return False
+
+        if confirm:
+            # Ждем окончания импульса и проверяем, что реле выключилось
+            await asyncio.sleep(PULSE_DURATION + 0.1)
+            with SHELLY_SECONDS.time(command='status'):
+                status = await shelly.get_status()
+            if status.get('output') is not False:
+                SHELLY_ERRORS.inc(command='status')
+                print(f"Gate operation may have failed: relay still on ({status})")
+                return False
+
+        print("Gate operation completed successfully")
+        return True
+
+    except httpx.TimeoutException:
+        SHELLY_ERRORS.inc(command='pulse')
+        print("Timeout error: Shelly device not responding")
+        raise
+    except httpx.ConnectError:
+        SHELLY_ERRORS.inc(command='pulse')
+        print("Connection error: Cannot reach Shelly device")
+        raise
+    except httpx.HTTPError as e:
+        SHELLY_ERRORS.inc(command='pulse')
+        print(f"Network error occurred in switch: {e}")
+        raise
+
 def control_shelly_switch(ip_address):
+    try:
+        with SHELLY_SECONDS.time(command='switch'):
+            success = _control_shelly_switch(ip_address)
+    except Exception:
+        SHELLY_ERRORS.inc(command='switch')
+        raise
+    if not success:
+        SHELLY_ERRORS.inc(command='switch')
+    return success
+
+def _control_shelly_switch(ip_address):
     shelly = Shelly1Plus(ip_address)
     
     try:
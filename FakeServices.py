@@ -0,0 +1,746 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: FakeServices.py
+#
+# Description:
+# In-process stand-ins for the external services the gate programs talk to,
+# so the code paths can be exercised without real hardware.
+#
+# Design Philosophy:
+# - HTTP fakes are small FastAPI applications served by an in-process uvicorn
+#   server on 127.0.0.1 with a free port (see `FakeServer`); the MQTT broker
+#   is a plain asyncio TCP server.
+# - Fakes keep their state in plain Python objects so a test or benchmark can
+#   change it directly (e.g. flip a door sensor) and observe the reaction.
+# - Every HTTP fake has a `faults` attribute (FaultInjection): added latency
+#   and injected failures (a fixed number of next requests and/or a random
+#   rate with a reproducible seed), used by the end-to-end benchmarks in
+#   Benchmark.py.
+#
+# Public API:
+# - class FaultInjection(latency=0.0, failure_rate=0.0, seed=0)
+#   - fail_next(count), async apply() -> True if the request must fail
+# - class FakeHomeAssistant
+#   - REST: GET /api/, /api/states, /api/states/<entity_id>
+#   - WebSocket: /api/websocket (auth, subscribe_events, get_states)
+#   - async set_state(entity_id, state) -> broadcasts `state_changed`
+#   - async drop_connections() -> simulates an HA restart
+# - class FakeShelly
+#   - Gen2 RPC: /rpc/Switch.Set (on, toggle_after), /rpc/Switch.GetStatus, /shelly
+#   - on_pulse: optional coroutine function called on every "on" command
+#     (e.g. to move a fake gate in FakeHomeAssistant)
+# - class FakeTelegram
+#   - Bot API at /bot<token>/<method>: getMe, sendMessage, getUpdates (long
+#     polling), answerCallbackQuery, editMessageText; other methods return true
+#   - chat_id is a numeric ID or a channel's @username (the message then
+#     carries a channel chat with that username, like the real Bot API)
+#   - `api_url` for [Telegram ID] api_url, `messages`, async wait_for_message(),
+#     press_button(message_id, data) -> delivers a callback query
+#   - flood_next(count, retry_after) -> the next sendMessage calls get
+#     "429 Too Many Requests" with parameters.retry_after, like the real flood limit
+#   - setWebhook / deleteWebhook / getWebhookInfo: while a webhook is set,
+#     button presses are POSTed to it (with X-Telegram-Bot-Api-Secret-Token)
+#     and getUpdates answers 409 Conflict, like the real Bot API;
+#     `webhook_statuses` holds the HTTP status of every delivery
+# - class FakeMqttBroker
+#   - Minimal MQTT 3.1.1 broker (QoS 0, retained messages, + and # wildcards)
+#   - async publish(topic, payload, retain=False), async publish_contact(topic, closed, battery)
+#   - async drop_connections() -> simulates a broker restart
+# - class FakeServer
+#   - async start() / async stop(), `address` -> "127.0.0.1:<port>"
+# - def free_port() -> int: a free TCP port on 127.0.0.1 (e.g. for a webhook
+#   listener of the program under test)
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def free_port() -> int:
+    """Возвращает свободный TCP-порт на 127.0.0.1"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeServer:
+    """Запускает FastAPI-приложение на встроенном uvicorn в текущем event loop"""
+
+    def __init__(self, app: FastAPI, port: Optional[int] = None):
+        self.app = app
+        self.port = port or free_port()
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    async def start(self):
+        config = uvicorn.Config(self.app, host='127.0.0.1', port=self.port, log_level='warning', lifespan='off')
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                # Сервер не смог запуститься - пробрасываем исключение
+                await self._task
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+            self._server = None
+            self._task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+class FaultInjection:
+    """Задержка ответов и отказы для имитаций HTTP-сервисов"""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            latency: Задержка перед каждым ответом в секундах
+            failure_rate: Доля запросов (0..1), завершающихся ошибкой
+            seed: Начальное значение генератора, чтобы прогоны были воспроизводимы
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._fail_next = 0
+        self.failures = 0
+
+    def fail_next(self, count: int = 1):
+        """Следующие count запросов завершатся ошибкой"""
+        self._fail_next += count
+
+    async def apply(self) -> bool:
+        """Выдерживает задержку; возвращает True, если запрос должен завершиться ошибкой"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._fail_next > 0:
+            self._fail_next -= 1
+        elif not (self.failure_rate and self._random.random() < self.failure_rate):
+            return False
+        self.failures += 1
+        return True
+
+
+def _injected_failure() -> JSONResponse:
+    return JSONResponse({'message': 'Injected failure'}, status_code=500)
+
+
+class FakeHomeAssistant:
+    """Имитация REST и WebSocket API Home Assistant"""
+
+    def __init__(self, token: str = 'fake-token', faults: Optional[FaultInjection] = None):
+        self.token = token
+        self.faults = faults or FaultInjection()
+        self.states: Dict[str, dict] = {}
+        self.request_count = 0
+        self._subscribers: List[Tuple[WebSocket, int]] = []
+        self._connections: List[WebSocket] = []
+        self.app = self._build_app()
+
+    def add_gate(self, opening_entity_id: str, closed: bool = True, battery: float = 100):
+        """Добавляет пару entity датчика ворот (открытие + батарея) без рассылки событий"""
+        battery_entity_id = opening_entity_id.replace("_opening", "_battery").replace("binary_sensor.", "sensor.")
+        self.states[opening_entity_id] = self._make_state(opening_entity_id, 'off' if closed else 'on')
+        self.states[battery_entity_id] = self._make_state(battery_entity_id, str(battery))
+
+    @staticmethod
+    def _make_state(entity_id: str, state: str, attributes: Optional[dict] = None) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        return {
+            'entity_id': entity_id, 'state': state, 'attributes': attributes or {},
+            'last_changed': now, 'last_updated': now, 'context': {'id': 'fake', 'parent_id': None, 'user_id': None},
+        }
+
+    async def set_state(self, entity_id: str, state: str, attributes: Optional[dict] = None):
+        """Меняет состояние entity и рассылает state_changed всем подписчикам"""
+        old_state = self.states.get(entity_id)
+        new_state = self._make_state(entity_id, state, attributes)
+        self.states[entity_id] = new_state
+        event = {
+            'event_type': 'state_changed',
+            'data': {'entity_id': entity_id, 'old_state': old_state, 'new_state': new_state},
+            'origin': 'LOCAL', 'time_fired': new_state['last_updated'],
+        }
+        for websocket, subscription_id in list(self._subscribers):
+            try:
+                await websocket.send_json({'id': subscription_id, 'type': 'event', 'event': event})
+            except Exception:
+                self._forget(websocket)
+
+    async def drop_connections(self):
+        """Закрывает все WebSocket-соединения (имитация перезапуска HA)"""
+        for websocket in list(self._connections):
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+            self._forget(websocket)
+
+    def _forget(self, websocket: WebSocket):
+        self._subscribers = [(ws, sid) for ws, sid in self._subscribers if ws is not websocket]
+        if websocket in self._connections:
+            self._connections.remove(websocket)
+
+    def _authorized(self, request: Request) -> bool:
+        return request.headers.get('authorization') == f"Bearer {self.token}"
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/api/")
+        async def api_root(request: Request):
+            self.request_count += 1
+            if not self._authorized(request):
+                return JSONResponse({'message': 'Unauthorized'}, status_code=401)
+            return {'message': 'API running.'}
+
+        @app.get("/api/states")
+        async def all_states(request: Request):
+            self.request_count += 1
+            if await self.faults.apply():
+                return _injected_failure()
+            if not self._authorized(request):
+                return JSONResponse({'message': 'Unauthorized'}, status_code=401)
+            return list(self.states.values())
+
+        @app.get("/api/states/{entity_id}")
+        async def entity_state(entity_id: str, request: Request):
+            self.request_count += 1
+            if await self.faults.apply():
+                return _injected_failure()
+            if not self._authorized(request):
+                return JSONResponse({'message': 'Unauthorized'}, status_code=401)
+            if entity_id not in self.states:
+                return JSONResponse({'message': 'Entity not found.'}, status_code=404)
+            return self.states[entity_id]
+
+        @app.websocket("/api/websocket")
+        async def websocket_api(websocket: WebSocket):
+            await websocket.accept()
+            await websocket.send_json({'type': 'auth_required', 'ha_version': 'fake'})
+            auth = await websocket.receive_json()
+            if auth.get('type') != 'auth' or auth.get('access_token') != self.token:
+                await websocket.send_json({'type': 'auth_invalid', 'message': 'Invalid access token'})
+                await websocket.close()
+                return
+            await websocket.send_json({'type': 'auth_ok', 'ha_version': 'fake'})
+            self._connections.append(websocket)
+            try:
+                while True:
+                    message = await websocket.receive_json()
+                    message_id = message.get('id')
+                    message_type = message.get('type')
+                    if message_type == 'subscribe_events':
+                        self._subscribers.append((websocket, message_id))
+                        await websocket.send_json({'id': message_id, 'type': 'result', 'success': True, 'result': None})
+                    elif message_type == 'get_states':
+                        await websocket.send_json({'id': message_id, 'type': 'result', 'success': True,
+                                                   'result': list(self.states.values())})
+                    elif message_type == 'ping':
+                        await websocket.send_json({'id': message_id, 'type': 'pong'})
+                    else:
+                        await websocket.send_json({'id': message_id, 'type': 'result', 'success': False,
+                                                   'error': {'code': 'unknown_command', 'message': 'Unknown command.'}})
+            except WebSocketDisconnect:
+                pass
+            finally:
+                self._forget(websocket)
+
+        return app
+
+
+class FakeShelly:
+    """Имитация Gen2 RPC реле Shelly 1 Plus"""
+
+    def __init__(self, faults: Optional[FaultInjection] = None,
+                 on_pulse: Optional[Callable[[], Awaitable[None]]] = None):
+        self.faults = faults or FaultInjection()
+        self.on_pulse = on_pulse
+        self.output = False
+        self.pulses: List[float] = []
+        self._off_task: Optional[asyncio.Task] = None
+        self._pulse_tasks = set()
+        self.app = self._build_app()
+
+    async def _switch_off_after(self, seconds: float):
+        await asyncio.sleep(seconds)
+        self.output = False
+
+    def _set(self, on: bool, toggle_after: Optional[float]) -> dict:
+        was_on = self.output
+        self.output = on
+        if self._off_task is not None:
+            self._off_task.cancel()
+            self._off_task = None
+        if on and toggle_after:
+            self._off_task = asyncio.create_task(self._switch_off_after(toggle_after))
+        if on and not was_on:
+            self.pulses.append(time.perf_counter())
+            if self.on_pulse is not None:
+                task = asyncio.create_task(self.on_pulse())
+                self._pulse_tasks.add(task)
+                task.add_done_callback(self._pulse_tasks.discard)
+        return {'was_on': was_on}
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/shelly")
+        async def device_info():
+            return {'id': 'shellyplus1-fake', 'model': 'SNSW-001X16EU', 'gen': 2}
+
+        @app.post("/rpc/Switch.Set")
+        async def switch_set(request: Request):
+            if await self.faults.apply():
+                return _injected_failure()
+            params = await request.json()
+            return self._set(bool(params.get('on')), params.get('toggle_after'))
+
+        @app.post("/rpc/Switch.GetStatus")
+        async def switch_status():
+            if await self.faults.apply():
+                return _injected_failure()
+            return {'id': 0, 'source': 'fake', 'output': self.output}
+
+        return app
+
+
+class FakeTelegram:
+    """
+    Имитация Telegram Bot API для python-telegram-bot.
+
+    Сообщения только запоминаются; нажатие кнопки (press_button) превращается
+    в callback query, которую бот получает через getUpdates.
+    """
+
+    BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': 'FakeGateBot', 'username': 'fake_gate_bot'}
+    HUMAN_USER = {'id': 2000, 'is_bot': False, 'first_name': 'Tester'}
+    CHANNEL_ID = -1001000  # ID канала, заданного как chat_id = @username
+    MAX_POLL_SECONDS = 1.0  # getUpdates держится не дольше: остановка бота не ждет полный timeout
+
+    def __init__(self, faults: Optional[FaultInjection] = None):
+        self.faults = faults or FaultInjection()
+        self.messages: List[dict] = []
+        self.method_counts: Dict[str, int] = {}
+        self._updates: List[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._changed = asyncio.Condition()
+        self._flood = 0
+        self._flood_retry_after = 1
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_statuses: List[int] = []
+        self._webhook_client: Optional[httpx.AsyncClient] = None
+        self.app = self._build_app()
+
+    def flood_next(self, count: int = 1, retry_after: int = 1):
+        """Следующие count вызовов sendMessage получат 429 с retry_after секунд"""
+        self._flood += count
+        self._flood_retry_after = retry_after
+
+    def api_url(self, server_address: str) -> str:
+        """Значение [Telegram ID] api_url для FakeServer с этим приложением"""
+        return f"http://{server_address}/bot"
+
+    @staticmethod
+    def _chat(chat_id) -> dict:
+        """Чат по chat_id запроса: числовой ID или @username канала, как в Bot API"""
+        if isinstance(chat_id, dict):
+            return chat_id
+        if str(chat_id).startswith('@'):
+            return {'id': FakeTelegram.CHANNEL_ID, 'type': 'channel', 'username': str(chat_id)[1:]}
+        return {'id': int(chat_id), 'type': 'private'}
+
+    def _message(self, message_id: int, chat_id, text: str, reply_markup=None) -> dict:
+        message = {
+            'message_id': message_id, 'date': int(time.time()), 'from': self.BOT_USER,
+            'chat': self._chat(chat_id), 'text': text,
+        }
+        if reply_markup:
+            message['reply_markup'] = reply_markup
+        return message
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_for_message(self, predicate: Optional[Callable[[dict], bool]] = None,
+                               start: int = 0, timeout: float = 30) -> dict:
+        """
+        Ждет сообщения (начиная с индекса start в messages), удовлетворяющего predicate.
+        В сообщении есть 'received_at' - time.perf_counter() момента приема.
+        """
+        deadline = time.perf_counter() + timeout
+        async with self._changed:
+            while True:
+                for message in self.messages[start:]:
+                    if predicate is None or predicate(message):
+                        return message
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError("No matching Telegram message")
+                try:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def press_button(self, message_id: int, data: str):
+        """Имитирует нажатие кнопки пользователем"""
+        message = next((m for m in self.messages if m['message_id'] == message_id), None)
+        if message is None:
+            raise KeyError(f"Message {message_id} was not sent")
+        update_id = next(self._update_ids)
+        update = {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id), 'from': self.HUMAN_USER, 'chat_instance': 'fake', 'data': data,
+                'message': {key: value for key, value in message.items() if key not in ('received_at', 'edited_at')},
+            },
+        }
+        if self.webhook_url:
+            await self._deliver_webhook(update)
+            return
+        self._updates.append(update)
+        await self._notify()
+
+    async def _deliver_webhook(self, update: dict):
+        """Доставка обновления веб-хуком (одно постоянное соединение, как у Telegram)"""
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=10, verify=False)
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+        try:
+            response = await self._webhook_client.post(self.webhook_url, json=update, headers=headers)
+            self.webhook_statuses.append(response.status_code)
+        except httpx.HTTPError:
+            self.webhook_statuses.append(0)
+
+    async def aclose(self):
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        # Подтвержденные обновления (update_id < offset) больше не выдаются
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        timeout = min(float(params.get('timeout') or 0), self.MAX_POLL_SECONDS)
+        deadline = time.perf_counter() + timeout
+        async with self._changed:
+            while not self._updates:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+        return list(self._updates)
+
+    async def _call(self, method: str, params: dict):
+        if method == 'getMe':
+            return dict(self.BOT_USER, can_join_groups=False, can_read_all_group_messages=False,
+                        supports_inline_queries=False)
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method == 'setWebhook':
+            self.webhook_url = str(params.get('url') or '') or None
+            secret = params.get('secret_token')
+            self.webhook_secret = str(secret) if secret is not None else None
+            return True
+        if method == 'deleteWebhook':
+            self.webhook_url = self.webhook_secret = None
+            return True
+        if method == 'getWebhookInfo':
+            return {'url': self.webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'sendMessage':
+            message = self._message(next(self._message_ids), params['chat_id'], str(params.get('text', '')),
+                                    params.get('reply_markup'))
+            self.messages.append(dict(message, received_at=time.perf_counter()))
+            await self._notify()
+            return message
+        if method == 'editMessageText':
+            original = next((m for m in self.messages if m['message_id'] == int(params.get('message_id', 0))), None)
+            chat_id = original['chat'] if original else params.get('chat_id', 0)
+            edited = self._message(int(params.get('message_id', 0)), chat_id, str(params.get('text', '')),
+                                   params.get('reply_markup'))
+            if original is not None:
+                # Храним текущее содержимое сообщения, как его видит пользователь
+                original.update(text=edited['text'], reply_markup=edited.get('reply_markup'),
+                                edited_at=time.perf_counter())
+                await self._notify()
+            return edited
+        # answerCallbackQuery, deleteWebhook, setMyCommands и прочие
+        return True
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/bot{token}/{method}")
+        async def bot_api(token: str, method: str, request: Request):
+            self.method_counts[method] = self.method_counts.get(method, 0) + 1
+            if method != 'getUpdates' and await self.faults.apply():
+                return JSONResponse({'ok': False, 'error_code': 500, 'description': 'Injected failure'},
+                                    status_code=500)
+            if method == 'getUpdates' and self.webhook_url:
+                return JSONResponse({'ok': False, 'error_code': 409,
+                                     'description': "Conflict: can't use getUpdates method while webhook is active"},
+                                    status_code=409)
+            if method == 'sendMessage' and self._flood > 0:
+                self._flood -= 1
+                return JSONResponse({'ok': False, 'error_code': 429,
+                                     'description': f"Too Many Requests: retry after {self._flood_retry_after}",
+                                     'parameters': {'retry_after': self._flood_retry_after}},
+                                    status_code=429)
+            # python-telegram-bot передает параметры формой; не строковые значения - в JSON,
+            # поэтому текст вида "123" тоже декодируется и приводится обратно к строке
+            params = {}
+            for key, value in parse_qsl((await request.body()).decode()):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+            return {'ok': True, 'result': await self._call(method, params)}
+
+        return app
+
+
+def _encode_length(length: int) -> bytes:
+    """Кодирует remaining length MQTT (variable byte integer)"""
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return len(data).to_bytes(2, 'big') + data
+
+
+def _topic_matches(pattern: str, topic: str) -> bool:
+    """Проверка топика по фильтру подписки с + и #"""
+    pattern_parts = pattern.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class FakeMqttBroker:
+    """Минимальный MQTT-брокер в текущем event loop (только QoS 0) для имитации zigbee2mqtt"""
+
+    def __init__(self, port: Optional[int] = None):
+        self.port = port or free_port()
+        self.retained: Dict[str, bytes] = {}
+        self.publish_count = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Dict[asyncio.StreamWriter, List[str]] = {}
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, '127.0.0.1', self.port)
+
+    async def stop(self):
+        await self.drop_connections()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def publish(self, topic: str, payload, retain: bool = False):
+        """Публикует сообщение всем подписчикам топика"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.publish_count += 1
+        if retain:
+            self.retained[topic] = payload
+        for writer, filters in list(self._clients.items()):
+            if any(_topic_matches(pattern, topic) for pattern in filters):
+                self._send_publish(writer, topic, payload)
+        await asyncio.sleep(0)
+
+    async def publish_contact(self, topic: str, closed: bool, battery: float = 100, retain: bool = True):
+        """Публикует состояние датчика двери в формате zigbee2mqtt"""
+        payload = {'contact': closed, 'battery': battery, 'linkquality': 120, 'voltage': 3005}
+        await self.publish(topic, json.dumps(payload), retain=retain)
+
+    async def drop_connections(self):
+        """Закрывает все клиентские соединения (имитация перезапуска брокера)"""
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+        await asyncio.sleep(0)
+
+    def _send_publish(self, writer: asyncio.StreamWriter, topic: str, payload: bytes):
+        body = _encode_string(topic) + payload
+        try:
+            writer.write(bytes([0x30]) + _encode_length(len(body)) + body)
+        except Exception:
+            self._clients.pop(writer, None)
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header, await reader.readexactly(length)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients[writer] = []
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                packet_type = header >> 4
+                if packet_type == 1:      # CONNECT
+                    writer.write(b'\x20\x02\x00\x00')
+                elif packet_type == 8:    # SUBSCRIBE
+                    packet_id, position, patterns = body[:2], 2, []
+                    while position < len(body):
+                        size = int.from_bytes(body[position:position + 2], 'big')
+                        patterns.append(body[position + 2:position + 2 + size].decode('utf-8'))
+                        position += 2 + size + 1
+                    self._clients.setdefault(writer, []).extend(patterns)
+                    writer.write(bytes([0x90]) + _encode_length(2 + len(patterns)) + packet_id + bytes(len(patterns)))
+                    for topic, payload in self.retained.items():
+                        if any(_topic_matches(pattern, topic) for pattern in patterns):
+                            self._send_publish(writer, topic, payload)
+                elif packet_type == 10:   # UNSUBSCRIBE
+                    writer.write(b'\xb0\x02' + body[:2])
+                elif packet_type == 3:    # PUBLISH (только QoS 0)
+                    size = int.from_bytes(body[:2], 'big')
+                    topic = body[2:2 + size].decode('utf-8')
+                    await self.publish(topic, body[2 + size:], retain=bool(header & 0x01))
+                elif packet_type == 12:   # PINGREQ
+                    writer.write(b'\xd0\x00')
+                elif packet_type == 14:   # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+async def main_test():
+    """
+    Автономная проверка: поднимает имитацию HA и проверяет REST-клиент
+    и доставку push-событий через HomeAssistantEventStream.
+    """
+    import time
+    from HomeAssistantClient import HomeAssistantClient, HomeAssistantEventStream
+
+    entity_id = 'binary_sensor.big_gate_sensor_opening'
+    fake_ha = FakeHomeAssistant()
+    fake_ha.add_gate(entity_id, closed=True, battery=80)
+
+    async with FakeServer(fake_ha.app) as server:
+        client = HomeAssistantClient(server.address, fake_ha.token)
+        print(f"REST check_gate: {await client.check_gate(entity_id)}")
+
+        fake_ha.add_gate('binary_sensor.small_gate_sensor_opening', closed=False, battery=40)
+        fake_ha.request_count = 0
+        results = await asyncio.gather(client.check_gate(entity_id),
+                                       client.check_gate('binary_sensor.small_gate_sensor_opening'))
+        print(f"Two gates checked concurrently: {results}, HA requests: {fake_ha.request_count}")
+
+        stream = HomeAssistantEventStream(server.address, fake_ha.token, [entity_id, 'sensor.big_gate_sensor_battery'],
+                                          reconnect_delay=0.2)
+        stream.start()
+        await asyncio.wait_for(stream.connected.wait(), 5)
+        print(f"Push snapshot: {stream.gate_status(entity_id)}")
+
+        start = time.perf_counter()
+        await fake_ha.set_state(entity_id, 'on')
+        while stream.gate_status(entity_id)[0] is not False:
+            await stream.wait_changed(timeout=1)
+        print(f"Push latency: {(time.perf_counter() - start) * 1000:.1f} ms -> {stream.gate_status(entity_id)}")
+
+        await fake_ha.drop_connections()
+        await asyncio.sleep(0.05)
+        print(f"Connected after drop: {stream.connected.is_set()}")
+        await asyncio.wait_for(stream.connected.wait(), 5)
+        print(f"Reconnected: {stream.connected.is_set()}")
+
+        await stream.stop()
+        await client.aclose()
+
+    await mqtt_test(entity_id)
+
+
+async def mqtt_test(entity_id):
+    """Проверка MQTT-источника состояния ворот на встроенном брокере"""
+    import time
+    from MqttGateSensor import MqttGateSensor
+
+    topic = 'zigbee2mqtt/big_gate_sensor'
+    async with FakeMqttBroker() as broker:
+        await broker.publish_contact(topic, closed=True, battery=90)
+        sensor = MqttGateSensor('127.0.0.1', {entity_id: topic}, port=broker.port, reconnect_delay=0.2)
+        sensor.start()
+        await asyncio.wait_for(sensor.connected.wait(), 5)
+        while sensor.gate_status(entity_id) is None:
+            await sensor.wait_changed(timeout=1)
+        print(f"MQTT retained state: {sensor.gate_status(entity_id)}")
+
+        start = time.perf_counter()
+        await broker.publish_contact(topic, closed=False, battery=90)
+        while sensor.gate_status(entity_id)[0] is not False:
+            await sensor.wait_changed(timeout=1)
+        print(f"MQTT edge latency: {(time.perf_counter() - start) * 1000:.1f} ms -> {sensor.gate_status(entity_id)}")
+        await sensor.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main_test())
@@ -0,0 +1,525 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: GateMonitorEngine.py
+#
+# Description:
+# One asyncio engine that monitors any number of gates in a single process.
+# Each gate runs its own state machine as a task (poll / push wait -> open
+# timer -> Telegram prompt -> close via relay or wait), while all gates share
+# one Home Assistant connection pool, one optional HA WebSocket subscription
+# and one Telegram bot. While a prompt waits for an answer the sensor is still
+# watched; a gate closed by hand withdraws the prompt instead of triggering
+# the default action.
+#
+# Configuration (gate_check.ini):
+# - Gates are declared as `[Gate <name>]` sections:
+#
+#       [Gate big]
+#       title = big gate
+#       entity = binary_sensor.big_gate_sensor_opening
+#       relay_ip = 192.168.1.200
+#       time_polling = 180
+#       time_to_close = 120
+#       delays = 5, 15, 30
+#       prompt_timeout = 120
+#       default_action = close
+#       battery_limit_1 = 15
+#       battery_limit_2 = 5
+#
+#   relay_ip is optional (without it the gate is watch-only), delays are the
+#   "Wait N minutes" buttons, prompt_timeout is how long to wait for a button
+#   press and default_action (close | continue) is applied when nobody answers.
+#   Battery limits default to [Battery limits]. mqtt_topic is the zigbee2mqtt
+#   topic of the door sensor (used when an [MQTT] section is present).
+#
+# - Without any [Gate ...] section the legacy keys used by GateCheck.py and
+#   GateCheckSmall.py ([HA] *_opening_entity, [Device ID] ip_gate, [Time-outs]
+#   time_polling*/delay_*, [MQTT] big_gate_topic/small_gate_topic) are turned
+#   into the "big" and "small" gates.
+#
+# - An [MQTT] section (host, port, username, password) makes the engine read
+#   the door sensors straight from zigbee2mqtt instead of Home Assistant; the
+#   HA REST API is then used only while the broker is unreachable.
+#
+# - The file is parsed once by AppConfig.py and watched for changes: edited
+#   timeouts, delays and battery limits apply to the running gates without a
+#   restart. Adding/removing gates or changing HA/MQTT settings needs a restart.
+#
+# - An optional [Metrics] section exports the Metrics.py registry (probe, HA,
+#   Shelly and Telegram latency, errors, event-loop lag, gate-open -> alert time):
+#
+#       [Metrics]
+#       port = 9101                  ; GET http://host:9101/metrics
+#       textfile = /var/lib/node_exporter/textfile_collector/{name}.prom
+#       textfile_interval = 15
+#
+#   {name} is replaced by the monitored gate names, so GateCheck.py and
+#   GateCheckSmall.py can share one gate_check.ini; two processes cannot share
+#   one port - the second one logs an error and keeps monitoring without HTTP.
+#
+# Public API:
+# - def load_gate_definitions(config_file, gate_names=None) -> list[GateDefinition]  (from AppConfig)
+# - class MonitorEngine(gates, ha_ip, ha_token, ha_websocket, mqtt=None, config=None)
+# - def run_monitors(gate_names=None)  -> blocking entry point with signal handling
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import logging
+import signal
+import time
+from typing import List, Optional, Tuple
+
+from AppConfig import ConfigError, GateDefinition, GATE_CHECK_INI, gate_check_config, load_gate_definitions
+from ControlSwitch import pulse_shelly_switch, close_shelly_clients
+from HomeAssistantClient import get_ha_client, close_ha_clients, HomeAssistantEventStream, battery_entity_for
+from LoopWatchdog import LoopWatchdog
+from Metrics import ALERT_DELIVERY_SECONDS, GATE_ALERT_SECONDS, PROBE_FAILURES, PROBE_SECONDS, export_metrics
+from MqttGateSensor import MqttGateSensor, load_mqtt_sensor
+from TelegramButtonsGen import (PRIORITY_CRITICAL, PRIORITY_INFO, PRIORITY_NORMAL, Prompt, StatusMessage, send_notice,
+                                send_prompt, start_notifier, stop_notifier)
+
+logger = logging.getLogger("GateCheck")
+
+CONFIG_FILE = GATE_CHECK_INI
+
+# Период опроса датчика через REST, пока оповещение ждет ответа (без push-потока)
+PROMPT_POLL_INTERVAL = 5
+
+
+class GateStateMachine:
+    """Цикл мониторинга одних ворот"""
+
+    def __init__(self, engine: 'MonitorEngine', gate: GateDefinition):
+        self.engine = engine
+        self.gate = gate
+        self.logger = logging.getLogger(f"GateCheck.{gate.name}")
+        self.battery_alert_1_sent = False
+        self.battery_alert_2_sent = False
+        # Когда ворота впервые замечены открытыми (для gatecheck_gate_alert_seconds)
+        self.opened_at: Optional[float] = None
+
+    # --- Чтение состояния ---
+
+    async def read_gate(self) -> Optional[Tuple[bool, float]]:
+        """
+        Текущее состояние ворот: из push-потока HA, если сокет подключен,
+        иначе запросом через REST API
+        """
+        events = self.engine.events
+        if events is not None and events.connected.is_set():
+            status = events.gate_status(self.gate.entity)
+            if status is not None:
+                return status
+        with PROBE_SECONDS.time(probe='check_gate', device=self.gate.name):
+            result = await self.engine.ha_client.check_gate(self.gate.entity)
+        if result is None:
+            PROBE_FAILURES.inc(probe='check_gate', device=self.gate.name)
+        return result
+
+    async def wait_for_gate(self, seconds, target_closed, hold_while_push=False) -> bool:
+        """
+        Ожидание до `seconds` секунд с проверкой запроса на остановку каждую секунду.
+
+        Если push-поток HA подключен, ожидание прерывается, как только датчик
+        перейдет в состояние target_closed. При hold_while_push ожидание с подключенным
+        сокетом не ограничено по времени (опроса нет), прерывается также при изменении
+        заряда батареи, а при обрыве сокета сразу возвращает управление для опроса через REST.
+
+        Returns:
+            True, если ожидание прервано событием от HA
+        """
+        events = self.engine.events
+        start_time = time.monotonic()
+        initial_status = events.gate_status(self.gate.entity) if events is not None else None
+        was_push_active = False
+
+        while not self.engine.shutdown_requested:
+            push_active = events is not None and events.connected.is_set()
+            if push_active:
+                status = events.gate_status(self.gate.entity)
+                if status is not None:
+                    if status[0] == target_closed:
+                        return True
+                    if hold_while_push and initial_status is not None and status[1] != initial_status[1]:
+                        return True
+            elif hold_while_push and was_push_active:
+                self.logger.warning("Home Assistant WebSocket is down. Falling back to polling")
+                return False
+            was_push_active = push_active
+
+            if not (push_active and hold_while_push) and time.monotonic() - start_time >= seconds:
+                return False
+
+            if events is not None:
+                await events.wait_changed(timeout=1)
+            else:
+                await asyncio.sleep(1)
+        return False
+
+    # --- Действия ---
+
+    async def check_battery(self, battery):
+        gate = self.gate
+        if battery < gate.battery_limit_2 and not self.battery_alert_2_sent:
+            self.logger.warning(f"Critical battery level: {battery}%")
+            await self.engine.notify(gate.text('battery_critical', battery=battery, limit=gate.battery_limit_2),
+                                     PRIORITY_NORMAL)
+            self.battery_alert_2_sent = True
+        elif battery < gate.battery_limit_1 and not self.battery_alert_1_sent:
+            self.logger.warning(f"Low battery level: {battery}%")
+            await self.engine.notify(gate.text('battery_low', battery=battery, limit=gate.battery_limit_1))
+            self.battery_alert_1_sent = True
+        elif battery >= gate.battery_limit_1:
+            if self.battery_alert_1_sent or self.battery_alert_2_sent:
+                self.logger.info("Battery level recovered")
+            self.battery_alert_1_sent = False
+            self.battery_alert_2_sent = False
+
+    async def close_gate_and_check(self, status: Optional[StatusMessage] = None) -> bool:
+        """Закрывает ворота реле и ждет подтверждения датчика; ход - в статусном сообщении"""
+        status = status or StatusMessage()
+        self.logger.info("Attempting to close the gate")
+        await pulse_shelly_switch(self.gate.relay_ip)
+
+        start_time = time.time()
+        while time.time() - start_time < self.gate.time_to_close and not self.engine.shutdown_requested:
+            # Poll every 2 seconds (returns early on a push event from HA)
+            await self.wait_for_gate(2, target_closed=True)
+            result = await self.read_gate()
+            if result:
+                gate_closed, _ = result
+                if gate_closed:
+                    # Only report when gate is actually closed after the command
+                    await status.update(f"The {self.gate.title} is closed")
+                    self.logger.info("Gate closed successfully")
+                    return True
+            else:
+                self.logger.error("Failed to check gate state during closing attempt")
+
+        # Тревога: новое сообщение, чтобы Telegram уведомил пользователя
+        await status.update(f"The {self.gate.title} is still open", alert=True, priority=PRIORITY_CRITICAL)
+        self.logger.warning("Gate failed to close within the specified time")
+        return False
+
+    def prompt_buttons(self):
+        """Кнопки оповещения и соответствующие им действия"""
+        actions = []
+        if self.gate.relay_ip:
+            actions.append(("Close gate", ('close', None)))
+        for delay in self.gate.delays:
+            actions.append((self.gate.text('wait_button', delay=delay), ('wait', delay)))
+        actions.append(("Continue polling", ('continue', None)))
+        return actions
+
+    async def watch_until_closed(self) -> bool:
+        """Следит за датчиком до закрытия ворот. False - при запросе на остановку."""
+        while not self.engine.shutdown_requested:
+            if await self.wait_for_gate(PROMPT_POLL_INTERVAL, target_closed=True):
+                return True
+            result = await self.read_gate()
+            if result and result[0]:
+                return True
+        return False
+
+    async def wait_for_choice(self, prompt: Prompt) -> Optional[str]:
+        """
+        Ждет ответа на оповещение, продолжая следить за датчиком. Если ворота
+        закрыли вручную раньше ответа, оповещение снимается (сообщение
+        исправляется) и возвращается None - действие по умолчанию не выполняется.
+        """
+        answer = asyncio.ensure_future(prompt.wait())
+        watcher = asyncio.ensure_future(self.watch_until_closed())
+        try:
+            await asyncio.wait({answer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if not answer.done():
+                answer.cancel()
+        if answer.done() and not answer.cancelled():
+            return answer.result()
+
+        if watcher.done() and not watcher.cancelled() and watcher.result():
+            if await prompt.dismiss(f"The {self.gate.title} was closed before an option was chosen. No action taken."):
+                self.logger.info("Gate closed while waiting for the user's choice. Alert withdrawn")
+                return None
+        else:
+            # Остановка программы: запрос больше не нужен
+            prompt.cancel()
+            return None
+        # Ответ пришел одновременно с закрытием ворот
+        return prompt.result
+
+    async def prompt_and_act(self, battery):
+        gate = self.gate
+        self.logger.warning("Gate is still open. Sending alert with options")
+        message = gate.text('alert', battery=battery)
+        actions = self.prompt_buttons()
+        alert_due = time.monotonic()
+
+        def alert_sent(_message):
+            sent = time.monotonic()
+            labels = {'gate': gate.name, 'alert': 'open_prompt'}
+            if self.opened_at is not None:
+                GATE_ALERT_SECONDS.observe(sent - self.opened_at, **labels)
+            ALERT_DELIVERY_SECONDS.observe(sent - alert_due, **labels)
+
+        prompt = await send_prompt(message, [label for label, _ in actions], gate.prompt_timeout,
+                                   on_sent=alert_sent)
+        choice = await self.wait_for_choice(prompt)
+        if choice is None:
+            return
+        self.logger.info(f"User choice result: {choice}")
+        # Дальнейший ход цикла - изменениями того же сообщения
+        status = StatusMessage.for_prompt(prompt, title=message)
+
+        action = None
+        try:
+            index = int(choice) - 1
+            if 0 <= index < len(actions):
+                action = actions[index][1]
+        except (ValueError, TypeError):
+            pass
+
+        defaulted = action is None
+        if action is None:
+            if gate.default_action == 'close' and gate.relay_ip:
+                self.logger.warning("No user input received, timeout, or error. Defaulting to closing the gate.")
+                action = ('close', None)
+            else:
+                # Никто ничего не выбирал - не пишем "You selected"
+                self.logger.info("No response received. Continuing polling.")
+                await status.update("No option selected, continuing polling.")
+                return
+
+        kind, delay = action
+        if kind == 'close':
+            # Без push-потока датчик читался раз в PROMPT_POLL_INTERVAL: импульс реле переключает
+            # ворота, поэтому уже закрытые ворота он бы открыл
+            result = await self.read_gate()
+            if result and result[0]:
+                self.logger.info("Gate is already closed. Relay pulse skipped")
+                await status.update(f"The {gate.title} is already closed. No action taken.")
+                return
+            if defaulted:
+                await status.update("No option selected, closing gate by default...")
+            else:
+                await status.update("You selected: Close gate. Executing command...")
+            if not await self.close_gate_and_check(status):
+                self.logger.info("Continuing with regular polling after failed closing attempt")
+        elif kind == 'wait':
+            await status.update(f"You selected: Wait {delay} minutes")
+            self.logger.info(f"Waiting for {delay} minutes as per user choice")
+            await self.engine.sleep(delay * 60)
+        else:
+            await status.update("You selected: Continue polling. Resuming normal operation.")
+            self.logger.info("User chose to continue polling. Resuming normal monitoring cycle.")
+
+    # --- Основной цикл ---
+
+    async def run(self):
+        self.logger.info(f"Monitoring {self.gate.title}: {self.gate}")
+        while not self.engine.shutdown_requested:
+            # Берется заново на каждом цикле: перезагрузка конфигурации применяется без перезапуска
+            gate = self.gate
+            try:
+                result = await self.read_gate()
+                if not result:
+                    self.logger.error(f"Failed to read gate state. Retrying in {gate.time_polling} seconds")
+                    await self.engine.sleep(gate.time_polling)
+                    continue
+
+                gate_closed, battery = result
+                self.logger.info(f"Gate state: {'Closed' if gate_closed else 'Open'}, Battery: {battery}%")
+                await self.check_battery(battery)
+
+                if gate_closed:
+                    self.opened_at = None
+                    await self.wait_for_gate(gate.time_polling, target_closed=False, hold_while_push=True)
+                    continue
+
+                if self.opened_at is None:
+                    self.opened_at = time.monotonic()
+
+                self.logger.info(f"Gate is open. Waiting for {gate.time_to_close} seconds before rechecking")
+                if await self.wait_for_gate(gate.time_to_close, target_closed=True):
+                    self.logger.info("Gate is now closed. Continuing regular polling")
+                    continue
+                if self.engine.shutdown_requested:
+                    break
+
+                result = await self.read_gate()
+                if result and result[0]:
+                    self.logger.info("Gate is now closed. Continuing regular polling")
+                    continue
+
+                try:
+                    await self.prompt_and_act(result[1] if result else battery)
+                except Exception as e:
+                    self.logger.error(f"Failed to send gate alert or process user choice: {e}")
+                    if gate.relay_ip and gate.default_action == 'close':
+                        self.logger.info("Defaulting to closing the gate")
+                        await self.engine.notify("Error processing selection, closing gate by default",
+                                                 PRIORITY_NORMAL)
+                        await self.close_gate_and_check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"An unexpected error occurred: {e}")
+                self.logger.info(f"Waiting for {gate.time_polling} seconds before retrying")
+                await self.engine.sleep(gate.time_polling)
+
+
+class MonitorEngine:
+    """Запускает автоматы всех ворот с общим клиентом HA, общим push-потоком и одним ботом"""
+
+    def __init__(self, gates: List[GateDefinition], ha_ip: str, ha_token: str, ha_websocket: bool = False,
+                 mqtt: Optional[MqttGateSensor] = None, config=None):
+        self.gates = gates
+        # ConfigWatcher gate_check.ini: при изменении файла параметры ворот обновляются на лету
+        self.config = config
+        self.ha_client = get_ha_client(ha_ip, ha_token)
+        # Push-источник состояния: MQTT напрямую от zigbee2mqtt или WebSocket HA
+        self.events = mqtt
+        if self.events is None and ha_websocket:
+            entities = set()
+            for gate in gates:
+                entities.update((gate.entity, battery_entity_for(gate.entity)))
+            self.events = HomeAssistantEventStream(ha_ip, ha_token, entities)
+        self.shutdown_requested = False
+        self.machines = [GateStateMachine(self, gate) for gate in gates]
+
+    def request_shutdown(self):
+        self.shutdown_requested = True
+
+    def apply_config(self, new_config):
+        """Применяет перезагруженный gate_check.ini к работающим автоматам"""
+        new_gates = {gate.name: gate for gate in new_config.gates}
+        for machine in self.machines:
+            gate = new_gates.get(machine.gate.name)
+            if machine.gate.name in new_config.gate_errors:
+                logger.error(f"{new_config.gate_errors[machine.gate.name]}; keeping the previous settings")
+            elif gate is None:
+                logger.warning(f"Gate '{machine.gate.name}' was removed from the configuration; "
+                               f"restart to stop monitoring it")
+            elif gate != machine.gate:
+                logger.info(f"Gate '{gate.name}' settings updated: {gate}")
+                machine.gate = gate
+        added = set(new_gates) - {machine.gate.name for machine in self.machines}
+        if added:
+            logger.warning(f"New gates {sorted(added)} require a restart to be monitored")
+
+    async def sleep(self, seconds):
+        """Пауза, прерываемая запросом на остановку (проверка каждую секунду)"""
+        for _ in range(int(seconds)):
+            if self.shutdown_requested:
+                break
+            await asyncio.sleep(1)
+
+    async def notify(self, text, priority=PRIORITY_INFO):
+        """
+        Сообщение в Telegram без кнопок. Ставится в исходящую очередь и не ждет
+        отправки: информационные объединяются, важные уходят раньше.
+        """
+        try:
+            send_notice(text, priority)
+        except Exception as e:
+            logger.error(f"Failed to send notification: {e}")
+
+    async def run(self):
+        logger.info(f"Starting gate monitor engine for {len(self.gates)} gate(s): "
+                    f"{', '.join(gate.name for gate in self.gates)}")
+        if await self.ha_client.test_connection():
+            logger.info(f"Successfully connected to Home Assistant at {self.ha_client.ha_url}")
+        else:
+            logger.error(f"Failed to connect to Home Assistant at {self.ha_client.ha_url}")
+        # Бот запускается один раз и работает до выхода из программы
+        await start_notifier()
+        if self.events is not None:
+            self.events.start()
+            if isinstance(self.events, MqttGateSensor):
+                logger.info(f"MQTT push mode enabled (broker {self.events.host}:{self.events.port})")
+            else:
+                logger.info("Home Assistant push mode enabled (WebSocket state_changed subscription)")
+
+        tasks = [asyncio.create_task(machine.run(), name=f"gate-{machine.gate.name}") for machine in self.machines]
+        metrics_config = self.config.current.metrics if self.config is not None else None
+        exporter = asyncio.create_task(export_metrics(metrics_config, '-'.join(gate.name for gate in self.gates)))
+        # Стек блокирующего кода в лог при зависании event loop
+        loop_watchdog = LoopWatchdog()
+        loop_watchdog.start()
+        watcher = None
+        if self.config is not None:
+            self.config.add_listener(self.apply_config)
+            watcher = asyncio.create_task(self.config.watch())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            exporter.cancel()
+            if watcher is not None:
+                watcher.cancel()
+                self.config.remove_listener(self.apply_config)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, exporter, return_exceptions=True)
+            await loop_watchdog.stop()
+            try:
+                logger.info("Cleaning up Telegram bot...")
+                await stop_notifier()
+                logger.info("Telegram bot cleanup completed")
+            except Exception as e:
+                logger.error(f"Error during bot cleanup: {e}")
+            if self.events is not None:
+                await self.events.stop()
+            await close_ha_clients()
+            await close_shelly_clients()
+
+
+def create_engine(gate_names=None, config_file=CONFIG_FILE) -> MonitorEngine:
+    """Создает движок по gate_check.ini; gate_names ограничивает набор ворот"""
+    config = gate_check_config(config_file)
+    gates = load_gate_definitions(config_file, gate_names)
+
+    ha = config.current.ha
+    if ha is None or not ha.ip or not ha.token:
+        raise ConfigError("Ошибка конфигурации HA: HA_IP и HA_TOKEN обязательны")
+
+    mqtt = None
+    if config.current.mqtt is not None:
+        # MQTT используется, только если топик задан для всех ворот: иначе ожидание
+        # без опроса никогда не увидит ворота без топика
+        if all(gate.mqtt_topic for gate in gates):
+            mqtt = load_mqtt_sensor(config.current.mqtt, {gate.entity: gate.mqtt_topic for gate in gates})
+        else:
+            logger.warning("[MQTT] is configured but not every gate has an MQTT topic; using Home Assistant")
+    return MonitorEngine(gates, ha.ip, ha.token, ha.websocket, mqtt, config)
+
+
+def run_monitors(gate_names=None):
+    """Точка входа: запускает мониторинг указанных (или всех) ворот до SIGINT/SIGTERM"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        engine = create_engine(gate_names)
+    except ConfigError as e:
+        logger.error(f"Configuration error: {e}")
+        return
+
+    def handle_shutdown(signum, frame):
+        logger.info(f"Received signal {signum}. Initiating graceful shutdown...")
+        engine.request_shutdown()
+
+    signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGTERM, handle_shutdown)
+
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        logger.info("Keyboard interrupt received. Shutting down...")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+    finally:
+        logger.info("Gate monitor has shut down.")
+
+
+if __name__ == "__main__":
+    run_monitors()
@@ -0,0 +1,461 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: HomeAssistantClient.py
+#
+# Description:
+# Shared asynchronous client for the Home Assistant REST API used by
+# GateCheck.py, GateCheckSmall.py and Online_check_web.py.
+#
+# Design Philosophy:
+# - One httpx.AsyncClient per (HA address, token) with a keep-alive connection
+#   pool, so repeated checks reuse the same TCP connection instead of paying a
+#   handshake for every request.
+# - All calls are coroutines and never block the host application's event loop.
+# - Gate and battery states are read with a single /api/states request indexed
+#   by entity_id; concurrent callers (e.g. BigGate and SmallGate in the same
+#   dashboard cycle) share one in-flight request, so HA load per cycle stays
+#   flat as sensors are added.
+# - Clients are obtained through `get_ha_client()` and live for the whole
+#   process; `close_ha_clients()` is called by the host application on exit.
+# - Request latency and failures are recorded in Metrics.py
+#   (gatecheck_ha_request_duration_seconds, gatecheck_ha_errors_total).
+#
+# Public API:
+# - class HomeAssistantClient
+#   - async get_entity_state(entity_id) -> dict | None
+#   - async get_states() -> {entity_id: state} | None  (one /api/states call)
+#   - async get_gates_status(opening_entity_ids) -> {entity_id: (gate_closed, battery_level)}
+#   - async get_gate_status(opening_entity_id) -> (gate_closed, battery_level)
+#   - async check_gate(opening_entity_id) -> (gate_closed, battery_level) | None
+#   - async test_connection() -> bool
+# - class HomeAssistantEventStream
+#   - Push updates for selected entities over the HA WebSocket API
+#     (`state_changed` events) with automatic reconnect.
+# - def get_ha_client(ha_ip, ha_token) -> HomeAssistantClient
+# - async def close_ha_clients()
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from Metrics import HA_ERRORS, HA_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Заголовки, запрещающие кэширование ответов HA промежуточными прокси
+NO_CACHE_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0'
+}
+
+
+def ha_address(ha_ip: str) -> str:
+    """Адрес HA в виде host:port; порт 8123 добавляется, если не указан в HA_IP"""
+    return ha_ip if ':' in ha_ip else f"{ha_ip}:8123"
+
+
+def battery_entity_for(opening_entity_id: str) -> str:
+    """
+    Формирует entity ID батареи, заменяя "opening" на "battery"
+    и "binary_sensor" на "sensor"
+    """
+    return opening_entity_id.replace("_opening", "_battery").replace("binary_sensor.", "sensor.")
+
+
+def parse_gate_closed(entity_id: str, state: Optional[str]) -> Optional[bool]:
+    """Преобразует состояние binary_sensor в gate_closed (None при неизвестном состоянии)"""
+    state = (state or '').lower()
+    if state == 'on':
+        return False  # Ворота открыты
+    if state == 'off':
+        return True   # Ворота закрыты
+    logger.warning(f"Неожиданное состояние датчика {entity_id}: '{state}'")
+    return None
+
+
+def parse_battery_level(entity_id: str, state) -> Optional[float]:
+    """Преобразует состояние датчика батареи в процент заряда"""
+    try:
+        return float(state if state is not None else 0)
+    except (ValueError, TypeError):
+        logger.warning(f"Некорректное значение батареи для {entity_id}: {state}")
+        return None
+
+
+class HomeAssistantClient:
+    """Асинхронный клиент Home Assistant API с пулом keep-alive соединений"""
+
+    def __init__(self, ha_ip: str, ha_token: str, timeout: int = 10):
+        """
+        Инициализация подключения к Home Assistant
+
+        Args:
+            ha_ip: IP адрес Home Assistant
+            ha_token: Long-lived access token
+            timeout: Таймаут запросов в секундах
+        """
+        self.ha_ip = ha_ip
+        self.ha_url = f"http://{ha_address(ha_ip)}"
+        self.headers = {
+            "Authorization": f"Bearer {ha_token}",
+            "Content-Type": "application/json",
+        }
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._states_request: Optional[asyncio.Future] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Лениво создает httpx.AsyncClient, соединения которого переиспользуются между запросами"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.ha_url,
+                headers={**self.headers, **NO_CACHE_HEADERS},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60),
+            )
+        return self._client
+
+    async def get_entity_state(self, entity_id: str) -> Optional[dict]:
+        """Получение состояния entity"""
+        try:
+            timestamp = int(time.time() * 1000)
+            with HA_REQUEST_SECONDS.time(operation='entity_state'):
+                response = await self._get_client().get(f"/api/states/{entity_id}", params={'_': timestamp})
+
+            if response.status_code == 200:
+                return response.json()
+            else:
+                HA_ERRORS.inc(operation='entity_state')
+                logger.error(f"Ошибка получения данных с {entity_id}: HTTP {response.status_code}")
+                return None
+
+        except Exception as e:
+            HA_ERRORS.inc(operation='entity_state')
+            logger.error(f"Ошибка подключения для {entity_id}: {e}")
+            return None
+
+    async def get_states(self) -> Optional[Dict[str, dict]]:
+        """
+        Получение состояний всех entity одним запросом /api/states
+
+        Одновременные вызовы разделяют один запрос к HA.
+
+        Returns:
+            Словарь {entity_id: state} или None при ошибке
+        """
+        if self._states_request is None:
+            self._states_request = asyncio.ensure_future(self._fetch_states())
+            self._states_request.add_done_callback(self._clear_states_request)
+        # shield: отмена одного из ожидающих не отменяет запрос для остальных
+        return await asyncio.shield(self._states_request)
+
+    def _clear_states_request(self, request: asyncio.Future):
+        if self._states_request is request:
+            self._states_request = None
+
+    async def _fetch_states(self) -> Optional[Dict[str, dict]]:
+        try:
+            timestamp = int(time.time() * 1000)
+            with HA_REQUEST_SECONDS.time(operation='states'):
+                response = await self._get_client().get("/api/states", params={'_': timestamp})
+
+            if response.status_code == 200:
+                return {state['entity_id']: state for state in response.json()}
+            else:
+                HA_ERRORS.inc(operation='states')
+                logger.error(f"Ошибка получения состояний HA: HTTP {response.status_code}")
+                return None
+
+        except Exception as e:
+            HA_ERRORS.inc(operation='states')
+            logger.error(f"Ошибка подключения к HA при получении состояний: {e}")
+            return None
+
+    async def get_gates_status(self, opening_entity_ids) -> Dict[str, Tuple[Optional[bool], Optional[float]]]:
+        """
+        Получение состояния нескольких датчиков ворот одним запросом
+
+        Args:
+            opening_entity_ids: Entity ID датчиков открытия
+
+        Returns:
+            Словарь {opening_entity_id: (gate_closed, battery_level)}, значения как в get_gate_status
+        """
+        states = await self.get_states()
+        result = {}
+        for opening_entity_id in opening_entity_ids:
+            if states is None:
+                result[opening_entity_id] = (None, None)
+                continue
+
+            battery_entity_id = battery_entity_for(opening_entity_id)
+            opening_data = states.get(opening_entity_id)
+            battery_data = states.get(battery_entity_id)
+
+            gate_closed = None
+            if opening_data:
+                gate_closed = parse_gate_closed(opening_entity_id, opening_data.get('state'))
+            else:
+                logger.error(f"Не удалось получить состояние датчика {opening_entity_id}")
+
+            battery_level = None
+            if battery_data:
+                battery_level = parse_battery_level(battery_entity_id, battery_data.get('state', 0))
+            else:
+                logger.error(f"Не удалось получить заряд батареи {battery_entity_id}")
+
+            result[opening_entity_id] = (gate_closed, battery_level)
+        return result
+
+    async def get_gate_status(self, opening_entity_id: str) -> Tuple[Optional[bool], Optional[float]]:
+        """
+        Получение состояния датчика ворот
+
+        Args:
+            opening_entity_id: Полный Entity ID датчика открытия
+
+        Returns:
+            Tuple (gate_closed, battery_level):
+            - gate_closed: True если закрыто, False если открыто, None при ошибке
+            - battery_level: процент заряда батареи или None при ошибке
+        """
+        return (await self.get_gates_status([opening_entity_id]))[opening_entity_id]
+
+    async def check_gate(self, opening_entity_id: str) -> Optional[Tuple[bool, float]]:
+        """
+        Проверка состояния ворот
+
+        Returns:
+            Tuple (gate_closed, battery_level) или None при ошибке
+        """
+        gate_closed, battery_level = await self.get_gate_status(opening_entity_id)
+        if gate_closed is not None and battery_level is not None:
+            return gate_closed, battery_level
+        return None
+
+    async def test_connection(self) -> bool:
+        """Проверка подключения к Home Assistant"""
+        try:
+            response = await self._get_client().get("/api/")
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    async def aclose(self):
+        """Закрывает пул соединений"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+class HomeAssistantEventStream:
+    """
+    Подписка на события state_changed через WebSocket API Home Assistant.
+
+    Хранит последнее известное состояние отслеживаемых entity и будит ожидающие
+    корутины при каждом изменении. При обрыве соединения переподключается
+    с экспоненциальной задержкой; пока сокет недоступен, `connected` сброшен
+    и хост-приложение должно перейти на опрос через REST.
+    """
+
+    def __init__(self, ha_ip: str, ha_token: str, entity_ids, ws_url: Optional[str] = None,
+                 reconnect_delay: float = 5, max_reconnect_delay: float = 60):
+        """
+        Args:
+            ha_ip: IP адрес Home Assistant
+            ha_token: Long-lived access token
+            entity_ids: Entity ID, изменения которых нужно отслеживать
+            ws_url: Полный адрес WebSocket API (по умолчанию ws://<HA>/api/websocket)
+            reconnect_delay: Начальная задержка перед переподключением в секундах
+            max_reconnect_delay: Максимальная задержка перед переподключением в секундах
+        """
+        self.ws_url = ws_url or f"ws://{ha_address(ha_ip)}/api/websocket"
+        self.ha_token = ha_token
+        self.entity_ids = set(entity_ids)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.states: Dict[str, dict] = {}
+        self.connected = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._next_id = 1
+        self._get_states_id = None
+
+    def start(self) -> asyncio.Task:
+        """Запускает фоновую задачу подписки"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Останавливает подписку и закрывает сокет"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected.clear()
+
+    async def run(self):
+        """Основной цикл: подключение, аутентификация, подписка и чтение событий"""
+        import websockets
+
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, max_size=None, ping_interval=20, ping_timeout=20) as ws:
+                    await self._authenticate(ws)
+                    await self._subscribe(ws)
+                    logger.info(f"Подписка на события Home Assistant установлена: {self.ws_url}")
+                    delay = self.reconnect_delay
+                    async for raw in ws:
+                        await self._handle_message(json.loads(raw))
+                    logger.warning("WebSocket Home Assistant закрыт сервером")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                HA_ERRORS.inc(operation='websocket')
+                logger.warning(f"Ошибка WebSocket Home Assistant: {e}")
+            finally:
+                if self.connected.is_set():
+                    self.connected.clear()
+                    await self._notify()
+
+            logger.info(f"Переподключение к WebSocket Home Assistant через {delay} сек")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _authenticate(self, ws):
+        message = json.loads(await ws.recv())
+        if message.get('type') != 'auth_required':
+            raise ConnectionError(f"Unexpected handshake message: {message.get('type')}")
+        await ws.send(json.dumps({'type': 'auth', 'access_token': self.ha_token}))
+        message = json.loads(await ws.recv())
+        if message.get('type') != 'auth_ok':
+            raise ConnectionError(f"Authentication failed: {message.get('message', message.get('type'))}")
+
+    async def _subscribe(self, ws):
+        # Сначала подписка, затем снимок состояний - так не теряются изменения между ними
+        await ws.send(json.dumps({'id': self._take_id(), 'type': 'subscribe_events', 'event_type': 'state_changed'}))
+        self._get_states_id = self._take_id()
+        await ws.send(json.dumps({'id': self._get_states_id, 'type': 'get_states'}))
+
+    def _take_id(self) -> int:
+        message_id = self._next_id
+        self._next_id += 1
+        return message_id
+
+    async def _handle_message(self, message: dict):
+        message_type = message.get('type')
+        if message_type == 'event':
+            data = message.get('event', {}).get('data', {})
+            entity_id = data.get('entity_id')
+            if entity_id in self.entity_ids and data.get('new_state') is not None:
+                self.states[entity_id] = data['new_state']
+                await self._notify()
+        elif message_type == 'result':
+            if not message.get('success', False):
+                raise ConnectionError(f"Command {message.get('id')} failed: {message.get('error')}")
+            if message.get('id') == self._get_states_id:
+                for state in message.get('result') or []:
+                    if state.get('entity_id') in self.entity_ids:
+                        self.states[state['entity_id']] = state
+                self.connected.set()
+                await self._notify()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_changed(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждет следующего изменения состояния или статуса подключения.
+
+        Returns:
+            True при изменении, False по истечении timeout
+        """
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def gate_status(self, opening_entity_id: str) -> Optional[Tuple[bool, float]]:
+        """
+        Состояние ворот по последним полученным событиям
+
+        Returns:
+            Tuple (gate_closed, battery_level) или None, если данных нет
+        """
+        battery_entity_id = battery_entity_for(opening_entity_id)
+        opening_state = self.states.get(opening_entity_id)
+        battery_state = self.states.get(battery_entity_id)
+        if opening_state is None or battery_state is None:
+            return None
+        gate_closed = parse_gate_closed(opening_entity_id, opening_state.get('state'))
+        battery_level = parse_battery_level(battery_entity_id, battery_state.get('state', 0))
+        if gate_closed is None or battery_level is None:
+            return None
+        return gate_closed, battery_level
+
+
+# --- ОБЩИЙ РЕЕСТР КЛИЕНТОВ ---
+# Один клиент на (адрес HA, токен) на весь процесс
+_clients: Dict[Tuple[str, str], HomeAssistantClient] = {}
+
+
+def get_ha_client(ha_ip: str, ha_token: str) -> HomeAssistantClient:
+    """Возвращает общий клиент HA для указанного адреса и токена, создавая его при первом вызове"""
+    key = (ha_ip, ha_token)
+    client = _clients.get(key)
+    if client is None:
+        client = HomeAssistantClient(ha_ip, ha_token)
+        _clients[key] = client
+    return client
+
+
+async def close_ha_clients():
+    """Закрывает все открытые клиенты HA. Вызывается хост-приложением при выходе."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing Home Assistant client {client.ha_url}: {e}")
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+async def main_test():
+    """
+    Автономная проверка модуля: читает gate_check.ini и выводит состояние обоих ворот.
+    """
+    import configparser
+    config = configparser.ConfigParser()
+    config.read('gate_check.ini')
+    ha_ip = config.get('HA', 'HA_IP').strip('"')
+    ha_token = config.get('HA', 'HA_TOKEN').strip('"')
+    client = get_ha_client(ha_ip, ha_token)
+    try:
+        print(f"Connection: {await client.test_connection()}")
+        for option in ('big_gate_opening_entity', 'small_gate_opening_entity'):
+            if config.has_option('HA', option):
+                entity_id = config.get('HA', option).strip('"')
+                print(f"{entity_id}: {await client.check_gate(entity_id)}")
+    finally:
+        await close_ha_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_test())
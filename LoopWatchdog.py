@@ -0,0 +1,161 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: LoopWatchdog.py
+#
+# Description:
+# Event-loop lag watchdog for the long-running monitors (Online_check_web.py,
+# GateCheck.py, GateCheckSmall.py). It measures asyncio scheduling lag
+# continuously and, when the loop is blocked longer than a threshold, logs the
+# stack of the code that is blocking it, so loop blockers (synchronous HTTP,
+# time.sleep, blocking file I/O) can be found and removed.
+#
+# Design Philosophy:
+# - Two halves:
+#   * a heartbeat coroutine on the loop that sleeps for `interval` and records
+#     how late it woke up (gatecheck_event_loop_lag_seconds and its histogram);
+#   * a daemon thread that notices a missing heartbeat WHILE the loop is still
+#     blocked and captures the loop thread's current frame with
+#     sys._current_frames(). Only a thread can do this: once the loop runs
+#     again the offending stack is gone.
+# - One stack dump per stall (not one per check), so a long stall does not
+#   flood device_status.log. The stall length is known when the heartbeat
+#   resumes and is reported through Metrics.py (gatecheck_event_loop_stalls_total,
+#   gatecheck_event_loop_stall_seconds) and one summary log line.
+# - Pure standard library; the thread only reads, it never touches loop state.
+#
+# Public API:
+# - class LoopWatchdog(threshold=LOOP_STALL_THRESHOLD, interval=LOOP_LAG_INTERVAL)
+#   - start()       (from a running loop; starts the heartbeat task and the thread)
+#   - async stop()
+#   - stalls        (number of stalls detected)
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from Metrics import LOOP_LAG, LOOP_LAG_INTERVAL, LOOP_LAG_SECONDS, LOOP_STALL_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+LOOP_STALL_THRESHOLD = 0.25   # Блокировка event loop дольше этого считается зависанием (сек)
+STACK_LIMIT = 25              # Сколько кадров стека выводить в лог
+
+
+class LoopWatchdog:
+    """Измеряет задержку event loop и выводит стек блокирующего кода при зависании"""
+
+    def __init__(self, threshold: float = LOOP_STALL_THRESHOLD, interval: float = LOOP_LAG_INTERVAL):
+        """
+        Args:
+            threshold: Порог зависания в секундах
+            interval: Период heartbeat в секундах
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # Момент (time.monotonic), к которому ожидается следующий heartbeat, и его номер
+        self._beat_due = 0.0
+        self._beat = 0
+        self._dumped_beat = -1
+
+    def start(self):
+        """Запускает heartbeat в текущем event loop и поток наблюдения"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._beat_due = time.monotonic() + self.interval
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._beat_due = time.monotonic() + self.interval
+            self._beat += 1
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                LOOP_STALLS.inc()
+                LOOP_STALL_SECONDS.observe(lag)
+                logger.warning(f"Event loop was blocked for {lag:.3f}s (threshold {self.threshold}s)")
+
+    def _watch(self):
+        """Поток: пока event loop заблокирован, снимает стек его потока"""
+        check_every = max(self.threshold / 4, 0.01)
+        while not self._stopped.wait(check_every):
+            # Сначала номер, затем срок: при гонке с heartbeat срок окажется новым и дамп не снимется
+            beat = self._beat
+            blocked_for = time.monotonic() - self._beat_due
+            if blocked_for < self.threshold or beat == self._dumped_beat:
+                continue
+            self._dumped_beat = beat
+            self._dump_stack(blocked_for)
+
+    def _dump_stack(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+        task_name = None
+        try:
+            # Только чтение: имя задачи, выполняющейся в заблокированном loop
+            task = asyncio.current_task(self._loop)
+            task_name = task.get_name() if task is not None else None
+        except Exception:
+            pass
+        logger.warning(
+            f"Event loop blocked for {blocked_for:.3f}s so far "
+            f"(task: {task_name or 'callback, not a task'}). Blocking stack:\n{stack}"
+        )
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+async def main_test():
+    watchdog = LoopWatchdog(threshold=0.2, interval=0.05)
+    watchdog.start()
+    await asyncio.sleep(0.2)
+
+    async def blocking_coroutine():
+        time.sleep(0.5)  # намеренная блокировка: стек должен указать на эту строку
+
+    await asyncio.create_task(blocking_coroutine(), name="blocking-example")
+    await asyncio.sleep(0.2)
+    await watchdog.stop()
+    print(f"Stalls detected: {watchdog.stalls}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main_test())
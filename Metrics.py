@@ -0,0 +1,421 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: Metrics.py
+#
+# Description:
+# In-process instrumentation for all programs: counters, gauges and latency
+# histograms rendered in the Prometheus text exposition format (version 0.0.4).
+# Online_check_web.py serves them on GET /metrics; GateMonitorEngine.py
+# (GateCheck.py / GateCheckSmall.py) exports them through a tiny HTTP listener
+# and/or a node_exporter textfile, configured in the [Metrics] section of
+# gate_check.ini.
+#
+# Design Philosophy:
+# - No client library: the format is a few lines of text, and the monitors
+#   must keep running on a bare Raspberry Pi install.
+# - Metric objects are module-level singletons shared by every module, so
+#   HomeAssistantClient, ControlSwitch and TelegramButtonsGen record into the
+#   same registry regardless of which program imported them.
+# - Recording is a dictionary update under a lock: cheap enough for the probe
+#   hot path and safe for the few synchronous helpers that run in threads.
+# - Labels are kept low-cardinality (probe type, device name, gate, operation).
+#
+# Public API:
+# - class Counter(name, documentation, labelnames=())     - inc(amount=1, **labels)
+# - class Gauge(name, documentation, labelnames=(), function=None) - set(value, **labels)
+# - class Histogram(name, documentation, labelnames=(), buckets=...)
+#   - observe(value, **labels), time(**labels) -> context manager
+# - def render() -> str                 (whole registry in text format)
+# - async def serve_metrics(host, port) -> asyncio.Server
+# - def write_textfile(path)            (atomic write for the node_exporter textfile collector)
+# - async def export_metrics(metrics_config, name) (starts whatever [Metrics] configures)
+# - Shared metrics: PROBE_SECONDS, PROBE_FAILURES, HA_REQUEST_SECONDS, HA_ERRORS,
+#   SHELLY_SECONDS, SHELLY_ERRORS, TELEGRAM_SEND_SECONDS, TELEGRAM_ERRORS,
+#   TELEGRAM_PROMPTS, TELEGRAM_RETRIES, TELEGRAM_COALESCED, TELEGRAM_QUEUE,
+#   GATE_ALERT_SECONDS, ALERT_DELIVERY_SECONDS, LOOP_LAG, LOOP_LAG_SECONDS,
+#   LOOP_STALLS, LOOP_STALL_SECONDS (loop metrics are recorded by LoopWatchdog.py)
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы бакетов по умолчанию: от миллисекунд (ICMP, MQTT) до таймаутов HA/Telegram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Оповещение об открытых воротах включает time_to_close, поэтому шкала в минутах
+ALERT_BUCKETS = (5, 15, 30, 60, 120, 180, 300, 600, 1200, 1800, 3600)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG_INTERVAL = 0.5       # Период измерения задержки event loop (сек), см. LoopWatchdog.py
+TEXTFILE_INTERVAL = 15        # Период перезаписи textfile по умолчанию (сек)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, метки и регистрация в реестре"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Строки сэмплов без заголовков HELP/TYPE"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик (имя должно оканчиваться на _total)"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Текущее значение; без меток может вычисляться функцией при каждом чтении"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function: Optional[Callable[[], float]] = None,
+                 registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        self._function = function
+
+    def value(self, **labels) -> Optional[float]:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels))
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                yield f"{self.name} {_format_value(self._function())}"
+            except Exception as e:
+                logger.warning(f"Cannot evaluate gauge {self.name}: {e}")
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по фиксированным бакетам"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # ключ меток -> [счетчики бакетов..., сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет длительность блока with (в том числе прерванного исключением или отменой)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0
+
+    def sum(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-2] if state else 0.0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(float(bound))),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, (("le", "+Inf"),))
+            yield f"{self.name}_bucket{labels} {state[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return REGISTRY.render()
+
+
+# --- ОБЩИЕ МЕТРИКИ ---
+
+PROBE_SECONDS = Histogram(
+    "gatecheck_probe_duration_seconds",
+    "Duration of one device probe (check_gate for gate sensors, ICMP or subprocess ping for hosts)",
+    ["probe", "device"])
+PROBE_FAILURES = Counter(
+    "gatecheck_probe_failures_total",
+    "Probes that found the device offline, failed or timed out",
+    ["probe", "device"])
+HA_REQUEST_SECONDS = Histogram(
+    "gatecheck_ha_request_duration_seconds",
+    "Duration of Home Assistant REST requests",
+    ["operation"])
+HA_ERRORS = Counter(
+    "gatecheck_ha_errors_total",
+    "Home Assistant request failures (HTTP errors, connection errors, WebSocket drops)",
+    ["operation"])
+SHELLY_SECONDS = Histogram(
+    "gatecheck_shelly_command_duration_seconds",
+    "Duration of Shelly relay commands",
+    ["command"])
+SHELLY_ERRORS = Counter(
+    "gatecheck_shelly_errors_total",
+    "Shelly relay commands that failed or were not confirmed",
+    ["command"])
+TELEGRAM_SEND_SECONDS = Histogram(
+    "gatecheck_telegram_send_duration_seconds",
+    "Duration of the Telegram sendMessage call (without waiting for a button press)",
+    ["kind"])
+TELEGRAM_ERRORS = Counter(
+    "gatecheck_telegram_errors_total",
+    "Telegram failures (send errors, bot start failures, failed health checks)",
+    ["operation"])
+TELEGRAM_PROMPTS = Counter(
+    "gatecheck_telegram_prompts_total",
+    "Button prompts by outcome",
+    ["result"])
+TELEGRAM_RETRIES = Counter(
+    "gatecheck_telegram_retries_total",
+    "Telegram sends retried by the outbound queue (flood limit or network error)",
+    ["reason"])
+TELEGRAM_COALESCED = Counter(
+    "gatecheck_telegram_coalesced_messages_total",
+    "Informational messages merged into another outbound message")
+TELEGRAM_QUEUE = Gauge(
+    "gatecheck_telegram_queue_length",
+    "Messages waiting in the outbound Telegram queue")
+GATE_ALERT_SECONDS = Histogram(
+    "gatecheck_gate_alert_seconds",
+    "Time from the gate being seen open to the alert being delivered to Telegram "
+    "(includes the configured time_to_close)",
+    ["gate", "alert"], buckets=ALERT_BUCKETS)
+ALERT_DELIVERY_SECONDS = Histogram(
+    "gatecheck_alert_delivery_seconds",
+    "Time from an alert becoming due to Telegram accepting the message",
+    ["gate", "alert"])
+LOOP_LAG = Gauge(
+    "gatecheck_event_loop_lag_seconds",
+    "Last measured asyncio event-loop scheduling lag")
+LOOP_LAG_SECONDS = Histogram(
+    "gatecheck_event_loop_lag_distribution_seconds",
+    "Distribution of asyncio event-loop scheduling lag",
+    buckets=LOOP_LAG_BUCKETS)
+LOOP_STALLS = Counter(
+    "gatecheck_event_loop_stalls_total",
+    "Times the asyncio event loop was blocked longer than the watchdog threshold")
+LOOP_STALL_SECONDS = Histogram(
+    "gatecheck_event_loop_stall_seconds",
+    "Duration of event-loop stalls above the watchdog threshold",
+    buckets=LOOP_LAG_BUCKETS)
+
+
+# --- ЭКСПОРТ ДЛЯ ПРОГРАММ БЕЗ ВЕБ-СЕРВЕРА ---
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запроса не нужны, но их нужно дочитать до пустой строки
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body, content_type = "200 OK", render().encode(), CONTENT_TYPE
+        else:
+            status, body, content_type = "404 Not Found", b"Not found\n", "text/plain"
+        writer.write(
+            f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.Server:
+    """Минимальный HTTP-сервер, отдающий GET /metrics"""
+    return await asyncio.start_server(_handle_http, host, port)
+
+
+def write_textfile(path: str):
+    """Атомарно записывает метрики в файл для textfile collector node_exporter"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+async def _textfile_loop(path: str, interval: float):
+    while True:
+        try:
+            await asyncio.to_thread(write_textfile, path)
+        except OSError as e:
+            logger.warning(f"Cannot write metrics textfile {path}: {e}")
+        await asyncio.sleep(interval)
+
+
+async def export_metrics(metrics_config, name: str = "gatecheck"):
+    """
+    Запускает экспорт по секции [Metrics] и работает до отмены.
+
+    Args:
+        metrics_config: AppConfig.MetricsConfig или None (экспорт не настроен)
+        name: Подставляется вместо {name} в пути textfile, чтобы несколько
+              процессов не перезаписывали один файл
+    """
+    tasks = []
+    server = None
+    try:
+        if metrics_config is not None:
+            if metrics_config.port:
+                try:
+                    server = await serve_metrics(metrics_config.host, metrics_config.port)
+                    logger.info(f"Metrics available at http://{metrics_config.host}:{metrics_config.port}/metrics")
+                except OSError as e:
+                    # Порт занят (например, второй процесс мониторинга) - мониторинг продолжается без HTTP
+                    logger.error(f"Cannot listen for metrics on {metrics_config.host}:{metrics_config.port}: {e}")
+            if metrics_config.textfile:
+                path = metrics_config.textfile.replace("{name}", name)
+                logger.info(f"Writing metrics to {path} every {metrics_config.textfile_interval} seconds")
+                tasks.append(asyncio.create_task(_textfile_loop(path, metrics_config.textfile_interval)))
+        # Без экспорта задача просто ждет отмены вместе с движком
+        await asyncio.gather(*tasks, asyncio.get_running_loop().create_future())
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+async def main_test():
+    for _ in range(20):
+        with PROBE_SECONDS.time(probe="ping", device="test"):
+            await asyncio.sleep(0.01)
+    HA_ERRORS.inc(operation="states")
+    print(render())
+
+
+if __name__ == "__main__":
+    asyncio.run(main_test())
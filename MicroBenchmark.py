@@ -0,0 +1,227 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: MicroBenchmark.py
+#
+# Description:
+# Repeatable micro-benchmarks for the per-cycle work of Online_check_web.py,
+# with a regression threshold. Complements the end-to-end Benchmark.py:
+# these numbers show where the per-device cost goes as the device list grows.
+#
+# Benchmarks:
+# - device_to_dict          Device.to_dict() for a host and a gate
+# - device_payload_changed  JSON payload rebuild after a state change
+# - parse_ping_linux/windows  ping output parsing of the subprocess fallback
+# - order_gates_first       gate/other split and sort of a /status-stream batch
+# - load_devices            parse_online_check() + create_devices() of a large ini
+#
+# Design Philosophy:
+# - timeit-based: each benchmark is run `--repeat` times and the best round
+#   is kept (the least disturbed by other processes); results are per call
+#   and, for the sized benchmarks, per device.
+# - Machine independence: every run also times a fixed pure-Python reference
+#   workload; comparisons use the time relative to that reference, so a
+#   baseline recorded on a laptop is usable on the Raspberry Pi.
+# - `--save-baseline file` records the current numbers; `--baseline file`
+#   compares against them and the run fails (exit code 1) if any benchmark is
+#   slower by more than `--threshold` (default 25%).
+#
+# Usage:
+#   python MicroBenchmark.py --save-baseline micro_baseline.json
+#   python MicroBenchmark.py --baseline micro_baseline.json --threshold 0.25
+#   python MicroBenchmark.py --devices 5000
+#
+# --- END OF DESCRIPTION ---
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from Benchmark import make_workdir
+
+LINUX_PING_OUTPUT = """PING 192.168.1.10 (192.168.1.10) 56(84) bytes of data.
+64 bytes from 192.168.1.10: icmp_seq=1 ttl=64 time=0.412 ms
+64 bytes from 192.168.1.10: icmp_seq=2 ttl=64 time=0.388 ms
+64 bytes from 192.168.1.10: icmp_seq=3 ttl=64 time=0.401 ms
+
+--- 192.168.1.10 ping statistics ---
+3 packets transmitted, 3 received, 0% packet loss, time 2003ms
+rtt min/avg/max/mdev = 0.388/0.400/0.412/0.009 ms
+"""
+
+WINDOWS_PING_OUTPUT = """
+Pinging 192.168.1.10 with 32 bytes of data:
+Reply from 192.168.1.10: bytes=32 time<1ms TTL=64
+Reply from 192.168.1.10: bytes=32 time<1ms TTL=64
+Reply from 192.168.1.10: bytes=32 time<1ms TTL=64
+
+Ping statistics for 192.168.1.10:
+    Packets: Sent = 3, Received = 3, Lost = 0 (0% loss),
+Approximate round trip times in milli-seconds:
+    Minimum = 0ms, Maximum = 0ms, Average = 0ms
+"""
+
+
+def reference_workload():
+    """Фиксированная нагрузка на чистом Python - единица измерения скорости машины"""
+    total = 0
+    for i in range(1000):
+        total += i * i % 7
+    return total
+
+
+def time_call(func: Callable[[], object], repeat: int, min_time: float = 0.2) -> float:
+    """Лучшее время одного вызова (сек) из repeat раундов по ~min_time секунд"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def write_online_check_ini(path: str, hosts: int):
+    """online_check.ini с hosts устройствами и двумя воротами"""
+    computers = "\n".join(f"Host{i:05d} = 10.{i // 65536}.{i // 256 % 256}.{i % 256} RPI 30 10"
+                          for i in range(hosts))
+    with open(path, 'w') as f:
+        f.write(f"""[Computers]
+{computers}
+
+[Sensors]
+BigGate = HA_ENTITY SENSOR 5 5 10 10 10
+SmallGate = HA_ENTITY SENSOR 5 5
+ip_gate = 192.168.1.200
+
+[HA]
+HA_IP = 127.0.0.1
+HA_TOKEN = token
+big_gate_opening_entity = binary_sensor.big_gate_sensor_opening
+small_gate_opening_entity = binary_sensor.small_gate_sensor_opening
+""")
+
+
+def build_benchmarks(web, devices: int) -> List[Tuple[str, Callable[[], object], int]]:
+    """Список (имя, функция, число устройств на вызов)"""
+    from AppConfig import parse_online_check
+
+    host = web.Device('Host00001', '10.0.0.1', 'RPI', 30, 10)
+    host.is_online = True; host.status_text = "Online"
+    gate = web.Device('BigGate', 'HA_ENTITY', 'SENSOR', 5, 5, 10, 10, 10)
+    gate.is_online = True; gate.gate_state = 'Open'; gate.status_text = 'Open'; gate.battery_level = 90.0
+
+    counter = [0]
+
+    def payload_changed():
+        counter[0] += 1
+        host.monitoring_text = str(counter[0])
+        return host.payload()
+
+    # Пачка событий как в event_generator: ворота в конце, чтобы сортировка работала
+    fleet = [web.Device(f'Host{i:05d}', '10.0.0.1', 'RPI', 30, 10) for i in range(devices)]
+    fleet += [gate, web.Device('SmallGate', 'HA_ENTITY', 'SENSOR', 5, 5)]
+    batch = [web.device_event(device) for device in fleet]
+
+    write_online_check_ini('micro_online_check.ini', devices)
+
+    def load_devices():
+        return web.create_devices(parse_online_check('micro_online_check.ini').devices)
+
+    return [
+        ('device_to_dict.host', host.to_dict, 1),
+        ('device_to_dict.gate', gate.to_dict, 1),
+        ('device_payload_changed', payload_changed, 1),
+        ('parse_ping_linux', lambda: web.parse_ping_output(LINUX_PING_OUTPUT, '192.168.1.10', False), 1),
+        ('parse_ping_windows', lambda: web.parse_ping_output(WINDOWS_PING_OUTPUT, '192.168.1.10', True), 1),
+        ('order_gates_first', lambda: web.order_gates_first(batch), len(batch)),
+        ('load_devices', load_devices, devices + 2),
+    ]
+
+
+def run(args) -> Dict[str, dict]:
+    # Online_check_web при импорте читает templates/static и пишет лог в текущий каталог
+    cwd = os.getcwd()
+    workdir = make_workdir()
+    os.chdir(workdir)
+    try:
+        import Online_check_web as web
+        reference = time_call(reference_workload, args.repeat)
+        results = {'_reference': {'per_call_us': round(reference * 1e6, 3)}}
+        for name, func, per_call_devices in build_benchmarks(web, args.devices):
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            seconds = time_call(func, args.repeat)
+            result = {'per_call_us': round(seconds * 1e6, 3), 'relative': round(seconds / reference, 5)}
+            if per_call_devices > 1:
+                result['devices'] = per_call_devices
+                result['per_device_us'] = round(seconds * 1e6 / per_call_devices, 4)
+            results[name] = result
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Возвращает список регрессий (по времени относительно эталонной нагрузки)"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if name.startswith('_') or not old or not old.get('relative'):
+            continue
+        if old.get('devices') != result.get('devices'):
+            # Другой размер списка устройств - время вызова несопоставимо
+            continue
+        change = result['relative'] / old['relative'] - 1
+        result['change'] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{name}: {change * 100:+.1f}% (limit +{threshold * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results: Dict[str, dict]):
+    print(f"{'benchmark':<26}{'per call, us':>14}{'per device, us':>16}{'vs baseline':>13}")
+    for name, result in results.items():
+        per_device = result.get('per_device_us')
+        change = result.get('change')
+        print(f"{name:<26}{result['per_call_us']:>14}"
+              f"{per_device if per_device is not None else '':>16}"
+              f"{f'{change * 100:+.1f}%' if change is not None else '':>13}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the Online_check_web hot path")
+    parser.add_argument('--devices', type=int, default=1000, help="Devices for the sized benchmarks")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing rounds per benchmark (best is kept)")
+    parser.add_argument('--only', nargs='+', help="Run only benchmarks whose name starts with these prefixes")
+    parser.add_argument('--baseline', help="Baseline JSON to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', help="Save the results as a new baseline JSON")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = run(args)
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'devices': args.devices, 'results': results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if regressions:
+        print("\nREGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# --- ENGLISH DESCRIPTION ---
+#
+# Module: MqttGateSensor.py
+#
+# Description:
+# Optional direct MQTT source for the gate door sensors. The Aqara magnet
+# sensors are published by zigbee2mqtt as JSON on `zigbee2mqtt/<friendly_name>`
+# (e.g. {"contact": true, "battery": 97, ...}); this module subscribes to those
+# topics on the local broker and exposes the same gate state the Home Assistant
+# path produces, without the HA hop and without a poll interval.
+#
+# Design Philosophy:
+# - Drop-in for HomeAssistantEventStream: the same `connected` event,
+#   `wait_changed()` and `gate_status(opening_entity_id)` are provided, so the
+#   gate engine and Online_check_web.py consume either source unchanged.
+#   Gates are still identified by their HA opening entity ID; `topics` maps
+#   each entity to its zigbee2mqtt topic.
+# - While the broker is unreachable `connected` is cleared and the host
+#   application falls back to the Home Assistant REST API. Cached states are
+#   dropped on disconnect, so after a reconnect a gate is read over REST until
+#   its first fresh (or retained) message arrives.
+# - The MQTT client (aiomqtt) is imported lazily, so the dependency is only
+#   needed when an [MQTT] section is configured.
+#
+# Public API:
+# - class MqttGateSensor(host, topics, port=1883, username=None, password=None)
+#   - start() / async stop()
+#   - async wait_changed(timeout) -> bool
+#   - gate_status(opening_entity_id) -> (gate_closed, battery_level) | None
+# - def parse_zigbee_payload(payload) -> dict | None
+# - def load_mqtt_sensor(mqtt_config, topics) -> MqttGateSensor | None
+#
+# --- END OF DESCRIPTION ---
+
+import asyncio
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_zigbee_payload(payload) -> Optional[dict]:
+    """Разбирает JSON-сообщение zigbee2mqtt; None для не-JSON сообщений"""
+    try:
+        data = json.loads(payload)
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class MqttGateSensor:
+    """
+    Подписка на топики датчиков ворот zigbee2mqtt.
+
+    contact=true означает замкнутый геркон, то есть закрытые ворота.
+    Хранит последнее полученное состояние каждого топика и будит ожидающие
+    корутины при каждом изменении состояния или подключения.
+    """
+
+    def __init__(self, host: str, topics: Dict[str, str], port: int = 1883,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 reconnect_delay: float = 5, max_reconnect_delay: float = 60):
+        """
+        Args:
+            host: Адрес MQTT-брокера
+            topics: Соответствие entity ID датчика открытия -> топик zigbee2mqtt
+            port: Порт брокера
+            username: Имя пользователя брокера (необязательно)
+            password: Пароль брокера (необязательно)
+            reconnect_delay: Начальная задержка перед переподключением в секундах
+            max_reconnect_delay: Максимальная задержка перед переподключением в секундах
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.topics = dict(topics)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.states: Dict[str, dict] = {}
+        self.connected = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """Запускает фоновую задачу подписки"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Останавливает подписку и закрывает соединение с брокером"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected.clear()
+        self.states.clear()
+
+    async def run(self):
+        """Основной цикл: подключение к брокеру, подписка и чтение сообщений"""
+        try:
+            import aiomqtt
+        except ImportError:
+            logger.error("MQTT source configured but aiomqtt is not installed (pip install aiomqtt)")
+            return
+
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with aiomqtt.Client(self.host, port=self.port, username=self.username,
+                                          password=self.password, keepalive=30) as client:
+                    for topic in set(self.topics.values()):
+                        await client.subscribe(topic)
+                    logger.info(f"Подписка на датчики ворот через MQTT установлена: {self.host}:{self.port}")
+                    delay = self.reconnect_delay
+                    self.connected.set()
+                    await self._notify()
+                    async for message in client.messages:
+                        await self._handle_message(str(message.topic), message.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Ошибка MQTT: {e}")
+            finally:
+                # Последние состояния могли устареть за время обрыва: до нового сообщения
+                # (retained-сообщения приходят сразу после подписки) потребители читают REST
+                self.states.clear()
+                if self.connected.is_set():
+                    self.connected.clear()
+                    await self._notify()
+
+            logger.info(f"Переподключение к MQTT-брокеру через {delay} сек")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _handle_message(self, topic: str, payload):
+        data = parse_zigbee_payload(payload)
+        if data is None:
+            return
+        # zigbee2mqtt может прислать частичное состояние - дополняем последнее известное
+        state = dict(self.states.get(topic, {}))
+        state.update(data)
+        if state != self.states.get(topic):
+            self.states[topic] = state
+            await self._notify()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_changed(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждет следующего изменения состояния или статуса подключения.
+
+        Returns:
+            True при изменении, False по истечении timeout
+        """
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def gate_status(self, opening_entity_id: str) -> Optional[Tuple[bool, float]]:
+        """
+        Состояние ворот по последнему сообщению датчика
+
+        Returns:
+            Tuple (gate_closed, battery_level) или None, если данных нет
+        """
+        state = self.states.get(self.topics.get(opening_entity_id))
+        if not state:
+            return None
+        contact = state.get('contact')
+        battery = state.get('battery')
+        if not isinstance(contact, bool) or battery is None:
+            return None
+        try:
+            return contact, float(battery)
+        except (ValueError, TypeError):
+            logger.warning(f"Некорректное значение батареи в MQTT для {opening_entity_id}: {battery}")
+            return None
+
+
+def load_mqtt_sensor(mqtt_config, topics: Dict[str, str]) -> Optional[MqttGateSensor]:
+    """
+    Создает MqttGateSensor по секции [MQTT] конфигурации.
+
+    Args:
+        mqtt_config: AppConfig.MqttConfig или None, если секции [MQTT] нет
+        topics: Соответствие entity ID датчика открытия -> топик
+
+    Returns:
+        MqttGateSensor или None, если MQTT не настроен или топики не заданы
+    """
+    if mqtt_config is None or not topics:
+        return None
+    return MqttGateSensor(
+        host=mqtt_config.host,
+        topics=topics,
+        port=mqtt_config.port,
+        username=mqtt_config.username,
+        password=mqtt_config.password,
+    )
+
+
+# --- AUTONOMOUS TEST MODULE ---
+
+async def main_test(host, entity_id, topic):
+    sensor = MqttGateSensor(host, {entity_id: topic})
+    sensor.start()
+    await asyncio.wait_for(sensor.connected.wait(), 10)
+    print(f"Connected to {host}, waiting for messages on {topic} (Ctrl+C to stop)")
+    while True:
+        await sensor.wait_changed()
+        print(f"{topic}: {sensor.gate_status(entity_id)}")
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 4:
+        print("Usage: python MqttGateSensor.py <broker> <opening_entity_id> <zigbee2mqtt topic>")
+        sys.exit(1)
+    asyncio.run(main_test(*sys.argv[1:]))
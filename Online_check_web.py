@@ -1,143 +1,126 @@
-import configparser
+import atexit
 import platform
 import logging
 import asyncio
 import json
 import time
 import re
-import requests
+import signal
+import uuid
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
 from typing import Tuple, Optional
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from sse_starlette.sse import EventSourceResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
 # Убедитесь, что эти файлы существуют и доступны для импорта
-from ControlSwitch import control_shelly_switch
-from TelegramButtonsGen import send_message_with_buttons, cleanup_bot
+from AppConfig import HAConfig, online_check_config
+from ControlSwitch import pulse_shelly_switch, close_shelly_clients
+from HomeAssistantClient import get_ha_client, close_ha_clients, HomeAssistantEventStream, battery_entity_for
+from MqttGateSensor import load_mqtt_sensor
+from AsyncPinger import get_pinger, close_pinger
+from Metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, ALERT_DELIVERY_SECONDS, GATE_ALERT_SECONDS,
+                     PROBE_FAILURES, PROBE_SECONDS, Counter, Gauge, render as render_metrics)
+from LoopWatchdog import LoopWatchdog
+from TelegramButtonsGen import PRIORITY_CRITICAL, send_message_with_buttons, start_notifier, stop_notifier
 
 # --- Конфигурация и Глобальные переменные ---
 INI_FILE = 'online_check.ini'
 
-# Настройка логирования без цветов в консоли
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler('device_status.log'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования без цветов в консоли. Запись в файл и консоль выполняет
+# отдельный поток (QueueListener): корутины только кладут запись в очередь и
+# не блокируют event loop на дисковом вводе-выводе
+_log_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+_log_handlers = [logging.FileHandler('device_status.log'), logging.StreamHandler()]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+LOG_LISTENER = QueueListener(queue.SimpleQueue(), *_log_handlers, respect_handler_level=True)
+_queue_handler = QueueHandler(LOG_LISTENER.queue)
+# В очередь - только текст сообщения (с трассировкой), полный формат добавляют обработчики слушателя
+_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+# force=True: заменяет обработчики, если импортированный модуль уже настроил логирование
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler], force=True)
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)
+
+# Параметры планировщика проверок
+STABLE_PROBES_REQUIRED = 3   # Сколько одинаковых результатов подряд нужно для перехода на online_interval
+SCHEDULER_MAX_SLEEP = 5      # Максимальная пауза планировщика между просмотрами расписания (сек)
+SENSOR_LANE_CONCURRENCY = 4  # Параллельные проверки датчиков ворот (HA)
+SENSOR_PROBE_TIMEOUT = 3     # Предельное время проверки датчика (сек)
+PING_LANE_CONCURRENCY = 32   # Параллельные пинги хостов
+PING_PROBE_TIMEOUT = 10      # Предельное время пинга хоста (сек)
+SSE_QUEUE_SIZE = 100         # Размер очереди событий одного SSE-клиента
+SSE_HEARTBEAT = 15           # Интервал heartbeat-события при отсутствии изменений (сек)
+COMMAND_HISTORY_SIZE = 50    # Сколько последних команд ворот доступно через /commands/<id>
 
 # Убираем цветные эмодзи из отладочных сообщений
 def simple_print(text):
     """Простой вывод без эмодзи и цветов"""
     print(text)
 
+# --- Рассылка SSE-событий ---
+class BroadcastHub:
+    """
+    Рассылка событий всем SSE-подписчикам.
+    
+    Каждый подписчик получает собственную ограниченную очередь; если клиент
+    не успевает читать, самые старые события отбрасываются. Производители
+    публикуют событие один раз, независимо от числа подписчиков.
+    """
+
+    def __init__(self, queue_size=SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self.dropped_events = 0
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        for subscriber in self._subscribers:
+            if subscriber.full():
+                # Медленный клиент: отбрасываем самое старое событие
+                subscriber.get_nowait()
+                self.dropped_events += 1
+            subscriber.put_nowait(event)
+
 # Глобальные переменные для хранения единого состояния приложения
 DEVICES = []
-HA_CONFIG = {}
+CONFIG = None
+HA_CONFIG = HAConfig(ip=None, token=None)
 GATE_IP = None
-last_gate_toggle = 0
-pending_updates = {}
-
-class HomeAssistantGateSensor:
-    """Класс для работы с датчиком ворот через Home Assistant API"""
-    
-    def __init__(self, ha_ip: str, ha_token: str, timeout: int = 10):
-        """
-        Инициализация подключения к Home Assistant
-        
-        Args:
-            ha_ip: IP адрес Home Assistant
-            ha_token: Long-lived access token
-            timeout: Таймаут запросов в секундах
-        """
-        self.ha_url = f"http://{ha_ip}:8123"
-        self.headers = {
-            "Authorization": f"Bearer {ha_token}",
-            "Content-Type": "application/json",
-        }
-        self.timeout = timeout
-    
-    def get_entity_state(self, entity_id: str) -> Optional[dict]:
-        """Получение состояния entity"""
-        try:
-            import time
-            timestamp = int(time.time() * 1000)
-            
-            headers_no_cache = self.headers.copy()
-            headers_no_cache.update({
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0'
-            })
-            
-            response = requests.get(
-                f"{self.ha_url}/api/states/{entity_id}?_={timestamp}",
-                headers=headers_no_cache,
-                timeout=self.timeout
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logging.error(f"Ошибка получения данных с {entity_id}: HTTP {response.status_code}")
-                return None
-                
-        except Exception as e:
-            logging.error(f"Ошибка подключения для {entity_id}: {e}")
-            return None
-    
-    def get_gate_status(self, opening_entity_id: str) -> Tuple[Optional[bool], Optional[float]]:
-        """
-        Получение состояния датчика ворот
-        
-        Args:
-            opening_entity_id: Полный Entity ID датчика открытия
-            
-        Returns:
-            Tuple (gate_closed, battery_level):
-            - gate_closed: True если закрыто, False если открыто, None при ошибке
-            - battery_level: процент заряда батареи или None при ошибке
-        """
-        # Формируем entity ID батареи, заменяя "opening" на "battery" и "binary_sensor" на "sensor"
-        battery_entity_id = opening_entity_id.replace("_opening", "_battery").replace("binary_sensor.", "sensor.")
-        
-        # Получаем состояние датчика открытия
-        opening_data = self.get_entity_state(opening_entity_id)
-        gate_closed = None
-        
-        if opening_data:
-            state = opening_data.get('state', '').lower()
-            if state == 'on':
-                gate_closed = False  # Ворота открыты
-            elif state == 'off':
-                gate_closed = True   # Ворота закрыты
-            else:
-                logging.warning(f"Неожиданное состояние датчика {opening_entity_id}: '{state}'")
-        else:
-            logging.error(f"Не удалось получить состояние датчика {opening_entity_id}")
-        
-        # Получаем заряд батареи
-        battery_data = self.get_entity_state(battery_entity_id)
-        battery_level = None
-        
-        if battery_data:
-            try:
-                battery_level = float(battery_data.get('state', 0))
-            except (ValueError, TypeError):
-                logging.warning(f"Некорректное значение батареи для {battery_entity_id}: {battery_data.get('state')}")
-        else:
-            logging.error(f"Не удалось получить заряд батареи {battery_entity_id}")
-        
-        return gate_closed, battery_level
+PROBE_SCHEDULER = None
+GATE_EVENTS = None
+GATE_EVENTS_WATCHER = None
+GATE_EVENTS_SETTINGS = None
+HUB = BroadcastHub()
+SSE_SUBSCRIBERS = Gauge("gatecheck_sse_subscribers", "Connected SSE clients of the status page",
+                        function=lambda: HUB.subscriber_count)
+SSE_DROPPED_EVENTS = Gauge("gatecheck_sse_dropped_events", "Events dropped for slow SSE clients since start",
+                           function=lambda: HUB.dropped_events)
+PROBE_TIMEOUTS = Counter("gatecheck_probe_timeouts_total", "Probes cancelled by the lane timeout", ["lane"])
+GATE_EXECUTORS = {}
+GATE_COMMANDS = OrderedDict()
 
-def check_gate(gate_entity_id: str) -> Optional[Tuple[bool, float]]:
+async def check_gate(gate_entity_id: str) -> Optional[Tuple[bool, float]]:
     """
-    Функция для проверки состояния ворот через Home Assistant
+    Функция для проверки состояния ворот: из подключенного push-источника
+    (MQTT или WebSocket HA), иначе через REST API Home Assistant
     
     Args:
         gate_entity_id: Entity ID датчика открытия ворот
@@ -145,27 +128,21 @@ def check_gate(gate_entity_id: str) -> Optional[Tuple[bool, float]]:
     Returns:
         Tuple (gate_closed, battery_level) или None при ошибке
     """
-    global HA_CONFIG
+    events = gate_event_stream()
+    if events is not None:
+        gate_result = events.gate_status(gate_entity_id)
+        if gate_result is not None:
+            return gate_result
     
     try:
-        # Исправляем чтение параметров - они приходят в нижнем регистре
-        ha_ip = HA_CONFIG.get('ha_ip', '').strip('"')
-        ha_token = HA_CONFIG.get('ha_token', '').strip('"')
+        ha_ip, ha_token = HA_CONFIG.ip, HA_CONFIG.token
         
         if not ha_ip or not ha_token:
             logging.error(f"HA_IP или HA_TOKEN не настроены. ha_ip='{ha_ip}', ha_token существует: {bool(ha_token)}")
             return None
             
-        # Создаем экземпляр датчика
-        sensor = HomeAssistantGateSensor(ha_ip, ha_token)
-        
-        # Получаем состояние
-        gate_closed, battery_level = sensor.get_gate_status(gate_entity_id)
-        
-        if gate_closed is not None and battery_level is not None:
-            return gate_closed, battery_level
-        else:
-            return None
+        # Общий клиент с пулом соединений вместо нового датчика на каждый опрос
+        return await get_ha_client(ha_ip, ha_token).check_gate(gate_entity_id)
             
     except Exception as e:
         logging.error(f"Ошибка в check_gate: {e}")
@@ -175,13 +152,45 @@ def check_gate(gate_entity_id: str) -> Optional[Tuple[bool, float]]:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Выполняется один раз при старте и один раз при выключении"""
-    global DEVICES, HA_CONFIG, GATE_IP
-    DEVICES = load_devices(INI_FILE)
-    HA_CONFIG = load_ha_config(INI_FILE)
-    GATE_IP = load_gate_ip(INI_FILE)
+    global CONFIG, DEVICES, HA_CONFIG, GATE_IP, PROBE_SCHEDULER
+    # online_check.ini разбирается один раз; дальше изменения подхватывает CONFIG.watch()
+    CONFIG = online_check_config(INI_FILE)
+    config = CONFIG.current
+    DEVICES = create_devices(config.devices)
+    HA_CONFIG = config.ha
+    GATE_IP = config.gate_ip
+    log_ha_config(HA_CONFIG)
     logging.info(f"Application startup: Loaded {len(DEVICES)} devices with HA config.")
+    # Единый планировщик проверок: нагрузка не зависит от числа открытых вкладок
+    PROBE_SCHEDULER = ProbeScheduler(DEVICES)
+    PROBE_SCHEDULER.start()
+    GATE_EXECUTORS.update(create_gate_executors(DEVICES, GATE_IP))
+    # Push-подписка на датчики ворот: обновление по событию датчика без опроса
+    start_gate_events(config)
+    CONFIG.add_listener(apply_config)
+    config_watcher = asyncio.create_task(CONFIG.watch())
+    # Поиск блокирующего кода: стек в лог, если event loop завис дольше порога
+    loop_watchdog = LoopWatchdog()
+    loop_watchdog.start()
+    if hasattr(signal, 'SIGHUP'):
+        # kill -HUP <pid>: перечитать online_check.ini немедленно
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_config)
+    # Веб-интерфейс кнопок не ждет: только отправка, обновления бота получает монитор ворот
+    await start_notifier(receive_updates=False)
     yield
-    await cleanup_bot()
+    config_watcher.cancel()
+    CONFIG.remove_listener(apply_config)
+    await PROBE_SCHEDULER.stop()
+    for executor in GATE_EXECUTORS.values():
+        await executor.stop()
+    await stop_gate_events(GATE_EVENTS, GATE_EVENTS_WATCHER)
+    if RETIRING_TASKS:
+        await asyncio.gather(*RETIRING_TASKS, return_exceptions=True)
+    close_pinger()
+    await stop_notifier()
+    await close_ha_clients()
+    await close_shelly_clients()
+    await loop_watchdog.stop()
     logging.info("Application shutdown.")
 
 app = FastAPI(lifespan=lifespan)
@@ -191,8 +200,17 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # --- Класс Устройства ---
 class Device:
+    # Поля, изменение которых меняет данные, отправляемые клиентам (см. to_dict)
+    STATE_FIELDS = frozenset({
+        'name', 'address', 'device_type', 'is_online', 'status_text', 'gate_state', 'battery_level',
+        'sec_after_open', 'special_monitoring_active', 'monitoring_text',
+    })
+
     def __init__(self, name, address, device_type, online_interval, offline_interval, 
                  sec_after_open=None, sec_after_close=None, attempts_after_close=None):
+        # Версия состояния и кэш сериализованного to_dict(): JSON пересобирается только после изменений
+        self.version = 0; self.published_version = -1
+        self._payload = None; self._payload_version = -1
         self.name = name; self.address = address
         self.device_type = device_type.upper()
         self.is_online = False; self.status_text = "Unknown"
@@ -201,11 +219,60 @@ class Device:
         self.attempts_after_close = attempts_after_close
         self.special_monitoring_active = False
         self.monitoring_text = ""  # Поле для детального статуса ПОД кнопкой
+        # Расписание проверок: online_interval для стабильного устройства,
+        # offline_interval для недоступного или "мигающего"
+        self.online_interval = online_interval; self.offline_interval = offline_interval
+        self.next_probe_at = 0.0
+        self.stable_probes = 0
+        # Устройство удалено из online_check.ini: незавершенная проверка не должна его публиковать
+        self.removed = False
+
+    def update_timing(self, spec):
+        """Применяет новые интервалы из online_check.ini, сохраняя состояние и расписание"""
+        self.online_interval = spec.online_interval; self.offline_interval = spec.offline_interval
+        self.sec_after_open = spec.sec_after_open; self.sec_after_close = spec.sec_after_close
+        self.attempts_after_close = spec.attempts_after_close
+        self.next_probe_at = min(self.next_probe_at, time.monotonic() + self.offline_interval)
+
+    def schedule_next_probe(self, previous_status):
+        """Планирует следующую проверку по результату текущей"""
+        if (self.is_online, self.status_text) == previous_status:
+            self.stable_probes += 1
+        else:
+            self.stable_probes = 0
+        stable = self.is_online and self.stable_probes >= STABLE_PROBES_REQUIRED
+        interval = self.online_interval if stable else self.offline_interval
+        self.next_probe_at = time.monotonic() + interval
+
+    def __setattr__(self, name, value):
+        if name in Device.STATE_FIELDS and getattr(self, name, None) != value:
+            object.__setattr__(self, 'version', self.version + 1)
+        object.__setattr__(self, name, value)
+
+    @property
+    def is_gate(self):
+        return self.name.lower() in ['biggate', 'smallgate']
+
+    @property
+    def probe_type(self):
+        """Тип проверки для метрик: check_gate для датчиков ворот, ping для хостов"""
+        return 'check_gate' if self.device_type == 'SENSOR' else 'ping'
+
+    @property
+    def gate_priority(self):
+        return 1 if self.name.lower() == 'biggate' else 2 if self.name.lower() == 'smallgate' else 999
+
+    def payload(self):
+        """JSON-представление to_dict(), пересобираемое только при изменении версии"""
+        if self._payload_version != self.version:
+            self._payload = json.dumps(self.to_dict())
+            self._payload_version = self.version
+        return self._payload
 
     def to_dict(self):
         status_display = self.status_text
         # Логика для карточки: всегда показываем простой статус Open/Closed для всех ворот
-        if self.name.lower() in ['biggate', 'smallgate'] and self.is_online and self.gate_state:
+        if self.is_gate and self.is_online and self.gate_state:
             status_display = self.gate_state
             
         return {
@@ -214,40 +281,53 @@ class Device:
             'battery_level': self.battery_level, 'has_extended_params': bool(self.sec_after_open is not None),
             'special_monitoring_active': self.special_monitoring_active,
             'monitoring_text': self.monitoring_text, # Добавляем новое поле в ответ
-            'is_gate': self.name.lower() in ['biggate', 'smallgate'],  # Флаг для фронтенда
-            'gate_priority': 1 if self.name.lower() == 'biggate' else 2 if self.name.lower() == 'smallgate' else 999  # Для сортировки
+            'is_gate': self.is_gate,  # Флаг для фронтенда
+            'gate_priority': self.gate_priority  # Для сортировки
         }
 
     async def check_status(self, ha_config):
-        if self.device_type == 'SENSOR':
-            return await asyncio.to_thread(self._check_sensor_status, ha_config)
-        else:
-            return await self._check_ping_status()
+        with PROBE_SECONDS.time(probe=self.probe_type, device=self.name):
+            if self.device_type == 'SENSOR':
+                is_online = await self._check_sensor_status(ha_config)
+            else:
+                is_online = await self._check_ping_status()
+        if not is_online:
+            PROBE_FAILURES.inc(probe=self.probe_type, device=self.name)
+        return is_online
 
     async def _check_ping_status(self):
+        # Встроенный ICMP-пингер (один сокет на все хосты); ping-процесс - только если
+        # сокет открыть нельзя. Ошибки отдельного хоста пингер сам считает "нет ответа".
+        pinger = await get_pinger()
+        if pinger is not None:
+            try:
+                return await pinger.ping(self.address, count=3, timeout=1) >= 2
+            except OSError as e:
+                # Сокет закрыт (например, при остановке приложения)
+                logging.warning(f"ICMP socket unavailable for {self.name} ({e}); using ping subprocess")
+        return await self._check_ping_subprocess()
+
+    async def _check_ping_subprocess(self):
         try:
-            cmd = ['ping', '-n' if platform.system().lower() == 'windows' else '-c', '3', '-w' if platform.system().lower() == 'windows' else '-W', '1000' if platform.system().lower() == 'windows' else '1', self.address]
+            windows = platform.system().lower() == 'windows'
+            cmd = ['ping', '-n' if windows else '-c', '3', '-w' if windows else '-W', '1000' if windows else '1', self.address]
             process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
             stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
-            output = stdout.decode('utf-8', errors='ignore')
-            if process.returncode != 0 or 'unreachable' in output.lower() or 'timed out' in output.lower(): return False
-            if platform.system().lower() == 'windows': return len(re.findall(r'Reply from ' + re.escape(self.address), output, re.IGNORECASE)) >= 2
-            else:
-                match = re.search(r'(\d+) packets transmitted, (\d+) received', output)
-                return match and int(match.group(2)) >= 2
+            if process.returncode != 0: return False
+            return parse_ping_output(stdout.decode('utf-8', errors='ignore'), self.address, windows)
         except asyncio.TimeoutError: logging.error(f"Async ping timeout for {self.name}"); return False
         except Exception as e: logging.error(f"Error async pinging {self.name}: {e}"); return False
 
-    def _check_sensor_status(self, ha_config):
+    async def _check_sensor_status(self, ha_config):
         try:
             if self.name.lower() == 'biggate':
                 # Для biggate используем entity ID из HA конфигурации
-                gate_entity_id = ha_config.get('big_gate_opening_entity', '').strip('"')
+                gate_entity_id = ha_config.big_gate_entity
                 if not gate_entity_id:
                     logging.error(f"big_gate_opening_entity не настроен в конфигурации HA")
                     return False
                     
-                gate_result = check_gate(gate_entity_id)
+                gate_result = await check_gate(gate_entity_id)
                 if gate_result: 
                     self.gate_state, self.battery_level = ('Closed' if gate_result[0] else 'Open'), gate_result[1]
                     return True
@@ -256,12 +336,12 @@ class Device:
                     return False
             elif self.name.lower() == 'smallgate':
                 # Для smallgate используем entity ID из HA конфигурации
-                gate_entity_id = ha_config.get('small_gate_opening_entity', '').strip('"')
+                gate_entity_id = ha_config.small_gate_entity
                 if not gate_entity_id:
                     logging.error(f"small_gate_opening_entity не настроен в конфигурации HA")
                     return False
                     
-                gate_result = check_gate(gate_entity_id)
+                gate_result = await check_gate(gate_entity_id)
                 if gate_result: 
                     self.gate_state, self.battery_level = ('Closed' if gate_result[0] else 'Open'), gate_result[1]
                     return True
@@ -276,100 +356,258 @@ class Device:
             logging.error(f"Error checking HA sensor {self.name}: {e}")
             return False
 
+PING_SUMMARY_RE = re.compile(r'(\d+) packets transmitted, (\d+) received')
+
+def parse_ping_output(output, address, windows):
+    """Разбор вывода ping: True, если получено не меньше двух ответов из трех"""
+    lowered = output.lower()
+    if 'unreachable' in lowered or 'timed out' in lowered: return False
+    if windows: return len(re.findall(r'Reply from ' + re.escape(address), output, re.IGNORECASE)) >= 2
+    match = PING_SUMMARY_RE.search(output)
+    return bool(match) and int(match.group(2)) >= 2
+
 # --- Функции Загрузки ---
-def load_devices(ini_file):
-    config = configparser.ConfigParser()
-    # Сохраняем оригинальный регистр ключей
-    config.optionxform = str
-    config.read(ini_file)
-    devices_list = []
-    if 'Computers' in config:
-        for name, value in config['Computers'].items():
-            parts = value.split(); devices_list.append(Device(name, parts[0], parts[1], int(parts[2]), int(parts[3])))
-    if 'Sensors' in config:
-        for name, value in config['Sensors'].items():
-            if name.lower() == 'ip_gate': continue
-            parts = value.split()
-            # Для biggate и smallgate читаем entity ID из HA конфигурации, но сохраняем параметры тайминга
-            if name.lower() in ['biggate', 'smallgate'] and len(parts) >= 4:
-                # Используем dummy address, так как реальный entity ID будет из HA секции
-                if len(parts) == 7:
-                    devices_list.append(Device(name, "HA_ENTITY", parts[1], int(parts[2]), int(parts[3]), int(parts[4]), int(parts[5]), int(parts[6])))
-                else:
-                    devices_list.append(Device(name, "HA_ENTITY", parts[1], int(parts[2]), int(parts[3])))
-            elif len(parts) == 4: 
-                devices_list.append(Device(name, parts[0], parts[1], int(parts[2]), int(parts[3])))
-    return devices_list
-
-def load_ha_config(ini_file):
-    config = configparser.ConfigParser(); 
-    config.read(ini_file)
+def create_devices(device_specs):
+    """Объекты Device по описаниям из online_check.ini"""
+    return [Device(spec.name, spec.address, spec.device_type, spec.online_interval, spec.offline_interval,
+                   spec.sec_after_open, spec.sec_after_close, spec.attempts_after_close)
+            for spec in device_specs]
+
+def log_ha_config(ha_config):
+    """Отладочная информация о секции [HA] без эмодзи"""
+    simple_print(f"HA_IP: {ha_config.ip or 'NOT FOUND'}")
+    simple_print(f"HA_TOKEN: {'***' if ha_config.token else 'NOT FOUND'}")
+    simple_print(f"big_gate_opening_entity: {ha_config.big_gate_entity or 'NOT FOUND'}")
+    simple_print(f"small_gate_opening_entity: {ha_config.small_gate_entity or 'NOT FOUND'}")
+
+def create_gate_event_stream(config):
+    """
+    Создает push-источник состояния датчиков ворот: MQTT (секция [MQTT] с топиками
+    zigbee2mqtt) или WebSocket HA (опция ha_websocket в [HA]). None - только опрос REST.
+    """
+    ha = config.ha
+    topics = {}
+    if config.mqtt is not None:
+        for entity_id, topic in ((ha.big_gate_entity, config.mqtt.big_gate_topic),
+                                 (ha.small_gate_entity, config.mqtt.small_gate_topic)):
+            if entity_id and topic:
+                topics[entity_id] = topic
+    mqtt = load_mqtt_sensor(config.mqtt, topics)
+    if mqtt is not None:
+        logging.info(f"Gate sensors are read from MQTT broker {mqtt.host}:{mqtt.port}")
+        return mqtt
+    if not ha.websocket:
+        return None
+    entities = set()
+    for entity_id in (ha.big_gate_entity, ha.small_gate_entity):
+        if entity_id:
+            entities.update((entity_id, battery_entity_for(entity_id)))
+    if not ha.ip or not ha.token or not entities:
+        return None
+    return HomeAssistantEventStream(ha.ip, ha.token, entities)
+
+def gate_event_settings(config):
+    """Параметры, от которых зависит push-источник ворот (при их изменении он пересоздается)"""
+    ha, mqtt = config.ha, config.mqtt
+    return ((ha.ip, ha.token, ha.websocket, ha.big_gate_entity, ha.small_gate_entity),
+            (mqtt.host, mqtt.port, mqtt.username, mqtt.password, mqtt.big_gate_topic, mqtt.small_gate_topic)
+            if mqtt is not None else None)
+
+def start_gate_events(config):
+    """Запускает push-источник ворот по конфигурации и задачу, реагирующую на его события"""
+    global GATE_EVENTS, GATE_EVENTS_WATCHER, GATE_EVENTS_SETTINGS
+    GATE_EVENTS_SETTINGS = gate_event_settings(config)
+    GATE_EVENTS = create_gate_event_stream(config)
+    GATE_EVENTS_WATCHER = None
+    if GATE_EVENTS is not None:
+        GATE_EVENTS.start()
+        GATE_EVENTS_WATCHER = asyncio.create_task(watch_gate_events(GATE_EVENTS))
+
+async def stop_gate_events(events, watcher):
+    if watcher is not None:
+        watcher.cancel()
+        try:
+            await watcher
+        except asyncio.CancelledError:
+            pass
+    if events is not None:
+        await events.stop()
+
+def reconcile_devices(device_specs):
+    """
+    Сравнивает список устройств с новым online_check.ini и меняет DEVICES на месте.
+    
+    Устройства с тем же именем, адресом и типом сохраняют объект, состояние и
+    расписание (меняются только интервалы); остальные добавляются или удаляются.
+    
+    Returns:
+        (added, removed) - списки объектов Device
+    """
+    current = {device.name: device for device in DEVICES}
+    devices, added, removed = [], [], []
+    for spec in device_specs:
+        device = current.pop(spec.name, None)
+        if device is not None and device.address == spec.address and device.device_type == spec.device_type.upper():
+            device.update_timing(spec)
+        else:
+            if device is not None:
+                removed.append(device)
+            device = create_devices([spec])[0]
+            added.append(device)
+        devices.append(device)
+    removed.extend(current.values())
+    for device in removed:
+        device.removed = True
+    # Планировщик держит ссылку на этот же список
+    DEVICES[:] = devices
+    return added, removed
+
+# Исполнители и push-источники, снятые при перезагрузке конфигурации и ещё завершающие работу
+RETIRING_TASKS = set()
+
+def retire_in_background(stop):
+    """Выполняет корутину остановки в фоне, сохраняя ссылку на задачу до её завершения"""
+    task = asyncio.create_task(stop)
+    RETIRING_TASKS.add(task)
+    task.add_done_callback(RETIRING_TASKS.discard)
+
+def apply_config(new_config):
+    """
+    Применяет перезагруженный online_check.ini без перезапуска: параметры HA и реле ворот,
+    а также добавленные/удаленные устройства. SSE-клиенты остаются подключенными и
+    получают device_status для новых устройств и device_removed для удаленных.
+    """
+    global HA_CONFIG, GATE_IP
+    HA_CONFIG = new_config.ha
+    if gate_event_settings(new_config) != GATE_EVENTS_SETTINGS:
+        # Изменились [HA] или [MQTT]: push-источник подписан на старые entity/брокер - пересоздаем
+        retire_in_background(stop_gate_events(GATE_EVENTS, GATE_EVENTS_WATCHER))
+        start_gate_events(new_config)
+        logging.info("Gate sensor push source restarted for the new [HA]/[MQTT] settings")
+    added, removed = reconcile_devices(new_config.devices)
     
-    # Отладочная информация без эмодзи
-    simple_print(f"Reading config file: {ini_file}")
-    simple_print(f"Available sections: {config.sections()}")
+    for device in removed:
+        executor = GATE_EXECUTORS.pop(device.name.lower(), None)
+        if executor is not None:
+            retire_in_background(executor.stop())
+        HUB.publish((device.gate_priority, {"event": "device_removed", "data": json.dumps({"name": device.name})}))
+    if new_config.gate_ip != GATE_IP:
+        GATE_IP = new_config.gate_ip
+        for executor in GATE_EXECUTORS.values():
+            executor.relay_ip = GATE_IP
+    if not GATE_IP:
+        for executor in GATE_EXECUTORS.values():
+            retire_in_background(executor.stop())
+        GATE_EXECUTORS.clear()
+    for name, executor in create_gate_executors(DEVICES, GATE_IP).items():
+        GATE_EXECUTORS.setdefault(name, executor)
     
-    if 'HA' in config:
-        ha_dict = dict(config['HA'])
-        simple_print(f"HA section options: {list(ha_dict.keys())}")
-        simple_print(f"HA_IP: {ha_dict.get('ha_ip', 'NOT FOUND')}")
-        simple_print(f"HA_TOKEN: {'***' if ha_dict.get('ha_token') else 'NOT FOUND'}")
-        simple_print(f"big_gate_opening_entity: {ha_dict.get('big_gate_opening_entity', 'NOT FOUND')}")
-        simple_print(f"small_gate_opening_entity: {ha_dict.get('small_gate_opening_entity', 'NOT FOUND')}")
-        return ha_dict
-    else:
-        simple_print("ERROR: Section [HA] not found in config file!")
-        return {}
-
-def load_gate_ip(ini_file):
-    config = configparser.ConfigParser(); config.read(ini_file)
-    return config.get('Sensors', 'ip_gate', fallback=None)
+    for device in added:
+        publish_device(device)
+    if added or removed:
+        PROBE_SCHEDULER.wake()
+    logging.info(f"online_check.ini reloaded: {len(added)} device(s) added, {len(removed)} removed, "
+                 f"{len(DEVICES)} monitored")
+
+def reload_config():
+    """Принудительная перезагрузка online_check.ini (SIGHUP)"""
+    if CONFIG is not None:
+        CONFIG.reload_if_changed(force=True)
 
 # --- Логика Приложения ---
 
+def device_event(device):
+    """SSE-событие с состоянием устройства в виде (приоритет отправки, событие)"""
+    return device.gate_priority, {"event": "device_status", "data": device.payload()}
+
+def publish_device(device):
+    """Публикует состояние устройства всем SSE-клиентам, только если оно изменилось с прошлой публикации"""
+    if device.removed or device.version == device.published_version:
+        return
+    device.published_version = device.version
+    HUB.publish(device_event(device))
+
+def gate_event_stream():
+    """Возвращает подключенный push-источник (MQTT или HA) или None, если нужно опрашивать REST"""
+    if GATE_EVENTS is not None and GATE_EVENTS.connected.is_set():
+        return GATE_EVENTS
+    return None
+
+async def watch_gate_events(events):
+    """Перепроверяет ворота сразу после события датчика, не дожидаясь интервала опроса"""
+    while True:
+        await events.wait_changed()
+        for device in DEVICES:
+            if device.is_gate and not device.special_monitoring_active:
+                PROBE_SCHEDULER.probe_now(device)
+
 async def handle_biggate_after_toggle(biggate_device, initial_gate_state):
-    global pending_updates
-    
+    """Следит за воротами после импульса реле; возвращает True, если целевое состояние достигнуто"""
+    reached = False
     try:
         target_state = 'Open' if initial_gate_state == 'Closed' else 'Closed'
         wait_seconds = biggate_device.sec_after_open if target_state == 'Open' else biggate_device.sec_after_close
+        wait_seconds = wait_seconds or 10
         attempts = biggate_device.attempts_after_close or 10
+        gate_entity_id = HA_CONFIG.big_gate_entity
+        # Бюджет попыток задает только крайний срок: целевое состояние фиксируется
+        # сразу по событию state_changed, а wait_seconds - шаг индикации прогресса
+        deadline_seconds = attempts * wait_seconds
+        started = time.monotonic()
+        deadline = started + deadline_seconds
+        next_progress = started + wait_seconds
         
-        logging.info(f"Monitoring for BigGate to become '{target_state}' for {attempts} attempts.")
+        logging.info(f"Monitoring for BigGate to become '{target_state}' within {deadline_seconds} seconds.")
         
-        for i in range(attempts):
-            await asyncio.sleep(wait_seconds)
-            await asyncio.to_thread(biggate_device._check_sensor_status, HA_CONFIG)
+        while time.monotonic() < deadline:
+            wait_until = min(next_progress, deadline)
+            events = gate_event_stream()
+            if events is not None:
+                await events.wait_changed(timeout=max(0.0, wait_until - time.monotonic()))
+                gate_result = events.gate_status(gate_entity_id)
+                if gate_result:
+                    biggate_device.gate_state = 'Closed' if gate_result[0] else 'Open'
+                    biggate_device.battery_level = gate_result[1]
+            else:
+                # Нет push-подписки - опрашиваем REST с прежним шагом
+                await asyncio.sleep(max(0.0, wait_until - time.monotonic()))
+                await biggate_device._check_sensor_status(HA_CONFIG)
             
             if biggate_device.gate_state == target_state:
-                logging.info(f"BigGate reached target state '{target_state}'.")
+                logging.info(f"BigGate reached target state '{target_state}' after {time.monotonic() - started:.1f} seconds.")
+                reached = True
                 break
             
-            # Устанавливаем детальный текст для строки под кнопкой
-            progress_text = f"Ожидание: {i+1}/{attempts}"
-            if target_state == 'Closed' and biggate_device.gate_state == 'Open':
-                elapsed_time = (i + 1) * wait_seconds
-                progress_text = f"Big Gate open for... {elapsed_time} seconds"
+            if time.monotonic() >= next_progress:
+                step = round((next_progress - started) / wait_seconds)
+                next_progress += wait_seconds
+                # Устанавливаем детальный текст для строки под кнопкой
+                progress_text = f"Ожидание: {step}/{attempts}"
+                if target_state == 'Closed' and biggate_device.gate_state == 'Open':
+                    progress_text = f"Big Gate open for... {step * wait_seconds} seconds"
 
-            biggate_device.monitoring_text = progress_text
-            pending_updates[biggate_device.name] = biggate_device.to_dict()
-            logging.info(f"Attempt {i+1}/{attempts}: BigGate state is still '{biggate_device.gate_state}'")
+                biggate_device.monitoring_text = progress_text
+                publish_device(biggate_device)
+                logging.info(f"Attempt {step}/{attempts}: BigGate state is still '{biggate_device.gate_state}'")
         
         if biggate_device.gate_state != target_state:
             logging.warning(f"BigGate did not reach target state '{target_state}' after all attempts.")
             
             if target_state == 'Closed' and biggate_device.gate_state == 'Open':
-                total_time_open = attempts * wait_seconds
-                message = f"After Gate Open/Close command the gate is still open after {total_time_open} seconds"
+                message = f"After Gate Open/Close command the gate is still open after {deadline_seconds} seconds"
                 logging.info(f"Sending Telegram alert: {message}")
+                alert_due = time.monotonic()
+
+                def alert_sent(_message):
+                    # Ворота открыты с момента команды; оповещение - по истечении бюджета попыток
+                    sent = time.monotonic()
+                    labels = {'gate': biggate_device.name, 'alert': 'still_open_after_toggle'}
+                    GATE_ALERT_SECONDS.observe(sent - started, **labels)
+                    ALERT_DELIVERY_SECONDS.observe(sent - alert_due, **labels)
+
                 try:
-                    await send_message_with_buttons(text=message, button_names=[], time_out=0)
-                    # Останавливаем бота после уведомления
-                    try:
-                        await cleanup_bot()
-                        logging.info("Telegram bot stopped after gate alert.")
-                    except Exception as e:
-                        logging.warning(f"Error stopping bot after alert: {e}")
+                    await send_message_with_buttons(text=message, button_names=[], time_out=0, on_sent=alert_sent,
+                                                    priority=PRIORITY_CRITICAL)
                 except Exception as telegram_error:
                     logging.error(f"Failed to send Telegram message: {telegram_error}")
             
@@ -378,9 +616,108 @@ async def handle_biggate_after_toggle(biggate_device, initial_gate_state):
     finally:
         biggate_device.special_monitoring_active = False
         biggate_device.monitoring_text = "" # Очищаем детальный статус
-        await asyncio.to_thread(biggate_device._check_sensor_status, HA_CONFIG)
-        pending_updates[biggate_device.name] = biggate_device.to_dict()
+        await biggate_device._check_sensor_status(HA_CONFIG)
+        publish_device(biggate_device)
         logging.info(f"Special monitoring for {biggate_device.name} finished.")
+    return reached
+
+class GateCommand:
+    """Команда переключения ворот и ее текущий статус"""
+
+    def __init__(self, gate_name):
+        self.id = uuid.uuid4().hex[:12]
+        self.gate_name = gate_name
+        self.status = 'accepted'
+        self.message = ''
+        self.created_at = time.time()
+
+    def to_dict(self):
+        return {'id': self.id, 'gate': self.gate_name, 'status': self.status,
+                'message': self.message, 'created_at': self.created_at}
+
+class GateCommandExecutor:
+    """
+    Исполнитель команд одних ворот.
+    
+    Команда принимается сразу, импульс реле и ожидание результата выполняются
+    в фоне, а ход выполнения публикуется SSE-событием gate_command
+    (accepted -> running -> monitoring -> succeeded | timed_out | failed).
+    Пока команда активна, повторные нажатия возвращают ее же id.
+    """
+
+    def __init__(self, device, relay_ip):
+        self.device = device
+        self.relay_ip = relay_ip
+        self.active = None
+        self._task = None
+
+    def submit(self):
+        """Принимает команду; возвращает (команда, True) или (активная команда, False) при повторном нажатии"""
+        if self.active is not None:
+            return self.active, False
+        command = GateCommand(self.device.name)
+        GATE_COMMANDS[command.id] = command
+        while len(GATE_COMMANDS) > COMMAND_HISTORY_SIZE:
+            GATE_COMMANDS.popitem(last=False)
+        self.active = command
+        # Ворота исключаются из планового опроса до завершения команды
+        self.device.special_monitoring_active = True
+        self.device.monitoring_text = "Обработка..."
+        publish_device(self.device)
+        self._update(command, 'accepted')
+        self._task = asyncio.create_task(self._execute(command))
+        return command, True
+
+    def _update(self, command, status, message=''):
+        command.status = status
+        command.message = message
+        HUB.publish((0, {"event": "gate_command", "data": json.dumps(command.to_dict())}))
+
+    async def _execute(self, command):
+        device = self.device
+        try:
+            self._update(command, 'running')
+            await device._check_sensor_status(HA_CONFIG)
+            initial_state = device.gate_state
+            
+            if not await pulse_shelly_switch(self.relay_ip):
+                self._update(command, 'failed', "Gate toggle command failed.")
+                return
+            
+            logging.info(f"Gate toggle successful. Initial state was {initial_state}.")
+            self._update(command, 'monitoring', initial_state or '')
+            if await handle_biggate_after_toggle(device, initial_state):
+                self._update(command, 'succeeded', device.gate_state or '')
+            else:
+                self._update(command, 'timed_out', device.gate_state or '')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to toggle gate: {e}", exc_info=True)
+            self._update(command, 'failed', f"Gate control error: {e}")
+        finally:
+            device.special_monitoring_active = False
+            device.monitoring_text = ""
+            publish_device(device)
+            self.active = None
+            self._task = None
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+def create_gate_executors(devices, gate_ip):
+    """Исполнители команд для ворот с реле (сейчас это только BigGate)"""
+    executors = {}
+    if gate_ip:
+        for device in devices:
+            if device.name.lower() == 'biggate':
+                executors[device.name.lower()] = GateCommandExecutor(device, gate_ip)
+    return executors
 
 async def check_and_prepare_device(device):
     try:
@@ -396,98 +733,190 @@ async def check_and_prepare_device(device):
     except Exception as e:
         logging.error(f"Error in check_and_prepare_device for {device.name}: {e}")
         device.is_online = False; device.status_text = "Error"
-    return device.to_dict()
+    # Сериализацию для клиентов выполняет Device.payload (с кешем по версии состояния)
+    return device.is_online
+
+class ProbeLane:
+    """
+    Полоса проверок с собственным лимитом параллельности и таймаутом.
+    
+    Датчики ворот и пинги хостов идут по разным полосам, поэтому медленные
+    или недоступные хосты не задерживают обновление состояния ворот.
+    """
+
+    def __init__(self, name, concurrency, timeout):
+        self.name = name
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+
+    async def run(self, coro):
+        """Выполняет проверку в пределах лимита полосы; TimeoutError при превышении таймаута"""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            coro.close()
+            raise
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.wait_for(coro, timeout=self.timeout)
+        finally:
+            self._semaphore.release()
+
+class ProbeScheduler:
+    """
+    Единый фоновый планировщик проверок устройств.
+    
+    Каждое устройство проверяется по собственному расписанию (см. Device.schedule_next_probe),
+    результаты сохраняются в объектах Device, откуда их читает SSE-слой.
+    Устройства в режиме special_monitoring_active пропускаются - их обновляет
+    handle_biggate_after_toggle.
+    """
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.lanes = {
+            'sensor': ProbeLane('sensor', SENSOR_LANE_CONCURRENCY, SENSOR_PROBE_TIMEOUT),
+            'ping': ProbeLane('ping', PING_LANE_CONCURRENCY, PING_PROBE_TIMEOUT),
+        }
+        self._in_flight = set()
+        self._probe_tasks = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Незавершённые проверки отменяем до закрытия HTTP-клиентов, которыми они пользуются
+        for task in list(self._probe_tasks):
+            task.cancel()
+        if self._probe_tasks:
+            await asyncio.gather(*self._probe_tasks, return_exceptions=True)
+        self._probe_tasks.clear()
+
+    def probe_now(self, device):
+        """Запрашивает внеочередную проверку устройства"""
+        device.next_probe_at = 0.0
+        self._wakeup.set()
+
+    def wake(self):
+        """Пересматривает расписание (например, после изменения списка устройств)"""
+        self._wakeup.set()
+
+    def lane_for(self, device):
+        return self.lanes['sensor' if device.device_type == 'SENSOR' else 'ping']
+
+    async def _probe(self, device):
+        previous_status = (device.is_online, device.status_text)
+        lane = self.lane_for(device)
+        try:
+            await lane.run(check_and_prepare_device(device))
+        except asyncio.TimeoutError:
+            PROBE_TIMEOUTS.inc(lane=lane.name)
+            PROBE_FAILURES.inc(probe=device.probe_type, device=device.name)
+            logging.warning(f"Probe of {device.name} exceeded {lane.timeout}s in the {lane.name} lane")
+            device.is_online = False; device.status_text = "Offline"
+            if device.is_gate:
+                device.gate_state = "Error"
+        finally:
+            device.schedule_next_probe(previous_status)
+            self._in_flight.discard(device)
+            publish_device(device)
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            now = time.monotonic()
+            next_due = now + SCHEDULER_MAX_SLEEP
+            for device in self.devices:
+                if device in self._in_flight or device.special_monitoring_active:
+                    continue
+                if device.next_probe_at <= now:
+                    self._in_flight.add(device)
+                    task = asyncio.create_task(self._probe(device))
+                    self._probe_tasks.add(task)
+                    task.add_done_callback(self._probe_tasks.discard)
+                else:
+                    next_due = min(next_due, device.next_probe_at)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_due - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("status.html", {"request": request, "gate_control_available": bool(GATE_IP)})
 
+def order_gates_first(items):
+    """Сортирует (приоритет, событие): сначала ворота по gate_priority, затем остальные в исходном порядке"""
+    return [event for _, event in sorted(items, key=lambda item: item[0])]
+
 @app.get("/status-stream")
 async def status_stream(request: Request):
     async def event_generator():
-        while True:
-            if await request.is_disconnected(): break
+        events = HUB.subscribe()
+        try:
+            # Новый клиент сначала получает текущее состояние всех устройств (ворота первыми),
+            # затем только изменения
+            snapshot = [device_event(device) for device in DEVICES]
+            for event in order_gates_first(snapshot):
+                yield event
             
-            # Отправляем pending updates (с приоритетом для ворот)
-            if pending_updates:
-                # Сначала отправляем ворота (с сортировкой)
-                gate_updates = {}
-                other_updates = {}
-                
-                for name, data in pending_updates.items():
-                    if data.get('is_gate'):
-                        gate_updates[name] = data
-                    else:
-                        other_updates[name] = data
-                
-                # Сортируем ворота по приоритету
-                sorted_gates = sorted(gate_updates.items(), key=lambda x: x[1].get('gate_priority', 999))
-                
-                # Отправляем в порядке: сначала ворота, потом остальные
-                for name, data in sorted_gates:
-                    yield {"event": "device_status", "data": json.dumps(data)}
+            while True:
+                if await request.is_disconnected(): break
+                try:
+                    item = await asyncio.wait_for(events.get(), timeout=SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Изменений нет - отправляем лёгкий heartbeat вместо полного состояния
+                    yield {"event": "heartbeat", "data": ""}
+                    continue
                 
-                for name, data in other_updates.items():
-                    yield {"event": "device_status", "data": json.dumps(data)}
-                    
-                pending_updates.clear()
-
-            # ИЗМЕНЕНО: Отправляем данные по мере получения, а не ждем все устройства
-            tasks = [check_and_prepare_device(device) for device in DEVICES if not device.special_monitoring_active]
-            
-            # Обрабатываем результаты по мере их поступления
-            for task in asyncio.as_completed(tasks):
-                device_data = await task
-                if device_data: 
-                    # Отправляем данные немедленно, как только получили
-                    yield {"event": "device_status", "data": json.dumps(device_data)}
-
-            await asyncio.sleep(5)
+                # Забираем все накопившиеся события и отправляем ворота первыми
+                batch = [item]
+                while not events.empty():
+                    batch.append(events.get_nowait())
+                for event in order_gates_first(batch):
+                    yield event
+        finally:
+            HUB.unsubscribe(events)
     return EventSourceResponse(event_generator())
 
-@app.post("/toggle-gate")
+@app.post("/toggle-gate", status_code=202)
 async def toggle_gate():
-    global last_gate_toggle
-    
+    """Принимает команду и сразу отвечает 202; результат приходит по SSE (gate_command)"""
     if not GATE_IP: raise HTTPException(404, "Gate IP not configured")
-    if time.time() - last_gate_toggle < 2: raise HTTPException(429, "Please wait")
     
-    # Ищем BigGate устройство (учитываем что имя может быть в разных регистрах)
-    biggate_device = None
-    for d in DEVICES:
-        if d.name.lower() == 'biggate':
-            biggate_device = d
-            break
+    executor = GATE_EXECUTORS.get('biggate')
+    if executor is None: raise HTTPException(404, "BigGate device not found")
     
-    if not biggate_device: raise HTTPException(404, "BigGate device not found")
-    if biggate_device.special_monitoring_active: raise HTTPException(409, "Gate is already in a toggling process.")
+    command, created = executor.submit()
+    if not created:
+        logging.info(f"Repeated gate press joined command {command.id}")
+    return JSONResponse({"status": command.status, "command_id": command.id, "deduplicated": not created},
+                        status_code=202)
 
-    try:
-        biggate_device.special_monitoring_active = True
-        last_gate_toggle = time.time()
-        
-        # Устанавливаем первоначальный детальный статус для строки под кнопкой
-        biggate_device.monitoring_text = "Обработка..."
-        pending_updates[biggate_device.name] = biggate_device.to_dict()
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus (см. Metrics.py)"""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
-        await asyncio.to_thread(biggate_device._check_sensor_status, HA_CONFIG)
-        initial_state = biggate_device.gate_state
-        
-        success = await asyncio.to_thread(control_shelly_switch, GATE_IP)
-        
-        if success:
-            logging.info(f"Gate toggle successful. Initial state was {initial_state}.")
-            asyncio.create_task(handle_biggate_after_toggle(biggate_device, initial_state))
-            # Убираем сообщение об успехе отсюда, т.к. статус будет приходить по SSE
-            return JSONResponse({"status": "success"})
-        else:
-            biggate_device.special_monitoring_active = False
-            raise HTTPException(500, "Gate toggle command failed.")
-            
-    except Exception as e:
-        biggate_device.special_monitoring_active = False
-        logging.error(f"Failed to toggle gate: {e}", exc_info=True)
-        raise HTTPException(500, f"Gate control error: {e}")
+@app.get("/commands/{command_id}")
+async def command_status(command_id: str):
+    command = GATE_COMMANDS.get(command_id)
+    if command is None: raise HTTPException(404, "Command not found")
+    return command.to_dict()
 
 if __name__ == "__main__":
     import uvicorn
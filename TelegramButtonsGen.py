@@ -15,61 +15,675 @@
 #   to `send_message_with_buttons`, then reused for all subsequent calls.
 #
 # Public API:
-# - async def send_message_with_buttons(text: str, button_names: list, time_out: int = 60) -> str:
+# - async def send_message_with_buttons(text: str, button_names: list, time_out: int = 60, on_sent=None) -> str:
 #   - Sends a message with buttons and waits for a user response.
 #   - Returns the callback_data of the pressed button (as a string, e.g., "1", "2").
 #   - Returns "-1" on timeout.
 #   - Returns "-2" on an internal error.
+#   - on_sent(message) is called as soon as Telegram has accepted the message
+#     (used to measure alert delivery time, see Metrics.py).
+#   - Built on PROMPTS (below), so any number of calls can wait concurrently.
+#
+# - PROMPTS (class PromptManager), the multiplexed prompt manager:
+#   - async PROMPTS.open(text, button_names, time_out, on_timeout=None, on_sent=None) -> Prompt
+#     sends the message and returns at once; many prompts (e.g. one per gate)
+#     can be outstanding at the same time.
+#   - Every Prompt has its own deadline (a loop timer, no task per prompt),
+#     `await prompt.wait()`, `prompt.cancel()` (result "-3") and an optional
+#     on_timeout(prompt) callback (plain function or coroutine function).
+#   - All prompts are served by the one polling bot instance; a button press is
+#     routed to its prompt by message_id.
+#   - `await prompt.dismiss(text)` withdraws a prompt that is no longer relevant
+#     (e.g. the gate was closed by hand): result "-3", and the message is
+#     edited to `text` with the buttons removed.
+#
+# - class StatusMessage(title=None, message_id=None, priority=PRIORITY_NORMAL):
+#   - Live status of one cycle: posted once, then `await status.update(text)`
+#     edits the same message (editMessageText through OUTBOX; a queued edit of
+#     the same message is replaced, only the latest state is sent).
+#   - StatusMessage.for_prompt(prompt, title) continues a prompt's message.
+#   - update(text, alert=True) posts a new message (edits do not notify the
+#     user) and the following updates edit that one.
+#
+# - async def send_prompt(text, button_names, time_out, on_timeout=None, on_sent=None) -> Prompt:
+#   - Non-blocking counterpart of send_message_with_buttons: returns the Prompt
+#     handle as soon as the message is sent, so the caller can keep watching
+#     the gate while waiting for the answer. Send errors are raised.
+#
+# - OUTBOX (class OutboundQueue), the outbound queue every send goes through:
+#   - one sender task, at most one message per SEND_INTERVAL (Telegram's
+#     per-chat flood limit); priorities PRIORITY_CRITICAL (prompts, "gate still
+#     open") < PRIORITY_NORMAL < PRIORITY_INFO, so critical alerts overtake the rest;
+#   - queued PRIORITY_INFO messages are merged into one message;
+#   - 429 RetryAfter is retried after `retry_after`, network errors with
+#     exponential backoff (SEND_ATTEMPTS, SEND_BACKOFF_MAX);
+#   - flushed (up to FLUSH_TIMEOUT) before the bot is shut down.
+#
+# - def send_notice(text, priority=PRIORITY_INFO) -> asyncio.Future:
+#   - Fire-and-forget notice through OUTBOX (the future holds the sent Message).
+#   - send_message_with_buttons(text, [], priority=...) is the awaiting variant.
 #
 # - async def cleanup_bot():
 #   - Gracefully shuts down the persistent bot instance.
 #   - Intended to be called by the host application upon its exit.
+#   - In notifier mode (see below) it is a no-op, so legacy "stop after every
+#     message" calls no longer force a cold start on the next alert.
+#   - While other prompts are still outstanding the shutdown is deferred until
+#     the last of them is finished, so one caller cannot kill another's prompt.
+#
+# - async def start_notifier(health_check_interval: int = 60):
+#   - Long-lived notifier mode for monitors: starts the bot once and keeps it
+#     running, checks its health periodically (getMe + updater state) and
+#     re-creates it after a failure. Outstanding button prompts survive a restart.
+#   - receive_updates=False starts a send-only bot (no getUpdates, no webhook)
+#     for processes that never wait for a button press, e.g. the web interface.
+#     Telegram delivers a bot's updates to one receiver only: a second polling
+#     process gets 409 Conflict (logged as an error) and may take button presses
+#     meant for the other one. Run all gates in one GateMonitorEngine.py.
+#
+# - async def stop_notifier():
+#   - Leaves notifier mode and shuts the bot down. Called by the host on exit.
+#
+# - Webhook mode ([Telegram ID] webhook_url, see gate_check.ini.template):
+#   - Instead of updater.start_polling() the bot registers webhook_url
+#     (setWebhook, callback queries only, secret_token and optional
+#     self-signed certificate) and runs a minimal HTTP/1.1 keep-alive listener
+#     on webhook_listen:webhook_port (HTTPS with webhook_cert/webhook_key).
+#     A button press then reaches the bot in a single Telegram -> bot request.
+#   - Every request must carry the secret token (webhook_secret, or a random
+#     one generated per process and passed to setWebhook): 403 otherwise,
+#     400 for a malformed body, 503 while the bot is not running (Telegram
+#     retries). Button presses from any chat but chat_id (numeric ID or
+#     @channelusername) are ignored and logged.
+#
+# - def is_configured_chat(chat, chat_id) -> bool: the chat check used above.
+#   - The health check verifies with getWebhookInfo that the webhook is still
+#     registered and re-registers it otherwise.
+#   - async def process_webhook_update(data, secret_token=None) -> bool feeds an
+#     update received by a host's own HTTP server.
+#
+# - def get_bot_stats() -> dict:
+#   - Timing instrumentation: number and duration of cold starts
+#     (initialize + start_polling + start) and the cold starts avoided by notifier mode.
+#   - sendMessage latency, prompt outcomes and errors are also exported through
+#     Metrics.py (gatecheck_telegram_*).
 #
 # --- END OF DESCRIPTION ---
 
-import configparser
 import asyncio
+import heapq
+import hmac
+import inspect
+import itertools
+import json
 import logging
+import secrets
+import ssl
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Conflict, Forbidden, InvalidToken, NetworkError, RetryAfter, TelegramError
 from telegram.ext import Application, ContextTypes, CallbackQueryHandler
 
+from AppConfig import ConfigError, gate_check_config
+from Metrics import (TELEGRAM_COALESCED, TELEGRAM_ERRORS, TELEGRAM_PROMPTS, TELEGRAM_QUEUE, TELEGRAM_RETRIES,
+                     TELEGRAM_SEND_SECONDS)
+
 # --- НАСТРОЙКА ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Логирование настраивает основная программа (см. main_test)
 logger = logging.getLogger(__name__)
 
-# Загрузка конфигурации из файла gate_check.ini
-config = configparser.ConfigParser()
-config.read('gate_check.ini')
-TOKEN = config['Telegram ID']['TOKEN'].strip('"')
-CHAT_ID = config['Telegram ID']['chat_id'].strip('"')
+
+def _telegram_config():
+    """
+    Параметры бота из секции [Telegram ID] gate_check.ini. Файл разбирается
+    один раз при первом использовании и перечитывается только при изменении.
+    """
+    telegram = gate_check_config().current.telegram
+    if telegram is None:
+        raise ConfigError("Section [Telegram ID] not found in gate_check.ini")
+    return telegram
+
+
+# Параметры проверки бота в режиме notifier
+HEALTH_CHECK_TIMEOUT = 10
+HEALTH_RETRY_MIN = 5
+
+# Приемник веб-хука
+WEBHOOK_IDLE_TIMEOUT = 120        # Сколько держать простаивающее keep-alive соединение Telegram (сек)
+WEBHOOK_MAX_BODY = 1024 * 1024    # Максимальный размер тела запроса (байт)
 
 
 # --- СОСТОЯНИЕ МОДУЛЯ ---
 # Эти переменные будут хранить единственный экземпляр бота для всей сессии
 _application = None
 _is_initialized = False
+_init_lock = asyncio.Lock()
+_webhook_server: Optional[asyncio.AbstractServer] = None
+# Секрет веб-хука, если webhook_secret не задан: создается один раз на время работы процесса
+_generated_webhook_secret: Optional[str] = None
+
+# Результаты запроса, кроме номера кнопки
+PROMPT_TIMEOUT = "-1"
+PROMPT_ERROR = "-2"
+PROMPT_CANCELLED = "-3"
+
+# Режим постоянного бота (start_notifier) и его фоновая проверка
+_persistent = False
+# False - только отправка: ни опроса getUpdates, ни веб-хука (см. start_notifier)
+_receive_updates = True
+_health_task = None
+_health_wakeup = None
+
+# Статистика холодных стартов
+_stats = {
+    'cold_starts': 0,
+    'last_cold_start_sec': None,
+    'total_cold_start_sec': 0.0,
+    'avoided_cold_starts': 0,
+    'restarts_after_failure': 0,
+}
+
+
+# Остановка бота отложена до завершения последнего запроса (см. cleanup_bot)
+_shutdown_when_idle = False
+
+
+# --- ИСХОДЯЩАЯ ОЧЕРЕДЬ ---
+
+# Приоритеты исходящих сообщений (меньше - раньше)
+PRIORITY_CRITICAL = 0   # "ворота все еще открыты", запросы с кнопками
+PRIORITY_NORMAL = 1     # важные уведомления (закрытие по умолчанию, критический заряд)
+PRIORITY_INFO = 2       # информационные; стоящие в очереди объединяются в одно сообщение
+
+SEND_INTERVAL = 1.0         # Пауза между сообщениями в один чат (лимит Telegram ~1 сообщение/сек)
+SEND_ATTEMPTS = 5           # Попыток отправки при сетевых ошибках
+SEND_BACKOFF_MAX = 30       # Максимальная пауза между попытками (сек)
+MESSAGE_MAX_LENGTH = 4096   # Максимальная длина сообщения Telegram
+FLUSH_TIMEOUT = 10          # Сколько ждать отправки очереди при остановке бота (сек)
+
+# Ошибки, которые не исправит повторная отправка
+_PERMANENT_ERRORS = (BadRequest, Forbidden, InvalidToken)
+
+
+class _Outgoing:
+    """Сообщение в исходящей очереди"""
+
+    __slots__ = ('priority', 'seq', 'text', 'reply_markup', 'kind', 'message_id', 'future', 'attempts')
+
+    def __init__(self, priority: int, seq: int, text: str, reply_markup, kind: str, message_id: Optional[int] = None):
+        self.priority = priority
+        self.seq = seq
+        self.text = text
+        self.reply_markup = reply_markup
+        self.kind = kind
+        self.message_id = message_id   # Не None - editMessageText этого сообщения
+        self.future = asyncio.get_running_loop().create_future()
+        self.attempts = 0
+
+    def __lt__(self, other: '_Outgoing') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    @property
+    def mergeable(self) -> bool:
+        return self.priority == PRIORITY_INFO and self.reply_markup is None and self.message_id is None
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+def _consume_exception(future: asyncio.Future):
+    """Ошибку отправки уже записал журнал; не ждущие результата вызывающие не получат предупреждение asyncio"""
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений с одним отправителем: сообщения уходят по
+    приоритету, не чаще SEND_INTERVAL, стоящие в очереди информационные
+    объединяются в одно, 429 (retry_after) и сетевые ошибки повторяются с паузой.
+    """
+
+    def __init__(self, send_interval: float = SEND_INTERVAL):
+        self.send_interval = send_interval
+        self._heap: List[_Outgoing] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_send_at = 0.0   # loop.time(), раньше которого не отправляем (пауза между сообщениями)
+        self._hold_until = 0.0     # loop.time() окончания retry_after/backoff - действует на все сообщения
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def submit(self, text: str, priority: int = PRIORITY_INFO, reply_markup=None, kind: str = 'notice',
+               message_id: Optional[int] = None) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь и сразу возвращает Future с отправленным
+        Message (или ошибкой отправки). Ждать его не обязательно.
+        С message_id вместо нового сообщения изменяется это (editMessageText);
+        еще не отправленное изменение того же сообщения заменяется новым текстом.
+        """
+        self._ensure_worker()
+        if message_id is not None:
+            queued = next((item for item in self._heap
+                           if item.message_id == message_id and not item.future.done()), None)
+            if queued is not None:
+                # Пользователь увидит только последнее состояние - промежуточное не отправляем
+                queued.text, queued.reply_markup = text, reply_markup
+                if priority < queued.priority:
+                    queued.priority = priority
+                    heapq.heapify(self._heap)
+                TELEGRAM_COALESCED.inc()
+                return queued.future
+        item = _Outgoing(priority, next(self._seq), text, reply_markup, kind, message_id)
+        item.future.add_done_callback(_consume_exception)
+        heapq.heappush(self._heap, item)
+        self._idle.clear()
+        self._wakeup.set()
+        return item.future
+
+    async def send(self, text: str, priority: int = PRIORITY_NORMAL, reply_markup=None, kind: str = 'notice',
+                   message_id: Optional[int] = None):
+        """Отправляет через очередь и ждет результата. Отмена вызывающего снимает сообщение."""
+        return await self.submit(text, priority, reply_markup, kind, message_id)
+
+    async def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """Ждет, пока очередь опустеет. False - не успела за timeout."""
+        if self._task is None or self._task.done():
+            return not self._heap
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, timeout: float = FLUSH_TIMEOUT):
+        """Отправляет оставшееся (не дольше timeout) и останавливает отправителя"""
+        if not await self.flush(timeout):
+            logger.warning(f"Telegram: не отправлено сообщений из очереди: {len(self._heap)}")
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for item in self._heap:
+            item.future.cancel()
+        self._heap.clear()
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="telegram-outbox")
+
+    def _take_batch(self) -> List[_Outgoing]:
+        """Следующее сообщение; информационные объединяются, пока помещаются в одно"""
+        batch, length = [], 0
+        while self._heap:
+            item = self._heap[0]
+            if item.future.done():
+                # Вызывающий отменил ожидание - не отправляем
+                heapq.heappop(self._heap)
+                continue
+            if batch and (not item.mergeable or length + len(item.text) + 1 > MESSAGE_MAX_LENGTH):
+                break
+            heapq.heappop(self._heap)
+            batch.append(item)
+            length += len(item.text) + 1
+            if not item.mergeable:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Пауза между сообщениями: за это время информационные накапливаются,
+            # а более важные, пришедшие позже, встают впереди. Критические ее не ждут,
+            # но retry_after Telegram соблюдают все.
+            now = loop.time()
+            delay = self._hold_until - now
+            if self._heap[0].priority != PRIORITY_CRITICAL:
+                delay = max(delay, self._next_send_at - now)
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            batch = self._take_batch()
+            if batch:
+                await self._deliver(batch, loop)
+
+    async def _deliver(self, batch: List[_Outgoing], loop: asyncio.AbstractEventLoop):
+        first = batch[0]
+        text = "\n".join(item.text for item in batch)
+        try:
+            await _initialize_bot_if_needed()
+            with TELEGRAM_SEND_SECONDS.time(kind=first.kind):
+                if first.message_id is not None:
+                    message = await _application.bot.edit_message_text(
+                        text=text,
+                        chat_id=_telegram_config().chat_id,
+                        message_id=first.message_id,
+                        reply_markup=first.reply_markup
+                    )
+                else:
+                    message = await _application.bot.send_message(
+                        chat_id=_telegram_config().chat_id,
+                        text=text,
+                        reply_markup=first.reply_markup
+                    )
+        except BadRequest as e:
+            if first.message_id is None or 'not modified' not in str(e).lower():
+                self._fail(batch, e, loop)
+                return
+            # Текст не изменился - для изменения это не ошибка
+            message = None
+        except RetryAfter as e:
+            # Лимит Telegram: ждем сколько сказано и отправляем снова (в порядке приоритета)
+            wait = _retry_after_seconds(e)
+            TELEGRAM_RETRIES.inc(reason='retry_after')
+            logger.warning(f"Telegram flood limit: повтор через {wait:.0f} сек (сообщений в очереди: {len(self) + len(batch)})")
+            self._requeue(batch)
+            self._hold_until = loop.time() + wait
+            return
+        except Exception as e:
+            first.attempts += 1
+            if isinstance(e, NetworkError) and not isinstance(e, _PERMANENT_ERRORS) and first.attempts < SEND_ATTEMPTS:
+                backoff = min(2 ** first.attempts, SEND_BACKOFF_MAX)
+                TELEGRAM_RETRIES.inc(reason='network')
+                logger.warning(f"Ошибка отправки в Telegram ({e}), попытка {first.attempts}/{SEND_ATTEMPTS}, "
+                               f"повтор через {backoff} сек")
+                self._requeue(batch)
+                self._hold_until = loop.time() + backoff
+                return
+            self._fail(batch, e, loop)
+            return
+
+        self._next_send_at = loop.time() + self.send_interval
+        if len(batch) > 1:
+            TELEGRAM_COALESCED.inc(len(batch) - 1)
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(message)
+
+    def _fail(self, batch: List[_Outgoing], error: Exception, loop: asyncio.AbstractEventLoop):
+        first = batch[0]
+        TELEGRAM_ERRORS.inc(operation='send' if first.message_id is None else 'edit')
+        if first.message_id is None:
+            logger.error(f"Не удалось отправить сообщение в Telegram: {error}")
+        else:
+            logger.warning(f"Не удалось изменить сообщение {first.message_id}: {error}")
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(error)
+        # В режиме notifier сразу проверяем состояние бота
+        if _health_wakeup is not None and not isinstance(error, BadRequest):
+            _health_wakeup.set()
+        self._next_send_at = loop.time() + self.send_interval
+
+    def _requeue(self, batch: List[_Outgoing]):
+        for item in batch:
+            if not item.future.done():
+                heapq.heappush(self._heap, item)
+
+
+OUTBOX = OutboundQueue()
+TELEGRAM_QUEUE.set_function(OUTBOX.__len__)
+
+
+# --- МЕНЕДЖЕР ЗАПРОСОВ С КНОПКАМИ ---
+
+class Prompt:
+    """Отправленное сообщение с кнопками, ожидающее ответа"""
+
+    def __init__(self, manager: 'PromptManager', message_id: int, deadline: float,
+                 on_timeout: Optional[Callable] = None):
+        self.message_id = message_id
+        self.deadline = deadline          # loop.time() истечения
+        self.on_timeout = on_timeout
+        self.future = asyncio.get_running_loop().create_future()
+        self._manager = manager
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def result(self) -> Optional[str]:
+        """Результат запроса или None, пока ответа нет"""
+        return self.future.result() if self.future.done() else None
+
+    async def wait(self) -> str:
+        """Ждет ответа. Отмена ожидающей задачи не отменяет сам запрос."""
+        return await asyncio.shield(self.future)
+
+    def cancel(self) -> bool:
+        """Снимает запрос (результат "-3"). False, если он уже завершен."""
+        return self._manager.resolve(self.message_id, PROMPT_CANCELLED, outcome='cancelled')
+
+    async def dismiss(self, text: Optional[str] = None) -> bool:
+        """
+        Снимает запрос, ставший неактуальным, и заменяет текст сообщения на text
+        (кнопки при этом исчезают). False, если ответ уже получен.
+        """
+        if not self._manager.resolve(self.message_id, PROMPT_CANCELLED, outcome='dismissed'):
+            return False
+        if text:
+            await _edit_message(self.message_id, text)
+        return True
+
+
+class PromptManager:
+    """
+    Хранит все ожидающие ответа запросы процесса. Нажатия кнопок приходят через
+    единственный экземпляр бота и направляются запросу по message_id; у каждого
+    запроса свой таймер истечения. Хранится вне экземпляра бота, чтобы запросы
+    переживали его перезапуск в режиме notifier.
+    """
+
+    def __init__(self):
+        self._prompts: Dict[int, Prompt] = {}
+        self._callback_tasks = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._prompts)
+
+    def get(self, message_id: int) -> Optional[Prompt]:
+        return self._prompts.get(message_id)
+
+    async def open(self, text: str, button_names: list, time_out: float,
+                   on_timeout: Optional[Callable] = None, on_sent=None,
+                   priority: int = PRIORITY_CRITICAL) -> Prompt:
+        """
+        Отправляет сообщение с кнопками (через OUTBOX, по умолчанию вне очереди)
+        и сразу возвращает Prompt. on_timeout(prompt) вызывается при истечении
+        time_out секунд без ответа. Исключения отправки передаются вызывающему.
+        """
+        if not _receive_updates:
+            raise RuntimeError("Telegram bot is send-only (start_notifier(receive_updates=False)): "
+                               "button prompts cannot be answered")
+        keyboard = [
+            # Нумеруем callback_data с 1, как ожидают вызывающие программы
+            [InlineKeyboardButton(name, callback_data=str(i + 1))]
+            for i, name in enumerate(button_names)
+        ]
+        message = await OUTBOX.send(text, priority, reply_markup=InlineKeyboardMarkup(keyboard), kind='prompt')
+        if on_sent is not None:
+            on_sent(message)
+
+        loop = asyncio.get_running_loop()
+        prompt = Prompt(self, message.message_id, loop.time() + float(time_out), on_timeout)
+        self._prompts[prompt.message_id] = prompt
+        prompt._timer = loop.call_at(prompt.deadline, self._expire, prompt.message_id)
+        logger.info(f"Сообщение (ID: {message.message_id}) отправлено. Ожидание ответа {time_out} сек "
+                    f"(ожидающих запросов: {self.pending})...")
+        return prompt
+
+    def resolve(self, message_id: int, result: str, outcome: str = 'answered') -> bool:
+        """Завершает запрос с результатом result. False, если запроса уже нет."""
+        prompt = self._prompts.pop(message_id, None)
+        if prompt is None:
+            return False
+        if prompt._timer is not None:
+            prompt._timer.cancel()
+        if not prompt.future.done():
+            prompt.future.set_result(result)
+        TELEGRAM_PROMPTS.inc(result=outcome)
+        if not self._prompts and _shutdown_when_idle and not _persistent:
+            self._spawn(_shutdown_idle_bot())
+        return True
+
+    def _expire(self, message_id: int):
+        prompt = self._prompts.get(message_id)
+        if prompt is None or not self.resolve(message_id, PROMPT_TIMEOUT, outcome='timeout'):
+            return
+        logger.warning(f"Время ожидания ответа на сообщение {message_id} истекло.")
+        if prompt.on_timeout is None:
+            return
+        try:
+            result = prompt.on_timeout(prompt)
+            if inspect.isawaitable(result):
+                self._spawn(result)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике таймаута запроса {message_id}: {e}")
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._callback_tasks.add(task)
+        task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Future):
+        self._callback_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка в фоновой задаче запроса: {task.exception()}")
+
+
+PROMPTS = PromptManager()
+
+
+# --- СООБЩЕНИЕ СО СТАТУСОМ ---
+
+class StatusMessage:
+    """
+    "Живое" сообщение о ходе одного цикла (оповещение -> выбор -> закрытие):
+    отправляется один раз и дальше изменяется через editMessageText, вместо
+    нового сообщения на каждый шаг. Изменения не создают уведомлений в
+    Telegram, поэтому для тревоги есть update(..., alert=True).
+    """
+
+    def __init__(self, title: Optional[str] = None, message_id: Optional[int] = None,
+                 priority: int = PRIORITY_NORMAL):
+        """
+        Args:
+            title: Неизменная первая часть сообщения (например, текст оповещения)
+            message_id: Уже отправленное сообщение (например, Prompt), которое станет статусным
+            priority: Приоритет в исходящей очереди
+        """
+        self.title = title
+        self.message_id = message_id
+        self.priority = priority
+        self.text: Optional[str] = None
+
+    @classmethod
+    def for_prompt(cls, prompt: Prompt, title: Optional[str] = None, priority: int = PRIORITY_NORMAL):
+        """Продолжает сообщение запроса: после ответа оно показывает ход выполнения"""
+        return cls(title, prompt.message_id, priority)
+
+    def _render(self, text: str) -> str:
+        return f"{self.title}\n\n{text}" if self.title else text
+
+    async def update(self, text: str, alert: bool = False, priority: Optional[int] = None) -> bool:
+        """
+        Показывает новое состояние. Первое обновление (или alert=True - тревога,
+        о которой нужно уведомить) отправляет новое сообщение и ждет его отправки;
+        последующие изменяют его без ожидания. False - сообщение не отправлено.
+        """
+        self.text = text
+        priority = self.priority if priority is None else priority
+        if alert or self.message_id is None:
+            try:
+                message = await OUTBOX.send(text if alert else self._render(text), priority, kind='status')
+            except Exception:
+                return False
+            # Дальнейшие шаги изменяют последнее отправленное сообщение
+            self.title = None if alert else self.title
+            self.message_id = message.message_id
+            return True
+        message_id = self.message_id
+        future = OUTBOX.submit(self._render(text), priority, kind='edit', message_id=message_id)
+        future.add_done_callback(lambda done: self._edit_done(done, message_id))
+        return True
+
+    def _edit_done(self, future: asyncio.Future, message_id: int):
+        # Сообщение удалено или слишком старое для изменения - следующее обновление отправит новое
+        if not future.cancelled() and isinstance(future.exception(), BadRequest) and self.message_id == message_id:
+            self.message_id = None
 
 
 # --- ВНУТРЕННИЕ ФУНКЦИИ МОДУЛЯ ---
 
 async def _button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Единый обработчик кнопок. Находит соответствующий Future-объект
-    в "памяти" бота и передает в него результат нажатия.
+    Единый обработчик кнопок. Передает данные кнопки (например, '1', '2')
+    запросу с этим message_id.
     """
     query = update.callback_query
+    if query.message is None or not is_configured_chat(query.message.chat, _telegram_config().chat_id):
+        # Кнопки отправляются только в настроенный чат: чужой callback не может управлять воротами
+        TELEGRAM_ERRORS.inc(operation='callback')
+        chat = query.message.chat if query.message is not None else None
+        logger.warning(f"Отклонено нажатие кнопки не из настроенного чата {_telegram_config().chat_id} "
+                       f"(chat: {chat.id if chat else None} @{chat.username if chat else None}, "
+                       f"from: {query.from_user.id})")
+        return
+    message_id = query.message.message_id
+    # Сначала результат: действие по кнопке не ждет ответа Telegram на answerCallbackQuery
+    resolved = PROMPTS.resolve(message_id, query.data)
     await query.answer()
 
-    message_id = query.message.message_id
-    if 'pending_futures' in context.bot_data and message_id in context.bot_data['pending_futures']:
-        future = context.bot_data['pending_futures'].pop(message_id)
-        if not future.done():
-            # Передаем данные кнопки (например, '1', '2') в Future
-            future.set_result(query.data)
-        await query.edit_message_text(text=f"Thank you! Your choice has been received.")
+    # Через очередь: следующее изменение статуса того же сообщения заменит этот текст, а не наоборот
+    if resolved:
+        OUTBOX.submit("Thank you! Your choice has been received.", PRIORITY_NORMAL, kind='edit', message_id=message_id)
     else:
         # Этот запрос мог истечь по таймауту или уже был обработан
-        await query.edit_message_text(text=f"This query is no longer active")
+        OUTBOX.submit("This query is no longer active", PRIORITY_NORMAL, kind='edit', message_id=message_id)
+
+
+def is_configured_chat(chat, chat_id) -> bool:
+    """
+    Совпадает ли чат с [Telegram ID] chat_id. Bot API допускает и числовой ID,
+    и @username канала, поэтому сравниваются оба (имя - без учета регистра).
+    """
+    configured = str(chat_id).strip()
+    if configured == str(chat.id):
+        return True
+    return configured.startswith('@') and bool(chat.username) and configured[1:].lower() == chat.username.lower()
+
+
+async def _edit_message(message_id: int, text: str, priority: int = PRIORITY_NORMAL) -> bool:
+    """Заменяет текст отправленного сообщения (без кнопок). Ошибки только логируются (очередью)."""
+    try:
+        await OUTBOX.send(text, priority, kind='edit', message_id=message_id)
+        return True
+    except Exception:
+        return False
 
 
 async def _initialize_bot_if_needed():
@@ -77,96 +691,431 @@ async def _initialize_bot_if_needed():
     Приватная функция. Проверяет, запущен ли бот. Если нет - создает
     и запускает единственный экземпляр на все время работы программы.
     """
-    global _application, _is_initialized
-    if _is_initialized:
-        return
+    async with _init_lock:
+        if _is_initialized:
+            return
+        await _start_application()
+
 
+async def _start_application():
+    global _application, _is_initialized
     logger.info("Первый вызов. Инициализация постоянного экземпляра Telegram-бота...")
+    start_time = time.perf_counter()
     
     # Создаем экземпляр приложения
-    _application = Application.builder().token(TOKEN).build()
+    telegram = _telegram_config()
+    builder = Application.builder().token(telegram.token)
+    if telegram.api_url:
+        # Другой адрес Bot API: локальный Bot API сервер или FakeTelegram в бенчмарках
+        builder = builder.base_url(telegram.api_url)
+    if not _receive_updates:
+        # Без Updater: процесс только отправляет и не забирает чужие нажатия кнопок
+        builder = builder.updater(None)
+    _application = builder.build()
     
     # Добавляем единственный, постоянный обработчик кнопок
-    _application.add_handler(CallbackQueryHandler(_button_callback))
-    
-    # Инициализируем "память" бота для хранения Future-объектов
-    _application.bot_data['pending_futures'] = {}
+    if _receive_updates:
+        _application.add_handler(CallbackQueryHandler(_button_callback))
 
     # Запускаем все компоненты бота (включая опрос)
-    await _application.initialize()
-    await _application.updater.start_polling()
-    await _application.start()
+    try:
+        await _application.initialize()
+        initialized_at = time.perf_counter()
+        if _receive_updates and telegram.webhook_url:
+            await _start_webhook(telegram)
+        elif _receive_updates:
+            await _application.updater.start_polling(error_callback=_polling_error)
+        polling_at = time.perf_counter()
+        await _application.start()
+        finished_at = time.perf_counter()
+    except Exception:
+        TELEGRAM_ERRORS.inc(operation='start')
+        # Не оставляем частично запущенный экземпляр
+        _is_initialized = True
+        await _shutdown_application()
+        raise
     
     _is_initialized = True
-    logger.info("Постоянный экземпляр Telegram-бота успешно запущен и работает в фоновом режиме.")
+    duration = finished_at - start_time
+    _stats['cold_starts'] += 1
+    _stats['last_cold_start_sec'] = duration
+    _stats['total_cold_start_sec'] += duration
+    logger.info(
+        f"Постоянный экземпляр Telegram-бота успешно запущен и работает в фоновом режиме. "
+        f"Cold start {duration:.3f}s (initialize {initialized_at - start_time:.3f}s, "
+        f"{_receive_mode(telegram)} {polling_at - initialized_at:.3f}s, "
+        f"start {finished_at - polling_at:.3f}s)"
+    )
+
+
+def _receive_mode(telegram) -> str:
+    if not _receive_updates:
+        return 'send_only'
+    return 'set_webhook' if telegram.webhook_url else 'start_polling'
+
+
+def _polling_error(error: TelegramError):
+    """Ошибки getUpdates. Conflict (409) - бота опрашивает еще один процесс."""
+    if isinstance(error, Conflict):
+        TELEGRAM_ERRORS.inc(operation='conflict')
+        logger.error("Telegram: getUpdates для этого бота выполняет другой процесс (409 Conflict). "
+                     "Нажатия кнопок получает только один процесс - запустите все ворота в одном "
+                     "GateMonitorEngine.py.")
+    else:
+        logger.warning(f"Ошибка опроса Telegram: {error}")
+
+
+# --- ПРИЕМ ОБНОВЛЕНИЙ ВЕБ-ХУКОМ ---
+
+async def _start_webhook(telegram):
+    """Запускает HTTP-приемник (если еще не запущен) и регистрирует веб-хук в Telegram"""
+    global _webhook_server
+    if _webhook_server is None:
+        context = None
+        if telegram.webhook_cert:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(telegram.webhook_cert, telegram.webhook_key)
+        _webhook_server = await asyncio.start_server(_handle_webhook_connection, telegram.webhook_listen,
+                                                     telegram.webhook_port, ssl=context)
+        logger.info(f"Приемник веб-хука Telegram слушает {telegram.webhook_listen}:{telegram.webhook_port}")
+    certificate = None
+    if telegram.webhook_cert:
+        with open(telegram.webhook_cert, 'rb') as f:
+            certificate = f.read()
+    await _application.bot.set_webhook(
+        url=telegram.webhook_url,
+        certificate=certificate,
+        secret_token=_webhook_secret(telegram),
+        allowed_updates=[Update.CALLBACK_QUERY],
+    )
+
+
+async def _stop_webhook():
+    """
+    Останавливает приемник. Сам веб-хук не удаляется: обновления, пришедшие
+    во время перезапуска, Telegram доставит повторно.
+    """
+    global _webhook_server
+    if _webhook_server is not None:
+        _webhook_server.close()
+        await _webhook_server.wait_closed()
+        _webhook_server = None
+
+
+def _webhook_secret(telegram) -> str:
+    """
+    Секрет веб-хука: webhook_secret из конфигурации, а без него - случайный,
+    который передается в setWebhook. Без секрета приемник принял бы поддельные
+    нажатия кнопок от любого, кто знает адрес.
+    """
+    global _generated_webhook_secret
+    if telegram.webhook_secret:
+        return telegram.webhook_secret
+    if _generated_webhook_secret is None:
+        _generated_webhook_secret = secrets.token_urlsafe(32)
+        logger.info("webhook_secret не задан: веб-хук зарегистрирован со случайным секретом")
+    return _generated_webhook_secret
+
+
+def _check_webhook_secret(secret_token: Optional[str]) -> bool:
+    secret = _webhook_secret(_telegram_config())
+    if hmac.compare_digest((secret_token or '').encode(), secret.encode()):
+        return True
+    TELEGRAM_ERRORS.inc(operation='webhook')
+    logger.warning("Веб-хук Telegram: отклонен запрос с неверным секретом")
+    return False
+
+
+async def _dispatch_webhook_update(data) -> str:
+    """Ставит обновление в очередь бота. Возвращает HTTP-статус ответа Telegram."""
+    if not _is_initialized or _application is None:
+        # Telegram повторит доставку, когда бот запустится
+        return "503 Service Unavailable"
+    if not isinstance(data, dict):
+        return "400 Bad Request"
+    try:
+        update = Update.de_json(data, _application.bot)
+    except (TypeError, KeyError, AttributeError, ValueError):
+        return "400 Bad Request"
+    # Обработчики выполняет цикл приложения; ответ Telegram не ждет нажатия кнопки
+    await _application.update_queue.put(update)
+    return "200 OK"
+
+
+async def process_webhook_update(data: dict, secret_token: Optional[str] = None) -> bool:
+    """
+    Передает боту обновление, полученное веб-хуком (для хост-приложений со
+    своим HTTP-сервером). secret_token - заголовок X-Telegram-Bot-Api-Secret-Token.
+    False - неверный секрет, некорректное обновление или бот не запущен.
+    """
+    if not _check_webhook_secret(secret_token):
+        return False
+    return await _dispatch_webhook_update(data) == "200 OK"
+
+
+async def _handle_webhook_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Минимальный HTTP/1.1 сервер веб-хука: POST <путь webhook_url> с JSON Update, keep-alive"""
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=WEBHOOK_IDLE_TIMEOUT)
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length') or 0)
+            if length > WEBHOOK_MAX_BODY:
+                await _write_http(writer, "413 Payload Too Large", close=True)
+                break
+            body = await asyncio.wait_for(reader.readexactly(length), timeout=5) if length else b""
+
+            parts = request_line.decode("latin-1").split()
+            path = urlsplit(_telegram_config().webhook_url or '/').path or '/'
+            if len(parts) < 2 or parts[1].split("?")[0] != path:
+                status = "404 Not Found"
+            elif parts[0] != "POST":
+                status = "405 Method Not Allowed"
+            elif not _check_webhook_secret(headers.get('x-telegram-bot-api-secret-token')):
+                status = "403 Forbidden"
+            else:
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    status = "400 Bad Request"
+                else:
+                    status = await _dispatch_webhook_update(data)
+            close = headers.get('connection', '').lower() == 'close'
+            await _write_http(writer, status, close)
+            if close:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _write_http(writer: asyncio.StreamWriter, status: str, close: bool):
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n"
+                 f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode())
+    await writer.drain()
 
 
 # --- ПУБЛИЧНЫЙ ИНТЕРФЕЙС (API) ДЛЯ ВНЕШНИХ ПРОГРАММ ---
 
-async def send_message_with_buttons(text: str, button_names: list, time_out: int = 60) -> str:
+async def send_prompt(text: str, button_names: list, time_out: float,
+                      on_timeout: Optional[Callable] = None, on_sent=None,
+                      priority: int = PRIORITY_CRITICAL) -> Prompt:
+    """
+    Отправляет сообщение с кнопками и сразу возвращает Prompt, не дожидаясь ответа:
+    вызывающий может продолжать следить за воротами и снять запрос через
+    prompt.dismiss(). Ошибки отправки передаются вызывающему.
+    """
+    return await PROMPTS.open(text, button_names, time_out, on_timeout=on_timeout, on_sent=on_sent,
+                              priority=priority)
+
+
+def send_notice(text: str, priority: int = PRIORITY_INFO) -> asyncio.Future:
+    """
+    Ставит сообщение без кнопок в исходящую очередь и сразу возвращает Future
+    с отправленным Message. Ждать его не обязательно: ошибки отправки пишутся в лог.
+    """
+    return OUTBOX.submit(text, priority)
+
+
+async def send_message_with_buttons(text: str, button_names: list, time_out: int = 60, on_sent=None,
+                                    priority: int = PRIORITY_NORMAL) -> str:
     """
     Публичная функция, которую вызывает Online_check_gate.py.
     Ее сигнатура и поведение полностью соответствуют ожиданиям внешней программы.
+    on_sent(message) вызывается сразу после того, как Telegram принял сообщение.
+    Без кнопок сообщение только отправляется (с приоритетом priority), результат сразу "-1".
     """
-    # 1. Убедимся, что наш бот запущен. Если нет - эта функция его запустит.
-    await _initialize_bot_if_needed()
-
-    # 2. Основная логика отправки и ожидания
     try:
-        future = asyncio.Future()
-        
-        keyboard = [
-            # Нумеруем callback_data с 1, как ожидает ваш код
-            [InlineKeyboardButton(name, callback_data=str(i + 1))] 
-            for i, name in enumerate(button_names)
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        if not button_names:
+            message = await OUTBOX.send(text, priority)
+            if on_sent is not None:
+                on_sent(message)
+            return PROMPT_TIMEOUT
 
-        # Используем уже существующий _application для отправки
-        message = await _application.bot.send_message(
-            chat_id=CHAT_ID,
-            text=text,
-            reply_markup=reply_markup
-        )
-        
-        # Сохраняем Future, чтобы _button_callback мог его найти
-        _application.bot_data['pending_futures'][message.message_id] = future
-        
-        logger.info(f"Сообщение (ID: {message.message_id}) отправлено. Ожидание ответа {time_out} сек...")
-        
-        # Ждем результата от _button_callback
-        result = await asyncio.wait_for(future, timeout=float(time_out))
-        return result
-
-    except asyncio.TimeoutError:
-        logger.warning(f"Время ожидания ответа на сообщение истекло. Возвращаем -1.")
-        # Удаляем просроченный Future из памяти
-        if 'message' in locals() and message.message_id in _application.bot_data['pending_futures']:
-            _application.bot_data['pending_futures'].pop(message.message_id)
-        return "-1"
+        # Запрос с кнопками через общий менеджер запросов
+        prompt = await PROMPTS.open(text, button_names, time_out, on_sent=on_sent)
     except Exception as e:
+        # Ошибка уже учтена в метриках и журнале очередью OUTBOX
         logger.error(f"Непредвиденная ошибка в send_message_with_buttons: {e}")
-        return "-2"
+        return PROMPT_ERROR
 
+    try:
+        return await prompt.wait()
+    except asyncio.CancelledError:
+        # Вызывающий больше не ждет - снимаем его запрос
+        prompt.cancel()
+        raise
 
-async def cleanup_bot():
-    """
-    Публичная функция для остановки бота. Вызывается Online_check_gate.py при выходе.
-    """
-    global _application, _is_initialized
+
+async def _shutdown_application():
+    """Останавливает текущий экземпляр бота (ожидающие Future-объекты сохраняются)"""
+    global _is_initialized
     if not _is_initialized or not _application:
         return
     
     logger.info("Получена команда на остановку постоянного экземпляра Telegram-бота...")
-    if _application.updater and _application.updater.running:
-        await _application.updater.stop()
-    if _application.running:
-        await _application.stop()
-    await _application.shutdown()
-    _is_initialized = False
+    try:
+        await _stop_webhook()
+        if _application.updater and _application.updater.running:
+            await _application.updater.stop()
+        if _application.running:
+            await _application.stop()
+        await _application.shutdown()
+    finally:
+        _is_initialized = False
     logger.info("Постоянный экземпляр Telegram-бота остановлен.")
 
 
+async def cleanup_bot():
+    """
+    Публичная функция для остановки бота. Вызывается Online_check_gate.py при выходе.
+    В режиме notifier ничего не делает - бот остается запущенным до stop_notifier().
+    Пока есть ожидающие запросы других вызывающих, остановка откладывается до
+    завершения последнего из них.
+    """
+    global _shutdown_when_idle
+    if _persistent:
+        _stats['avoided_cold_starts'] += 1
+        return
+    if PROMPTS.pending:
+        logger.info(f"Остановка Telegram-бота отложена: ожидающих запросов {PROMPTS.pending}")
+        _shutdown_when_idle = True
+        return
+    _shutdown_when_idle = False
+    await OUTBOX.close()
+    async with _init_lock:
+        await _shutdown_application()
+
+
+async def _shutdown_idle_bot():
+    """Отложенная остановка cleanup_bot() после завершения последнего запроса"""
+    global _shutdown_when_idle
+    # Очередь отправляется до блокировки: отправка сама может запускать бота под ней
+    await OUTBOX.close()
+    async with _init_lock:
+        if not _shutdown_when_idle or PROMPTS.pending or _persistent:
+            return
+        _shutdown_when_idle = False
+        await _shutdown_application()
+
+
+async def _is_healthy() -> bool:
+    if not _is_initialized or not _application:
+        return False
+    if not _receive_updates:
+        receiving = True
+    elif _telegram_config().webhook_url:
+        receiving = _webhook_server is not None and _webhook_server.is_serving()
+    else:
+        receiving = _application.updater is not None and _application.updater.running
+    if not (_application.running and receiving):
+        return False
+    try:
+        webhook_url = _telegram_config().webhook_url if _receive_updates else None
+        if not webhook_url:
+            await asyncio.wait_for(_application.bot.get_me(), timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        # Веб-хук мог быть снят другим процессом (например, запуском того же бота с опросом)
+        info = await asyncio.wait_for(_application.bot.get_webhook_info(), timeout=HEALTH_CHECK_TIMEOUT)
+        if info.url != webhook_url:
+            logger.warning(f"Веб-хук Telegram не зарегистрирован (сейчас: {info.url or 'нет'})")
+            return False
+        if info.last_error_message:
+            logger.warning(f"Telegram сообщает об ошибке доставки веб-хука: {info.last_error_message} "
+                           f"(ожидают доставки: {info.pending_update_count})")
+        return True
+    except Exception as e:
+        TELEGRAM_ERRORS.inc(operation='health')
+        logger.warning(f"Проверка Telegram-бота не пройдена: {e}")
+        return False
+
+
+async def _health_loop(interval: int):
+    """Периодически проверяет бота и перезапускает его после сбоя"""
+    delay = interval
+    while True:
+        try:
+            await asyncio.wait_for(_health_wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        _health_wakeup.clear()
+
+        if await _is_healthy():
+            delay = interval
+            continue
+
+        logger.warning("Перезапуск Telegram-бота после сбоя...")
+        try:
+            await _shutdown_application()
+        except Exception as e:
+            logger.warning(f"Ошибка при остановке неисправного бота: {e}")
+        try:
+            await _initialize_bot_if_needed()
+            _stats['restarts_after_failure'] += 1
+            delay = interval
+        except Exception as e:
+            # Сеть или Telegram недоступны - повторяем чаще, но с ограничением
+            logger.error(f"Не удалось перезапустить Telegram-бота: {e}")
+            delay = min(max(delay // 2, HEALTH_RETRY_MIN), interval)
+
+
+async def start_notifier(health_check_interval: int = 60, receive_updates: bool = True):
+    """
+    Включает режим постоянного бота: бот запускается один раз и живет
+    до stop_notifier(), с периодической проверкой и перезапуском после сбоя.
+    receive_updates=False - только отправка (без getUpdates и веб-хука) для
+    процессов, которые не ждут нажатий кнопок: обновления бота получает один процесс.
+    """
+    global _persistent, _receive_updates, _health_task, _health_wakeup
+    _persistent = True
+    _receive_updates = receive_updates
+    try:
+        await _initialize_bot_if_needed()
+    except Exception as e:
+        # Первая попытка не удалась - фоновая проверка повторит запуск
+        logger.error(f"Не удалось запустить Telegram-бота: {e}")
+    if _health_task is None or _health_task.done():
+        _health_wakeup = asyncio.Event()
+        if not _is_initialized:
+            _health_wakeup.set()
+        _health_task = asyncio.create_task(_health_loop(health_check_interval))
+
+
+async def stop_notifier():
+    """Выключает режим постоянного бота и останавливает его"""
+    global _persistent, _health_task, _health_wakeup
+    _persistent = False
+    if _health_task is not None:
+        _health_task.cancel()
+        try:
+            await _health_task
+        except asyncio.CancelledError:
+            pass
+        _health_task = None
+        _health_wakeup = None
+    await OUTBOX.close()
+    await _shutdown_application()
+    logger.info(f"Telegram bot stats: {get_bot_stats()}")
+
+
+def get_bot_stats() -> dict:
+    """Статистика холодных стартов бота и оценка сэкономленного режимом notifier времени"""
+    stats = dict(_stats)
+    average = stats['total_cold_start_sec'] / stats['cold_starts'] if stats['cold_starts'] else None
+    stats['avg_cold_start_sec'] = average
+    stats['saved_sec_estimate'] = average * stats['avoided_cold_starts'] if average is not None else None
+    return stats
+
+
 # --- AUTONOMOUS TEST MODULE ---
 
 async def main_test():
@@ -198,6 +1147,7 @@ async def main_test():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     print("Файл TelegramButtonsGen.py запущен в режиме автономного тестирования...")
     # asyncio.run() создает и управляет циклом событий для нашего теста
     asyncio.run(main_test())
\ No newline at end of file